@@ -45,6 +45,23 @@
 `include "types.svh"
 `endif
 
+/* The ICCM image and the reset vector are normally given at run time
+   (+ICCM_INIT_FILE=, +RESET_VECTOR=), and the DCCM image is read from
+   dmem.hex in the working directory, so one build serves every test; the
+   defines remain as build-time defaults */
+`ifndef ICCM_INIT_FILE
+`define ICCM_INIT_FILE ""
+`endif
+`ifndef DCCM_INIT_FILE
+`define DCCM_INIT_FILE "dmem.hex"
+`endif
+`ifndef RESET_VECTOR
+`define RESET_VECTOR 32'h00000000
+`endif
+`ifndef STACK_POINTER_INIT_VALUE
+`define STACK_POINTER_INIT_VALUE 32'h80000000
+`endif
+
 module core_top_tb;
 
   localparam string ICCM_INIT_FILE = `ICCM_INIT_FILE;
@@ -84,6 +101,7 @@ module core_top_tb;
 
   initial begin
     $timeformat(-9, 3, " ns", 10);
+    void'($value$plusargs("RESET_VECTOR=%h", reset_vector));
     fd = $fopen("rtl.log", "w");
     fd_console = $fopen("console.log", "w");
     rstn = 0;
@@ -125,6 +143,49 @@ module core_top_tb;
     else cycle_count_last_retired <= cycle_count_last_retired + 1;
   end
 
+`ifdef VERILATOR
+  /* Waveform window: cycles +WAVE_START= to +WAVE_STOP=, or +WAVE_CYCLES=
+     cycles from the first retirement of +WAVE_PC=. The C++ harness dumps
+     only while it is open. */
+  import "DPI-C" function void tb_waves(input bit on);
+
+  logic [    31:0] wave_start = 0;
+  logic [    31:0] wave_stop = '1;
+  logic [    31:0] wave_cycles = 1000;
+  logic [XLEN-1:0] wave_pc;
+  logic            wave_pc_armed = 0;
+  logic            waves_on = 0;
+  logic            wave_pc_retired;
+
+  initial begin
+    void'($value$plusargs("WAVE_START=%d", wave_start));
+    void'($value$plusargs("WAVE_STOP=%d", wave_stop));
+    void'($value$plusargs("WAVE_CYCLES=%d", wave_cycles));
+    if ($value$plusargs("WAVE_PC=%h", wave_pc)) begin
+      wave_pc_armed = 1;
+      wave_start = '1;
+    end
+  end
+
+  assign wave_pc_retired = ((dbg.reg_wr | dbg.reg_wr_jal) & dbg.wb_instr_tag == wave_pc) |
+                           (dbg.br_taken & dbg.br_taken_instr_tag == wave_pc) |
+                           (dbg.br_not_taken & dbg.br_not_taken_instr_tag == wave_pc) |
+                           (dbg.mem_store & dbg.mem_store_instr_tag == wave_pc) |
+                           (dbg.ecall & dbg.ecall_instr_tag == wave_pc);
+
+  always @(posedge clk) begin
+    if (wave_pc_armed & wave_pc_retired) begin
+      wave_pc_armed <= 0;
+      wave_start    <= cycle_count;
+      wave_stop     <= cycle_count + wave_cycles;
+    end
+    if ((cycle_count >= wave_start && cycle_count <= wave_stop) != waves_on) begin
+      waves_on <= ~waves_on;
+      tb_waves(~waves_on);
+    end
+  end
+`endif
+
   always_ff @(posedge clk) begin
     reset_last_retired <= 1'b0;
 
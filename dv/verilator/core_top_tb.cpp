@@ -22,26 +22,71 @@ DEALINGS IN THE SOFTWARE.
 
 */
 
+#include <cstdlib>
+#include <cstring>
+
 #include "Vcore_top_tb.h"
+#include "Vcore_top_tb__Dpi.h"
+
+// Waveforms need a model built with --trace (VCD) or --trace-fst; without
+// either, the simulation carries no tracing code at all
+#if VM_TRACE_FST
+#include "verilated_fst_c.h"
+typedef VerilatedFstC WaveFile;
+#elif VM_TRACE
 #include "verilated_vcd_c.h"
+typedef VerilatedVcdC WaveFile;
+#endif
+
+static bool waves_on = false;
+
+// Called by core_top_tb.sv as its waveform window opens and closes
+void tb_waves(svBit on) { waves_on = on; }
+
+// Value of +NAME=value, or nullptr when it is not given
+static const char *plusarg(const char *name) {
+    const char *match = Verilated::commandArgsPlusMatch(name);
+    return match[0] ? match + strlen(name) + 1 : nullptr;
+}
 
 int main(int argc, char **argv, char **env) {
+    // Forwards +ICCM_INIT_FILE= and +RESET_VECTOR= to the testbench
     Verilated::commandArgs(argc, argv);
+#if VM_TRACE
+    // +WAVE_FILE= enables dumping, +WAVE_DEPTH= limits the hierarchy levels
+    WaveFile* tfp = nullptr;
+    const char *wave_file = plusarg("WAVE_FILE=");
+    if (wave_file) {
+        Verilated::traceEverOn(true);
+    }
+#endif
     Vcore_top_tb* top = new Vcore_top_tb;
-    Verilated::traceEverOn(true);
-    VerilatedVcdC* tfp = new VerilatedVcdC;
-    top->trace(tfp, 99);
-    tfp->open("core_top.vcd");
+#if VM_TRACE
+    if (wave_file) {
+        const char *depth = plusarg("WAVE_DEPTH=");
+        tfp = new WaveFile;
+        top->trace(tfp, depth ? atoi(depth) : 99);
+        tfp->open(wave_file);
+    }
+#endif
 
     printf("****** START of CORE TOP SIM ****** \n");
 
     while (!Verilated::gotFinish()) {
         top->eval();
-        tfp->dump(Verilated::time());
+#if VM_TRACE
+        if (tfp && waves_on) {
+            tfp->dump(Verilated::time());
+        }
+#endif
         Verilated::timeInc(1);
     }
-    tfp->close();
+#if VM_TRACE
+    if (tfp) {
+        tfp->close();
+    }
+#endif
     printf("****** END of CORE TOP SIM ****** \n");
     delete top;
     return 0;
-}
\ No newline at end of file
+}
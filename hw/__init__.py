@@ -10,7 +10,7 @@ from .load import (
     load_hw_config,
     repo_root,
 )
-from .types import CpuKind, HwConfig
+from .types import CpuKind, HwConfig, TimingConfig, VerilatorConfig
 
 __all__ = [
     "CpuKind",
@@ -18,6 +18,8 @@ __all__ = [
     "HwConfig",
     "HwConfigError",
     "PRESETS_DIR",
+    "TimingConfig",
+    "VerilatorConfig",
     "default_hw_config_path",
     "list_presets",
     "load_hw_config",
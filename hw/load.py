@@ -17,7 +17,9 @@ from .types import (
     HwConfig,
     MemoryConfig,
     SoftwareHints,
+    TimingConfig,
     VectorUnitConfig,
+    VerilatorConfig,
 )
 
 _REPO_ROOT = Path(__file__).resolve().parents[1]
@@ -25,6 +27,7 @@ PRESETS_DIR = _REPO_ROOT / "hw" / "presets"
 DEFAULT_PRESET = PRESETS_DIR / "rv32im_scalar.yaml"
 
 _VALID_CPU_KINDS = {kind.value for kind in CpuKind}
+_VALID_X_ASSIGN = {"0", "1", "fast", "unique"}
 
 
 class HwConfigError(ValueError):
@@ -78,6 +81,54 @@ def _parse_exu_units(cpu_raw: dict, issue_width: int, ctx: str) -> tuple[ExuUnit
     return tuple(units)
 
 
+def _parse_timing(raw: dict, ctx: str) -> TimingConfig:
+    timing_raw = raw.get("timing", {})
+    if not isinstance(timing_raw, dict):
+        raise HwConfigError(f"timing must be a mapping in {ctx}")
+
+    defaults = TimingConfig()
+    values = {}
+    for field in TimingConfig.__dataclass_fields__:
+        value = int(timing_raw.get(field, getattr(defaults, field)))
+        if value < 0:
+            raise HwConfigError(f"timing.{field} must be >= 0 in {ctx}")
+        values[field] = value
+    unknown = set(timing_raw) - set(values)
+    if unknown:
+        raise HwConfigError(f"Unknown timing keys {sorted(unknown)} in {ctx}")
+    return TimingConfig(**values)
+
+
+def _parse_verilator(raw: dict, ctx: str) -> VerilatorConfig:
+    verilator_raw = raw.get("verilator", {})
+    if not isinstance(verilator_raw, dict):
+        raise HwConfigError(f"verilator must be a mapping in {ctx}")
+
+    unknown = set(verilator_raw) - set(VerilatorConfig.__dataclass_fields__)
+    if unknown:
+        raise HwConfigError(f"Unknown verilator keys {sorted(unknown)} in {ctx}")
+    defaults = VerilatorConfig()
+    config = VerilatorConfig(
+        threads=int(verilator_raw.get("threads", defaults.threads)),
+        opt_level=int(verilator_raw.get("opt_level", defaults.opt_level)),
+        x_assign=str(verilator_raw.get("x_assign", defaults.x_assign)),
+        output_split=int(verilator_raw.get("output_split", defaults.output_split)),
+        ccache=bool(verilator_raw.get("ccache", defaults.ccache)),
+    )
+    if config.threads < 1:
+        raise HwConfigError(f"verilator.threads must be >= 1 in {ctx}")
+    if not 0 <= config.opt_level <= 3:
+        raise HwConfigError(f"verilator.opt_level must be 0-3 in {ctx}")
+    if config.x_assign not in _VALID_X_ASSIGN:
+        raise HwConfigError(
+            f"Unsupported verilator.x_assign '{config.x_assign}' in {ctx}; "
+            f"expected one of {sorted(_VALID_X_ASSIGN)}"
+        )
+    if config.output_split < 0:
+        raise HwConfigError(f"verilator.output_split must be >= 0 in {ctx}")
+    return config
+
+
 def load_hw_config(path: Path | str | None = None) -> HwConfig:
     """Load a hardware config YAML file into a typed :class:`HwConfig`."""
     config_path = Path(path).resolve() if path else DEFAULT_PRESET.resolve()
@@ -132,4 +183,6 @@ def load_hw_config(path: Path | str | None = None) -> HwConfig:
                 _require(software_raw, "vectorize_min_numel", "software")
             ),
         ),
+        timing=_parse_timing(raw, config_path.name),
+        verilator=_parse_verilator(raw, config_path.name),
     )
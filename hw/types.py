@@ -40,6 +40,36 @@ class CpuConfig:
     exu: Tuple[ExuUnitMask, ...]
 
 
+@dataclass(frozen=True)
+class TimingConfig:
+    """Latencies and penalties (cycles) for the ISS timing model.
+
+    Defaults follow the shipping RTL: MUL_LAT in exu_mul, the 32-step divider
+    with its 1-cycle fast path, and the IFU/IDU flush on a redirect.
+    """
+
+    mul_latency: int = 5
+    div_latency: int = 33
+    div_fast_latency: int = 1
+    load_use_penalty: int = 1
+    branch_penalty: int = 2
+
+
+@dataclass(frozen=True)
+class VerilatorConfig:
+    """Verilator model build used by sim_manager.
+
+    threads > 1 builds a multithreaded model (--threads); output_split = 0
+    keeps each generated C++ file whole; ccache applies when it is on PATH.
+    """
+
+    threads: int = 1
+    opt_level: int = 3
+    x_assign: str = "fast"
+    output_split: int = 20000
+    ccache: bool = True
+
+
 @dataclass(frozen=True)
 class VectorUnitConfig:
     enabled: bool
@@ -77,6 +107,8 @@ class HwConfig:
     vector: VectorUnitConfig
     memory: MemoryConfig
     software: SoftwareHints
+    timing: TimingConfig = TimingConfig()
+    verilator: VerilatorConfig = VerilatorConfig()
 
     @property
     def has_vector_unit(self) -> bool:
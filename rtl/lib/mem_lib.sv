@@ -68,10 +68,18 @@ module iccm #(
 
   assign line_idx = raddr[$clog2(DEPTH*WIDTH/8)-1:$clog2(WIDTH/8)];
 
-  /* Initialize memory */
+  /* Initialize memory; in simulation +ICCM_INIT_FILE= overrides INIT_FILE */
+`ifndef SYNTHESIS
+  string init_file = INIT_FILE;
   initial begin
-    $readmemh(INIT_FILE, mem);
+    void'($value$plusargs("ICCM_INIT_FILE=%s", init_file));
+    if (init_file != "") $readmemh(init_file, mem);
   end
+`else
+  initial begin
+    if (INIT_FILE != "") $readmemh(INIT_FILE, mem);
+  end
+`endif
 
   assign line_data_din = rvalid_in ? {mem[line_idx+1], mem[line_idx]} : {2*WIDTH{1'b0}};
 
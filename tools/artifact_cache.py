@@ -0,0 +1,154 @@
+# Copyright (c) 2025 Siliscale Consulting, LLC
+# SPDX-License-Identifier: Apache-2.0
+
+"""
+Content-addressed cache of sim_manager stage outputs
+
+A stage (compile, ISS trace, memory images, RTL build, RTL run) derives a key
+by hashing everything its outputs depend on: file contents, command lines,
+tool versions, hw_config.json. The outputs are stored under
+<root>/<stage>/<key[:2]>/<key>/ and copied back into the test's work
+directory on a later hit, so the stage is skipped. Entries are written to a
+temporary directory and renamed into place, so concurrent tests never see
+a partial entry and the cache can be shared by several runs.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+
+KeyPart = Union[str, bytes, int, None]
+
+META_FILE = 'meta.json'
+
+
+class ArtifactCache:
+    """Stage outputs keyed by a hash of their inputs"""
+
+    def __init__(self, root: str, stages: Optional[Iterable[str]] = None):
+        """stages, when given, limits caching to those stages; others always miss
+        silently and are never stored."""
+        self.root = root
+        self.stages = None if stages is None else frozenset(stages)
+        self._lock = threading.Lock()
+        # (path, size, mtime_ns) -> SHA-256 of the contents
+        self._digests: Dict[Tuple[str, int, int], str] = {}
+        self._versions: Dict[str, str] = {}
+        self.hits: Dict[str, int] = {}
+        self.misses: Dict[str, int] = {}
+
+    def file_digest(self, path: str) -> str:
+        """SHA-256 of a file's contents ('' if it does not exist), memoized on size and mtime"""
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return ''
+        memo = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+        digest = self._digests.get(memo)
+        if digest is None:
+            h = hashlib.sha256()
+            with open(path, 'rb') as f:
+                for block in iter(lambda: f.read(1 << 20), b''):
+                    h.update(block)
+            digest = h.hexdigest()
+            with self._lock:
+                self._digests[memo] = digest
+        return digest
+
+    def tool_version(self, command: str) -> str:
+        """First line of `command --version` ('' if the tool is missing), run once per tool"""
+        version = self._versions.get(command)
+        if version is None:
+            try:
+                result = subprocess.run([command, '--version'], capture_output=True, text=True)
+                version = (result.stdout or result.stderr).splitlines()[0] if result.returncode == 0 else ''
+            except (OSError, IndexError):
+                version = ''
+            with self._lock:
+                self._versions[command] = version
+        return version
+
+    @staticmethod
+    def key(stage: str, *parts: KeyPart) -> str:
+        """Hash of a stage name and its input parts (strings, bytes, ints, digests)"""
+        h = hashlib.sha256(stage.encode())
+        for part in parts:
+            if part is None:
+                part = b''
+            elif isinstance(part, int):
+                part = str(part).encode()
+            elif isinstance(part, str):
+                part = part.encode()
+            # Length prefix, so ('ab', 'c') and ('a', 'bc') differ
+            h.update(len(part).to_bytes(8, 'little'))
+            h.update(part)
+        return h.hexdigest()
+
+    def _entry(self, stage: str, key: str) -> str:
+        return os.path.join(self.root, stage, key[:2], key)
+
+    def restore(self, stage: str, key: str, dest: str, outputs: Iterable[str]) -> Optional[Dict]:
+        """Copy a cached entry's outputs (files or directories, relative to dest)
+        into dest; outputs the cached run did not produce are removed from dest.
+        Returns the entry's metadata on a hit, None on a miss."""
+        if self.stages is not None and stage not in self.stages:
+            return None
+        entry = self._entry(stage, key)
+        meta_path = os.path.join(entry, META_FILE)
+        if not os.path.exists(meta_path):
+            with self._lock:
+                self.misses[stage] = self.misses.get(stage, 0) + 1
+            return None
+        with open(meta_path, 'r') as f:
+            meta = json.load(f)
+        for name in outputs:
+            source, target = os.path.join(entry, name), os.path.join(dest, name)
+            os.makedirs(os.path.dirname(target) or '.', exist_ok=True)
+            # A stale file or directory of the same name left by an earlier run goes first
+            if os.path.isdir(target) and not os.path.islink(target):
+                shutil.rmtree(target)
+            elif os.path.lexists(target):
+                os.remove(target)
+            if os.path.isdir(source):
+                shutil.copytree(source, target)
+            elif os.path.exists(source):
+                shutil.copy2(source, target)
+        with self._lock:
+            self.hits[stage] = self.hits.get(stage, 0) + 1
+        return meta
+
+    def save(self, stage: str, key: str, src: str, outputs: Iterable[str], meta: Optional[Dict] = None):
+        """Store the outputs (relative to src) of a stage that just ran; missing
+        outputs are skipped. meta is returned by later restore() hits."""
+        if self.stages is not None and stage not in self.stages:
+            return
+        entry = self._entry(stage, key)
+        if os.path.exists(os.path.join(entry, META_FILE)):
+            return
+        parent = os.path.dirname(entry)
+        os.makedirs(parent, exist_ok=True)
+        staging = tempfile.mkdtemp(prefix='.tmp-', dir=parent)
+        try:
+            for name in outputs:
+                source, target = os.path.join(src, name), os.path.join(staging, name)
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                if os.path.isdir(source):
+                    shutil.copytree(source, target)
+                elif os.path.exists(source):
+                    shutil.copy2(source, target)
+            with open(os.path.join(staging, META_FILE), 'w') as f:
+                json.dump(meta or {}, f, indent=2)
+            os.rename(staging, entry)
+        except OSError:
+            # Another test stored the same entry first, or the cache is not writable
+            shutil.rmtree(staging, ignore_errors=True)
+
+    def summary(self) -> List[Tuple[str, int, int]]:
+        """(stage, hits, misses) for every stage looked up so far"""
+        stages = sorted(set(self.hits) | set(self.misses))
+        return [(stage, self.hits.get(stage, 0), self.misses.get(stage, 0)) for stage in stages]
@@ -0,0 +1,558 @@
+#!/usr/bin/env python3
+
+# Copyright (c) 2025 Siliscale Consulting, LLC
+# SPDX-License-Identifier: Apache-2.0
+
+"""
+Batched lockstep RV32IM ISS for many independent programs
+
+BatchISS runs N harts, each with its own program and memory, one
+instruction per hart per step. Registers are an (N, 32) uint32 array and
+memory is a set of (N, 4096) uint8 pages allocated on first touch. Every step
+fetches and decodes the instruction of all running harts at once, groups the
+harts by opcode (and funct3/funct7 where it matters) and executes each group
+with vectorized NumPy operations, so the cost of a step is roughly constant
+in N. The architectural results match RISC_V_ISS exactly: per hart, the
+records (trace_format.TRACE_DTYPE) are those of the scalar trace, and
+state_digest() hashes the same final state for both engines.
+"""
+
+import argparse
+import hashlib
+import io
+import json
+import os
+import sys
+import time
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+from rv_iss import (
+    EFF_EBREAK, EFF_ECALL, EFF_JUMP, EFF_LOAD, EFF_NONE, EFF_NOT_TAKEN, EFF_REG, EFF_STORE,
+    EFF_TAKEN, TRACE_HEADER, BinaryTraceWriter, NullTraceWriter, RISC_V_ISS, read_elf,
+)
+from trace_format import TRACE_DTYPE, format_records, write_trace
+
+PAGE_BITS = 12
+PAGE_SIZE = 1 << PAGE_BITS
+PAGE_MASK = PAGE_SIZE - 1
+
+# Hart states
+RUNNING, FINISHED, LIMIT, FAULT = range(4)
+STATE_NAMES = ('running', 'finished', 'limit', 'fault')
+
+_U32 = np.uint32
+_MASK32 = np.int64(0xFFFFFFFF)
+_BYTE_OFFSETS = {size: np.arange(size) for size in (1, 2, 4)}
+_WORD_DTYPES = {1: np.uint8, 2: '<u2', 4: '<u4'}
+# Batch trace record: the TRACE_DTYPE fields tagged with the hart
+_RECORD_DTYPE = np.dtype([('hart', '<u4')] + [(name, TRACE_DTYPE.fields[name][0])
+                                              for name in ('pc', 'instr', 'kind', 'rd', 'value', 'addr')])
+
+
+def _sext(value: np.ndarray, bits: int) -> np.ndarray:
+    """Sign extend the low `bits` bits of int64 values to unsigned 32-bit"""
+    sign = np.int64(1 << (bits - 1))
+    value = value & np.int64((1 << bits) - 1)
+    return ((value ^ sign) - sign) & _MASK32
+
+
+def _signed(value: np.ndarray) -> np.ndarray:
+    """Unsigned 32-bit values (any int dtype) as signed int64"""
+    return value.astype(np.int64) - ((value.astype(np.int64) & 0x80000000) << 1)
+
+
+def state_digest(pc: int, instruction_count: int, regs: Sequence[int], image: Dict[int, bytes]) -> str:
+    """SHA-256 over the architectural state: PC, instruction count, registers and
+    the non-zero 4 KiB pages of memory"""
+    h = hashlib.sha256()
+    h.update(np.array([pc, instruction_count & 0xFFFFFFFF, instruction_count >> 32], dtype='<u4').tobytes())
+    h.update(np.asarray(regs, dtype='<u4').tobytes())
+    for base in sorted(image):
+        h.update(np.array([base], dtype='<u4').tobytes())
+        h.update(image[base])
+    return h.hexdigest()
+
+
+def scalar_digest(iss: RISC_V_ISS) -> str:
+    """state_digest() of a RISC_V_ISS, for comparison with BatchISS.digest()"""
+    return state_digest(iss.pc, iss.instruction_count, iss.regs.regs, iss.mem.image())
+
+
+class BatchISS:
+    """Lockstep interpreter for N independent programs (see the module docstring)"""
+
+    TERMINATION_ADDR = RISC_V_ISS.TERMINATION_ADDR
+
+    def __init__(self, programs: Sequence[Union[str, bytes]], entries: Sequence[int],
+                 stack_base: int = 0x7FFFF000, stack_size: int = 0x1000,
+                 hex_files: Optional[Sequence[Optional[str]]] = None, trace: bool = False):
+        n = len(programs)
+        if len(entries) != n:
+            raise ValueError("one entry point per program is required")
+        self.n = n
+        self.regs = np.zeros((n, 32), dtype=_U32)
+        self.regs[:, 2] = stack_base + stack_size
+        self.pc = np.array(entries, dtype=np.int64)
+        self.state = np.full(n, RUNNING, dtype=np.int8)
+        self.instruction_count = np.zeros(n, dtype=np.int64)
+        self.faults: Dict[int, str] = {}
+        self.pages: Dict[int, np.ndarray] = {}
+        self.text_start = np.zeros(n, dtype=np.int64)
+        self.text_end = np.zeros(n, dtype=np.int64)
+        self.trace = trace
+        self._records: List[np.ndarray] = []
+
+        # Parse each distinct ELF image once (random campaigns repeat programs)
+        images = {}
+        for hart, program in enumerate(programs):
+            if isinstance(program, str):
+                with open(program, 'rb') as f:
+                    program = f.read()
+            key = bytes(program)
+            image = images.get(key)
+            if image is None:
+                image = images[key] = read_elf(key)
+            if hex_files and hex_files[hart]:
+                self._load_hex(hart, hex_files[hart])
+            for addr, data in image.sections:
+                self._load_data(hart, addr, data)
+            self.text_start[hart] = image.text_start
+            self.text_end[hart] = image.text_end
+
+    # Memory ---------------------------------------------------------------
+
+    def _page(self, num: int) -> np.ndarray:
+        page = self.pages.get(num)
+        if page is None:
+            page = self.pages[num] = np.zeros((self.n, PAGE_SIZE), dtype=np.uint8)
+        return page
+
+    def _load_data(self, hart: int, addr: int, data: bytes):
+        buffer = np.frombuffer(data, dtype=np.uint8)
+        pos = 0
+        while pos < len(buffer):
+            offset = (addr + pos) & PAGE_MASK
+            chunk = min(PAGE_SIZE - offset, len(buffer) - pos)
+            self._page((addr + pos) >> PAGE_BITS)[hart, offset:offset + chunk] = buffer[pos:pos + chunk]
+            pos += chunk
+
+    def _load_hex(self, hart: int, hex_file: str):
+        """Same layout as RISC_V_ISS.load_hex_file: one 32-bit word per line from address 0"""
+        with open(hex_file, 'r') as f:
+            words = [int(line, 16) & 0xFFFFFFFF for line in f if line.strip()]
+        self._load_data(hart, 0, np.array(words, dtype='<u4').tobytes())
+
+    def _read(self, harts: np.ndarray, addr: np.ndarray, size: int) -> np.ndarray:
+        """Little-endian read of size bytes per hart, as int64"""
+        value = np.zeros(len(harts), dtype=np.int64)
+        nums = addr >> PAGE_BITS
+        offsets = addr & PAGE_MASK
+        straddle = offsets > PAGE_SIZE - size
+        for num in np.unique(nums).tolist():
+            page = self.pages.get(num)
+            if page is None:
+                continue
+            sel = np.flatnonzero((nums == num) & ~straddle)
+            data = page[harts[sel, None], offsets[sel, None] + _BYTE_OFFSETS[size]]
+            value[sel] = data.view(_WORD_DTYPES[size])[:, 0]
+        for i in np.flatnonzero(straddle).tolist():
+            # Access crossing a page boundary, byte by byte
+            for byte in range(size):
+                byte_addr = (int(addr[i]) + byte) & 0xFFFFFFFF
+                page = self.pages.get(byte_addr >> PAGE_BITS)
+                if page is not None:
+                    value[i] |= int(page[harts[i], byte_addr & PAGE_MASK]) << (8 * byte)
+        return value
+
+    def _write(self, harts: np.ndarray, addr: np.ndarray, value: np.ndarray, size: int):
+        """Little-endian write of the low size bytes of value per hart"""
+        nums = addr >> PAGE_BITS
+        offsets = addr & PAGE_MASK
+        straddle = offsets > PAGE_SIZE - size
+        data = value.astype('<u4').view(np.uint8).reshape(-1, 4)[:, :size]
+        for num in np.unique(nums).tolist():
+            sel = np.flatnonzero((nums == num) & ~straddle)
+            if len(sel):
+                self._page(num)[harts[sel, None], offsets[sel, None] + _BYTE_OFFSETS[size]] = data[sel]
+        for i in np.flatnonzero(straddle).tolist():
+            for byte in range(size):
+                byte_addr = (int(addr[i]) + byte) & 0xFFFFFFFF
+                self._page(byte_addr >> PAGE_BITS)[harts[i], byte_addr & PAGE_MASK] = data[i, byte]
+
+    def image(self, hart: int) -> Dict[int, bytes]:
+        """Non-zero contents of one hart's memory as {base address: page}"""
+        return {num << PAGE_BITS: page[hart].tobytes() for num, page in self.pages.items()
+                if page[hart].any()}
+
+    def digest(self, hart: int) -> str:
+        return state_digest(int(self.pc[hart]), int(self.instruction_count[hart]),
+                            self.regs[hart].tolist(), self.image(hart))
+
+    # Execution ------------------------------------------------------------
+
+    def run(self, max_instructions: Optional[int] = None) -> int:
+        """Step until every hart has finished, faulted or executed max_instructions.
+        Returns the number of steps."""
+        steps = 0
+        while self.step(max_instructions):
+            steps += 1
+        return steps
+
+    def step(self, max_instructions: Optional[int] = None) -> bool:
+        """Execute one instruction on every running hart; False once none is left"""
+        if max_instructions is not None:
+            self.state[(self.state == RUNNING) & (self.instruction_count >= max_instructions)] = LIMIT
+        harts = np.flatnonzero(self.state == RUNNING)
+        if not len(harts):
+            return False
+        pc = self.pc[harts]
+
+        # Leaving .text, or fetching all-zero/all-one words, ends the program (not counted)
+        ended = (pc < self.text_start[harts]) | (pc >= self.text_end[harts])
+        misaligned = ~ended & (pc & 3 != 0)
+        for hart in harts[misaligned].tolist():
+            self.faults[hart] = f"Misaligned PC: 0x{int(self.pc[hart]):08X}"
+        self.state[harts[misaligned]] = FAULT
+        ok = ~(ended | misaligned)
+        inst = np.zeros(len(harts), dtype=np.int64)
+        inst[ok] = self._read(harts[ok], pc[ok], 4)
+        ended |= ok & ((inst == 0) | (inst == 0xFFFFFFFF))
+        self.state[harts[ended]] = FINISHED
+        keep = ok & ~ended
+        harts, pc, inst = harts[keep], pc[keep], inst[keep]
+        if not len(harts):
+            return bool((self.state == RUNNING).any())
+
+        n = len(harts)
+        opcode = inst & 0x7F
+        rd = (inst >> 7) & 0x1F
+        funct3 = (inst >> 12) & 0x7
+        rs1 = (inst >> 15) & 0x1F
+        rs2 = (inst >> 20) & 0x1F
+        funct7 = (inst >> 25) & 0x7F
+        a = self.regs[harts, rs1].astype(np.int64)
+        b = self.regs[harts, rs2].astype(np.int64)
+        imm_i = _sext(inst >> 20, 12)
+
+        next_pc = (pc + 4) & _MASK32
+        kind = np.full(n, EFF_NONE, dtype=np.int64)
+        out_rd = np.zeros(n, dtype=np.int64)
+        value = np.zeros(n, dtype=np.int64)
+        addr = np.zeros(n, dtype=np.int64)
+        write = np.zeros(n, dtype=bool)     # rd receives written[...]
+        written = np.zeros(n, dtype=np.int64)
+        halted = np.zeros(n, dtype=bool)
+
+        for op in np.unique(opcode).tolist():
+            sel = np.flatnonzero(opcode == op)
+            if op == 0x37 or op == 0x17:            # LUI / AUIPC
+                result = inst[sel] & 0xFFFFF000
+                if op == 0x17:
+                    result = (pc[sel] + result) & _MASK32
+                kind[sel] = EFF_REG
+                out_rd[sel] = rd[sel]
+                # LUI reports the register (x0 stays 0), AUIPC the result
+                value[sel] = np.where(rd[sel] != 0, result, 0) if op == 0x37 else result
+                write[sel] = True
+                written[sel] = result
+            elif op == 0x6F or op == 0x67:          # JAL / JALR
+                if op == 0x6F:
+                    i = inst[sel]
+                    offset = (((i >> 31) & 1) << 20) | (((i >> 21) & 0x3FF) << 1) \
+                        | (((i >> 20) & 1) << 11) | (((i >> 12) & 0xFF) << 12)
+                    target = (pc[sel] + _sext(offset, 21)) & _MASK32
+                else:
+                    target = (a[sel] + imm_i[sel]) & 0xFFFFFFFE
+                link = pc[sel] + 4
+                next_pc[sel] = target
+                kind[sel] = EFF_JUMP
+                out_rd[sel] = rd[sel]
+                value[sel] = link & _MASK32
+                addr[sel] = target
+                write[sel] = True
+                written[sel] = link & _MASK32
+            elif op == 0x63:                        # Branch
+                i = inst[sel]
+                offset = (((i >> 31) & 1) << 12) | (((i >> 7) & 1) << 11) \
+                    | (((i >> 25) & 0x3F) << 5) | (((i >> 8) & 0xF) << 1)
+                x, y, f3 = a[sel], b[sel], funct3[sel]
+                sx, sy = _signed(x), _signed(y)
+                taken = np.select(
+                    [f3 == 0, f3 == 1, f3 == 4, f3 == 5, f3 == 6, f3 == 7],
+                    [x == y, x != y, sx < sy, sx >= sy, x < y, x >= y], False)
+                target = (pc[sel] + _sext(offset, 13)) & _MASK32
+                next_pc[sel] = np.where(taken, target, next_pc[sel])
+                kind[sel] = np.where(taken, EFF_TAKEN, EFF_NOT_TAKEN)
+                addr[sel] = np.where(taken, target, 0)
+            elif op == 0x03:                        # Load
+                address = (a[sel] + imm_i[sel]) & _MASK32
+                f3 = funct3[sel]
+                result = np.zeros(len(sel), dtype=np.int64)
+                for width, code, sign in ((1, 0, 8), (2, 1, 16), (4, 2, 0), (1, 4, 0), (2, 5, 0)):
+                    part = f3 == code
+                    if part.any():
+                        loaded = self._read(harts[sel[part]], address[part], width)
+                        result[part] = _sext(loaded, sign) if sign else loaded
+                kind[sel] = EFF_LOAD
+                out_rd[sel] = rd[sel]
+                value[sel] = np.where(rd[sel] != 0, result, 0)
+                addr[sel] = address
+                write[sel] = True
+                written[sel] = result
+            elif op == 0x23:                        # Store
+                i = inst[sel]
+                offset = (((i >> 25) & 0x7F) << 5) | ((i >> 7) & 0x1F)
+                address = (a[sel] + _sext(offset, 12)) & _MASK32
+                f3 = funct3[sel]
+                for width, code in ((1, 0), (2, 1), (4, 2)):
+                    part = f3 == code
+                    if part.any():
+                        data = b[sel[part]] & ((1 << (8 * width)) - 1)
+                        self._write(harts[sel[part]], address[part], data, width)
+                        kind[sel[part]] = EFF_STORE
+                        value[sel[part]] = data
+                        addr[sel[part]] = address[part]
+                halted[sel] = address == self.TERMINATION_ADDR
+            elif op == 0x13 or op == 0x33:          # OP-IMM / OP
+                x = a[sel]
+                y = imm_i[sel] if op == 0x13 else b[sel]
+                result = _alu(op, funct3[sel], funct7[sel], x, y)
+                kind[sel] = EFF_REG
+                out_rd[sel] = rd[sel]
+                value[sel] = np.where(rd[sel] != 0, result, 0)
+                write[sel] = True
+                written[sel] = result
+            elif op == 0x73:                        # SYSTEM
+                system = funct3[sel] == 0
+                code = inst[sel] >> 20
+                kind[sel] = np.select([system & (code == 0), system & (code == 1)],
+                                      [EFF_ECALL, EFF_EBREAK], EFF_NONE)
+            # FENCE and unknown opcodes only advance the PC
+
+        # Register writes, after every group has read its operands (x0 stays zero)
+        rows = write & (rd != 0)
+        if rows.any():
+            self.regs[harts[rows], rd[rows]] = written[rows].astype(_U32)
+
+        self.pc[harts] = next_pc
+        self.instruction_count[harts] += 1
+        self.state[harts[halted]] = FINISHED
+
+        if self.trace:
+            traced = inst != 0x00000013
+            records = np.zeros(int(traced.sum()), dtype=_RECORD_DTYPE)
+            records['hart'] = harts[traced]
+            records['pc'] = pc[traced]
+            records['instr'] = inst[traced]
+            records['kind'] = kind[traced]
+            records['rd'] = out_rd[traced]
+            records['value'] = value[traced] & _MASK32
+            records['addr'] = addr[traced]
+            self._records.append(records)
+        return True
+
+    # Results --------------------------------------------------------------
+
+    def records(self) -> List[np.ndarray]:
+        """Per hart, the traced instructions as TRACE_DTYPE records (trace=True)"""
+        if not self._records:
+            return [np.zeros(0, dtype=TRACE_DTYPE) for _ in range(self.n)]
+        merged = np.concatenate(self._records)
+        self._records = [merged]
+        order = np.argsort(merged['hart'], kind='stable')
+        merged = merged[order]
+        bounds = np.searchsorted(merged['hart'], np.arange(self.n + 1))
+        result = []
+        for hart in range(self.n):
+            part = merged[bounds[hart]:bounds[hart + 1]]
+            records = np.zeros(len(part), dtype=TRACE_DTYPE)
+            for field in ('pc', 'instr', 'kind', 'rd', 'value', 'addr'):
+                records[field] = part[field]
+            result.append(records)
+        return result
+
+    def write_traces(self, paths: Sequence[str], trace_format: str = 'binary'):
+        """Write every hart's trace in the binary or text layout of rv_iss.py"""
+        for path, records in zip(paths, self.records()):
+            if trace_format == 'binary':
+                write_trace(path, records)
+            else:
+                with open(path, 'w') as f:
+                    f.write('\n'.join(format_records(records)))
+
+
+def _alu(op: int, funct3: np.ndarray, funct7: np.ndarray, x: np.ndarray, y: np.ndarray) -> np.ndarray:
+    """Vectorized OP / OP-IMM results (unsigned 32-bit values in int64), as _ALU_OPS in rv_iss"""
+    result = np.zeros(len(x), dtype=np.int64)
+    shamt = y & 0x1F
+    sx, sy = _signed(x), _signed(y)
+    if op == 0x13:
+        # funct7 only selects SRLI/SRAI; other encodings of funct3 5 write zero
+        key = np.where(funct3 == 5, 5 + 8 * funct7, funct3)
+        groups = {0: 'add', 1: 'sll', 2: 'slt', 3: 'sltu', 4: 'xor', 5: 'srl', 5 + 8 * 0x20: 'sra',
+                  6: 'or', 7: 'and'}
+    else:
+        key = funct3 + 8 * funct7
+        groups = {0: 'add', 8 * 0x20: 'sub', 1: 'sll', 2: 'slt', 3: 'sltu', 4: 'xor', 5: 'srl',
+                  5 + 8 * 0x20: 'sra', 6: 'or', 7: 'and'}
+        groups.update({f3 + 8: name for f3, name in enumerate(
+            ('mul', 'mulh', 'mulhsu', 'mulhu', 'div', 'divu', 'rem', 'remu'))})
+    for value in np.unique(key).tolist():
+        name = groups.get(value)
+        if name is None:
+            continue  # unsupported encodings write zero
+        m = key == value
+        a, b, sa, sb = x[m], y[m], sx[m], sy[m]
+        if name == 'add':
+            r = a + b
+        elif name == 'sub':
+            r = a - b
+        elif name == 'sll':
+            r = a << shamt[m]
+        elif name == 'slt':
+            r = (sa < sb).astype(np.int64)
+        elif name == 'sltu':
+            r = (a < b).astype(np.int64)
+        elif name == 'xor':
+            r = a ^ b
+        elif name == 'srl':
+            r = a >> shamt[m]
+        elif name == 'sra':
+            r = sa >> shamt[m]
+        elif name == 'or':
+            r = a | b
+        elif name == 'and':
+            r = a & b
+        elif name == 'mul':
+            r = (a.astype(np.uint64) * b.astype(np.uint64)).astype(np.int64)
+        elif name == 'mulh':
+            r = (sa * sb) >> 32
+        elif name == 'mulhsu':
+            r = (sa * b) >> 32
+        elif name == 'mulhu':
+            r = ((a.astype(np.uint64) * b.astype(np.uint64)) >> np.uint64(32)).astype(np.int64)
+        elif name in ('div', 'rem'):
+            zero = sb == 0
+            overflow = (sa == -0x80000000) & (sb == -1)
+            divisor = np.where(zero | overflow, 1, sb)
+            quotient = np.abs(sa) // np.abs(divisor)
+            negative = (sa < 0) != (divisor < 0)
+            if name == 'div':
+                r = np.where(negative, -quotient, quotient)
+                r = np.where(zero, 0xFFFFFFFF, np.where(overflow, 0x80000000, r))
+            else:
+                remainder = np.abs(sa) % np.abs(divisor)
+                r = np.where(sa < 0, -remainder, remainder)
+                r = np.where(zero, a, np.where(overflow, 0, r))
+        elif name == 'divu':
+            r = np.where(b == 0, 0xFFFFFFFF, a // np.where(b == 0, 1, b))
+        else:  # remu
+            r = np.where(b == 0, a, a % np.where(b == 0, 1, b))
+        result[m] = r & _MASK32
+    return result
+
+
+def scalar_run(program: Union[str, bytes], entry: int, hex_file: Optional[str] = None,
+               max_instructions: Optional[int] = None, trace: bool = False,
+               stack_base: int = 0x7FFFF000, stack_size: int = 0x1000) -> Tuple[RISC_V_ISS, np.ndarray]:
+    """Reference run of one program on RISC_V_ISS: (the ISS after the run, its trace records)"""
+    iss = RISC_V_ISS(entry, stack_base, stack_size)
+    stream = io.BytesIO()
+    sink = BinaryTraceWriter(stream) if trace else NullTraceWriter()
+    iss.run(program, sink, hex_file, max_instructions, translate=not trace)
+    records = np.frombuffer(stream.getvalue()[TRACE_HEADER.size:], dtype=TRACE_DTYPE)
+    return iss, records
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Run many RV32IM programs in lockstep on the batched NumPy ISS',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog='''
+Examples:
+  %(prog)s work/rand/*.elf --max-instructions 100000
+  %(prog)s work/rand/*.elf --trace-dir traces --trace-format text --verify
+        '''
+    )
+    parser.add_argument('programs', nargs='+', metavar='ELF_FILE')
+    parser.add_argument('--entry', type=lambda x: int(x, 16), default=None,
+                        help='Entry PC for every program (hex; default: each _start symbol)')
+    parser.add_argument('--max-instructions', type=int, default=None, metavar='N',
+                        help='Stop each program after N instructions (default: no limit)')
+    parser.add_argument('--trace-dir', default=None, metavar='DIR',
+                        help='Write one trace per program to DIR/<elf name>.log or .bin')
+    parser.add_argument('--trace-format', default='binary', choices=('binary', 'text'),
+                        help='Trace encoding for --trace-dir (default: binary)')
+    parser.add_argument('--verify', action='store_true',
+                        help='Also run every program on the scalar ISS and compare the final '
+                             'state digests (and traces with --trace-dir)')
+    parser.add_argument('--json', default=None, metavar='FILE',
+                        help='Write per-program state, instruction count and digest as JSON')
+    args = parser.parse_args()
+
+    try:
+        entries = []
+        for program in args.programs:
+            if args.entry is not None:
+                entries.append(args.entry)
+                continue
+            symbols = read_elf(program).symbols
+            if '_start' not in symbols:
+                raise ValueError(f"{program}: no _start symbol; pass --entry")
+            entries.append(symbols['_start'])
+
+        start = time.perf_counter()
+        batch = BatchISS(args.programs, entries, trace=args.trace_dir is not None)
+        steps = batch.run(args.max_instructions)
+        elapsed = time.perf_counter() - start
+        records = batch.records() if args.trace_dir else None
+        if args.trace_dir:
+            os.makedirs(args.trace_dir, exist_ok=True)
+            suffix = '.bin' if args.trace_format == 'binary' else '.log'
+            paths = [os.path.join(args.trace_dir, os.path.basename(program) + suffix)
+                     for program in args.programs]
+            batch.write_traces(paths, args.trace_format)
+    except (OSError, ValueError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
+
+    results = []
+    mismatches = 0
+    for hart, program in enumerate(args.programs):
+        result = {
+            'program': program,
+            'state': STATE_NAMES[batch.state[hart]],
+            'instructions': int(batch.instruction_count[hart]),
+            'digest': batch.digest(hart),
+        }
+        if hart in batch.faults:
+            result['fault'] = batch.faults[hart]
+        if args.verify:
+            iss, reference = scalar_run(program, entries[hart], None, args.max_instructions,
+                                        trace=records is not None)
+            match = scalar_digest(iss) == result['digest']
+            if records is not None:
+                match = match and np.array_equal(reference, records[hart])
+            result['verified'] = match
+            mismatches += not match
+        results.append(result)
+        print(f"{result['state']:<8} {result['instructions']:>10}  {result['digest'][:16]}  "
+              f"{'' if 'verified' not in result else ('ok  ' if result['verified'] else 'MISMATCH  ')}"
+              f"{program}")
+
+    total = int(batch.instruction_count.sum())
+    print(f"\n{len(args.programs)} programs, {total} instructions in {steps} steps, "
+          f"{elapsed:.2f}s ({total / elapsed if elapsed else 0:,.0f} instructions/s)")
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+            f.write('\n')
+    if mismatches:
+        print(f"{mismatches} program(s) differ from the scalar ISS", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
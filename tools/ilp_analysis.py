@@ -0,0 +1,306 @@
+#!/usr/bin/env python3
+
+# Copyright (c) 2025 Siliscale Consulting, LLC
+# SPDX-License-Identifier: Apache-2.0
+
+"""
+Dependency and ILP limit study over ISS traces
+
+Streams an ISS trace (text, raw or binary) once and reports, overall and per
+.symtab function:
+
+  critical path  longest register/memory dataflow chain with unit latency;
+                 instructions / critical path is the ideal ILP of a machine
+                 with unlimited width and perfect control prediction. Per
+                 function, the chains are measured within each contiguous run
+                 of its instructions (a call or return starts a new run)
+  dual issue     how many adjacent instruction pairs could issue together
+                 under each preset's cpu.exu masks (greedy, in order), and
+                 what blocked the rest: a RAW or WAW hazard between the pair,
+                 a control transfer or system instruction, or the unit split
+                 (always, on a single-issue preset)
+
+The "any" column is an unconstrained 2-wide machine with every unit in both
+slots, i.e. the headroom a different EXU split could unlock. Memory use is
+bounded by the code and data footprint, not by the trace length.
+"""
+
+import argparse
+import bisect
+import json
+import sys
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+_REPO_ROOT = Path(__file__).resolve().parents[1]
+if str(_REPO_ROOT) not in sys.path:
+    sys.path.insert(0, str(_REPO_ROOT))
+
+from hw import HwConfig, list_presets, load_hw_config
+from iss_timing import functional_unit, print_table, slot_units, source_registers
+from rv_iss import (
+    CLS_JUMP, CLS_LOAD, CLS_STORE, CLS_SYSTEM, EFF_JUMP, EFF_LOAD, EFF_REG, EFF_TAKEN,
+    decode_fields, instruction_class, load_functions,
+)
+from trace_format import iter_records
+
+UNKNOWN = '[unknown]'
+UNCONSTRAINED = 'any'
+
+# Reasons an adjacent pair could not issue together
+BLOCKERS = ('raw', 'waw', 'control', 'units')
+
+
+class _Fields(NamedTuple):
+    """Decoded fields needed by instruction_class() and source_registers()"""
+    opcode: int
+    rd: int
+    rs1: int
+    rs2: int
+    funct3: int
+    funct7: int
+
+
+class _Preset(NamedTuple):
+    name: str
+    pairs: frozenset  # (older unit, younger unit) combinations that fit two distinct slots
+
+
+def _preset(name: str, slots: Sequence[Tuple[bool, ...]]) -> _Preset:
+    fits = set()
+    if len(slots) >= 2:
+        for i, older in enumerate(slots):
+            for j, younger in enumerate(slots):
+                if i != j:
+                    fits.update((a, b) for a in range(4) for b in range(4) if older[a] and younger[b])
+    return _Preset(name, frozenset(fits))
+
+
+class IlpAnalyzer:
+    """Streaming critical-path and pairwise issue analysis of a trace"""
+
+    def __init__(self, addresses: List[int], names: List[str], hw_configs: Sequence[HwConfig]):
+        self.addresses = addresses
+        self.names = names + [UNKNOWN]
+        self.presets = [_preset(hw.name, slot_units(hw)) for hw in hw_configs]
+        self.presets.append(_preset(UNCONSTRAINED, [(True,) * 4] * 2))
+
+        nfunc, npreset = len(self.names), len(self.presets)
+        self.instructions = [0] * nfunc
+        self.path = [0] * nfunc                          # sum of run critical paths per function
+        self.pairs = [[0] * nfunc for _ in range(npreset)]
+        self.blocked = [dict.fromkeys(BLOCKERS, 0) for _ in range(npreset)]
+
+        self.depth = [0] * 32                            # dataflow depth of each register
+        # word -> (depth, run, depth within the run) of the last store
+        self.mem_depth: Dict[int, Tuple[int, int, int]] = {}
+        self.critical_path = 0
+        # Current run of one function: its index, number, critical path, and
+        # per register the run that wrote it and the depth within that run
+        self.run_function = -1
+        self.run = 0
+        self.run_path = 0
+        self.run_of = [0] * 32
+        self.run_depth = [0] * 32
+        # Whether the previous instruction is still unpaired, per preset
+        self.pending = [False] * npreset
+        self.prev: Optional[Tuple] = None
+        # instruction word -> (class, unit, rd, rs1 or 0, rs2 or 0)
+        self.decoded: Dict[int, Tuple[int, int, int, int, int]] = {}
+        # pc -> function index
+        self.functions: Dict[int, int] = {}
+
+    def _decode(self, instr: int) -> Tuple[int, int, int, int, int]:
+        f = decode_fields(instr)
+        fields = _Fields(f['opcode'], f['rd'], f['rs1'], f['rs2'], f['funct3'], f['funct7'])
+        cls = instruction_class(fields)
+        reads_rs1, reads_rs2 = source_registers(fields)
+        info = (cls, functional_unit(cls), fields.rd,
+                fields.rs1 if reads_rs1 else 0, fields.rs2 if reads_rs2 else 0)
+        self.decoded[instr] = info
+        return info
+
+    def _function(self, pc: int) -> int:
+        index = bisect.bisect_right(self.addresses, pc) - 1
+        index = index if index >= 0 else len(self.names) - 1
+        self.functions[pc] = index
+        return index
+
+    def feed(self, pc: int, instr: int, kind: int, rd: int, addr: int):
+        """Account one traced instruction"""
+        info = self.decoded.get(instr)
+        if info is None:
+            info = self._decode(instr)
+        cls, unit, _, rs1, rs2 = info
+        function = self.functions.get(pc)
+        if function is None:
+            function = self._function(pc)
+        self.instructions[function] += 1
+
+        if function != self.run_function:
+            self._end_run()
+            self.run_function = function
+        run = self.run
+
+        # Dataflow depth, globally and within the run (x0 never carries a dependency)
+        depth, run_of, run_depth = self.depth, self.run_of, self.run_depth
+        ready = depth[rs1] if depth[rs2] < depth[rs1] else depth[rs2]
+        local = max(run_depth[rs1] if run_of[rs1] == run else 0,
+                    run_depth[rs2] if run_of[rs2] == run else 0)
+        word = addr >> 2
+        if cls == CLS_LOAD:
+            stored = self.mem_depth.get(word)
+            if stored is not None:
+                ready = max(ready, stored[0])
+                if stored[1] == run:
+                    local = max(local, stored[2])
+        ready += 1
+        local += 1
+        written = rd if rd and kind in (EFF_REG, EFF_LOAD, EFF_JUMP) else 0
+        if written:
+            depth[written] = ready
+            run_of[written] = run
+            run_depth[written] = local
+        elif cls == CLS_STORE:
+            self.mem_depth[word] = (ready, run, local)
+        if ready > self.critical_path:
+            self.critical_path = ready
+        if local > self.run_path:
+            self.run_path = local
+
+        # Pairing with the previous instruction
+        prev = self.prev
+        if prev is not None:
+            prev_unit, prev_written, prev_store, prev_control = prev
+            if prev_control or cls == CLS_SYSTEM:
+                reason = 'control'
+            elif prev_written and (rs1 == prev_written or rs2 == prev_written):
+                reason = 'raw'
+            elif prev_store is not None and cls == CLS_LOAD and prev_store == word:
+                reason = 'raw'
+            elif prev_written and written == prev_written:
+                reason = 'waw'
+            else:
+                reason = None
+            for p, preset in enumerate(self.presets):
+                if not self.pending[p]:
+                    self.pending[p] = True
+                elif reason is None and (prev_unit, unit) in preset.pairs:
+                    self.pairs[p][function] += 1
+                    self.pending[p] = False
+                else:
+                    # A single-issue preset pairs nothing: every block is the unit split
+                    self.blocked[p][reason if reason and preset.pairs else 'units'] += 1
+        else:
+            self.pending = [True] * len(self.presets)
+        control = kind == EFF_TAKEN or cls in (CLS_JUMP, CLS_SYSTEM)
+        self.prev = (unit, written, word if cls == CLS_STORE else None, control)
+
+    def _end_run(self):
+        if self.run_function >= 0:
+            self.path[self.run_function] += self.run_path
+        self.run += 1
+        self.run_path = 0
+
+    def report(self) -> Dict:
+        """Summary and per-function results, hottest functions first"""
+        self._end_run()
+        self.run_function = -1
+        total = sum(self.instructions)
+
+        def dual(pairs: int, instructions: int) -> Dict:
+            return {
+                'pairs': pairs,
+                'dual_issue_rate': 2 * pairs / instructions if instructions else 0.0,
+                'ipc_bound': instructions / (instructions - pairs) if instructions else 0.0,
+            }
+
+        presets = {}
+        for p, preset in enumerate(self.presets):
+            entry = dual(sum(self.pairs[p]), total)
+            entry['blocked'] = dict(self.blocked[p])
+            presets[preset.name] = entry
+        functions = []
+        for index in sorted(range(len(self.names)), key=lambda i: -self.instructions[i]):
+            count = self.instructions[index]
+            if not count:
+                continue
+            path = self.path[index]
+            functions.append({
+                'name': self.names[index],
+                'instructions': count,
+                'critical_path': path,
+                'ilp': count / path if path else None,
+                'presets': {preset.name: dual(self.pairs[p][index], count)
+                            for p, preset in enumerate(self.presets)},
+            })
+        return {
+            'instructions': total,
+            'critical_path': self.critical_path,
+            'ideal_ilp': total / self.critical_path if self.critical_path else 0.0,
+            'presets': presets,
+            'functions': functions,
+        }
+
+
+def analyze(trace_file: str, elf_file: str, hw_configs: Sequence[HwConfig]) -> Dict:
+    """Run the limit study over trace_file, attributing to the functions of elf_file"""
+    addresses, names = load_functions(elf_file)
+    analyzer = IlpAnalyzer(addresses, names, hw_configs)
+    feed = analyzer.feed
+    for _, pc, instr, kind, rd, _, addr in iter_records(trace_file):
+        feed(pc, instr, kind, rd, addr)
+    return analyzer.report()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Dataflow critical path, ideal ILP and dual-issue limits of an ISS trace',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog='''
+Examples:
+  %(prog)s work/c.matmul/iss.log --elf work/c.matmul/test.elf
+  %(prog)s iss.bin --elf tests/elf/dhrystone --hw-config hw/presets/rv32im_superscalar_2x.yaml
+        '''
+    )
+    parser.add_argument('trace', metavar='TRACE_FILE', help='ISS trace (text, raw or binary)')
+    parser.add_argument('--elf', required=True, help='ELF the trace was generated from (symbols)')
+    parser.add_argument('--hw-config', action='append', default=None,
+                        help='Hardware preset YAML (repeatable; default: every preset in hw/presets)')
+    parser.add_argument('--top', type=int, default=15, metavar='N',
+                        help='Functions to list, by instruction count (default: 15)')
+    parser.add_argument('--json', default=None, metavar='FILE', help='Write the full report as JSON')
+    args = parser.parse_args()
+
+    try:
+        paths = args.hw_config or list_presets()
+        report = analyze(args.trace, args.elf, [load_hw_config(path) for path in paths])
+    except (OSError, ValueError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    names = list(report['presets'])
+    print(f"Instructions:  {report['instructions']}")
+    print(f"Critical path: {report['critical_path']}")
+    print(f"Ideal ILP:     {report['ideal_ilp']:.2f}\n")
+    print_table(
+        ["Preset", "Dual-issue", "IPC bound"] + [f"Blocked {b}" for b in BLOCKERS],
+        [[name, f"{entry['dual_issue_rate'] * 100:.1f}%", f"{entry['ipc_bound']:.3f}"]
+         + [entry['blocked'][b] for b in BLOCKERS]
+         for name, entry in report['presets'].items()])
+    print()
+    total = report['instructions'] or 1
+    print_table(
+        ["Function", "Instructions", "Share", "ILP"] + [f"Dual {name}" for name in names],
+        [[f['name'], f['instructions'], f"{f['instructions'] / total * 100:.1f}%",
+          '-' if f['ilp'] is None else f"{f['ilp']:.2f}"]
+         + [f"{f['presets'][name]['dual_issue_rate'] * 100:.1f}%" for name in names]
+         for f in report['functions'][:args.top]])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,382 @@
+#!/usr/bin/env python3
+
+# Copyright (c) 2025 Siliscale Consulting, LLC
+# SPDX-License-Identifier: Apache-2.0
+
+"""
+Cycle-approximate timing model for the RISC-V ISS
+
+TimingModel is an ISS trace sink that schedules the retired instruction
+stream on the in-order pipeline described by a HwConfig preset: issue_width
+slots, each with its ExuUnitMask, plus the multiply/divide latencies and the
+load-use and branch penalties of the preset's timing section. It predicts
+cycles and IPC in seconds, without building an RTL model.
+
+  predict    run an ELF through the ISS under one or more presets
+  calibrate  compare predictions with stats.txt of finished RTL runs in work/
+"""
+
+import argparse
+import json
+import os
+import sys
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+_REPO_ROOT = Path(__file__).resolve().parents[1]
+if str(_REPO_ROOT) not in sys.path:
+    sys.path.insert(0, str(_REPO_ROOT))
+
+from hw import HwConfig, HwConfigError, default_hw_config_path, load_hw_config
+from rv_iss import (
+    CLS_DIV, CLS_LOAD, CLS_MUL, CLS_STORE, EFF_JUMP, EFF_LOAD, EFF_REG, EFF_TAKEN,
+    DecodedInstruction, NullTraceWriter, RISC_V_ISS, TeeSink, TraceWriter, instruction_class,
+)
+
+# Functional unit of each scheduling class
+UNIT_NAMES = ('alu', 'mul', 'div', 'lsu')
+UNIT_ALU, UNIT_MUL, UNIT_DIV, UNIT_LSU = range(len(UNIT_NAMES))
+_CLASS_UNITS = {CLS_MUL: UNIT_MUL, CLS_DIV: UNIT_DIV, CLS_LOAD: UNIT_LSU, CLS_STORE: UNIT_LSU}
+
+# Stall causes reported by the model
+STALLS = ('dependency', 'load_use', 'mul', 'div', 'branch', 'structural')
+
+# Opcodes reading rs1 / rs2
+_READS_RS1 = {0x67, 0x03, 0x13, 0x33, 0x63, 0x23}
+_READS_RS2 = {0x33, 0x63, 0x23}
+
+
+def functional_unit(cls: int) -> int:
+    """EXU unit executing an instruction class (branches, jumps and system ops use the ALU)"""
+    return _CLASS_UNITS.get(cls, UNIT_ALU)
+
+
+def source_registers(d) -> Tuple[bool, bool]:
+    """Whether d reads a non-zero rs1 / rs2"""
+    return (d.opcode in _READS_RS1 and d.rs1 != 0,
+            d.opcode in _READS_RS2 and d.rs2 != 0)
+
+
+def slot_units(hw: HwConfig) -> List[Tuple[bool, bool, bool, bool]]:
+    """Per issue slot, the enabled units indexed by UNIT_*"""
+    slots = [(mask.alu, mask.mul, mask.div, mask.lsu) for mask in hw.cpu.exu]
+    for unit, name in enumerate(UNIT_NAMES):
+        if not any(slot[unit] for slot in slots):
+            raise HwConfigError(f"{hw.name}: no EXU slot provides a {name} unit")
+    return slots
+
+
+class TimingModel(TeeSink):
+    """In-order pipeline model fed by the ISS, optionally teeing into another sink.
+
+    Each instruction issues at the earliest cycle that respects program order,
+    a free slot whose ExuUnitMask has the needed unit, its source operands
+    (full forwarding; load results arrive load_use_penalty cycles late) and
+    the RTL interlocks: nothing issues under a blocking divide, and a non-MUL
+    waits for outstanding multiplies. Taken branches and jumps cost
+    branch_penalty cycles of refill. A shadow register file, updated from the
+    traced effects, selects the divider fast path.
+
+    NOPs are not traced, but the RTL issues them: they arrive through nop()
+    and take an ALU slot like any other instruction. As in stats.txt, which
+    is measured on the RTL log where NOPs do not appear, they are counted
+    neither as instructions nor as retirements (they still cost cycles).
+    """
+    FORMAT = 'timing'
+
+    def __init__(self, hw: HwConfig, regs: Sequence[int], inner: Optional[TraceWriter] = None):
+        super().__init__(inner)
+        self.hw = hw
+        self.timing = hw.timing
+        self.slots = slot_units(hw)
+
+        self.shadow = list(regs)
+        self.ready = [0] * 32               # cycle at which each register can be consumed
+        self.loaded = [False] * 32          # register last written by a load
+        self.cycle = 0                      # cycle of the current issue group
+        self.used = [False] * len(self.slots)
+        self.next_issue = 0                 # earliest cycle for the next instruction
+        self.mul_done = 0                   # completion of the youngest multiply
+        self.first_done: Optional[int] = None
+        self.last_done = 0
+        self.instructions = 0
+        self.nops = 0
+        self.stalls = dict.fromkeys(STALLS, 0)
+        # pc -> (instruction word, class, unit, reads rs1, reads rs2)
+        self.pc_info: Dict[int, Tuple[int, int, int, bool, bool]] = {}
+
+    def _decode(self, d: DecodedInstruction) -> Tuple[int, int, int, bool, bool]:
+        cls = instruction_class(d)
+        info = (d.inst, cls, functional_unit(cls)) + source_registers(d)
+        self.pc_info[d.pc] = info
+        return info
+
+    def _div_latency(self, d: DecodedInstruction) -> int:
+        """Divider latency, using the fast path conditions of div.sv"""
+        a, b = self.shadow[d.rs1], self.shadow[d.rs2]
+        if d.funct3 in (4, 6):  # DIV / REM: signed magnitudes
+            overflow = a == 0x80000000 and b == 0xFFFFFFFF
+            a = (a ^ 0xFFFFFFFF) + 1 & 0xFFFFFFFF if a & 0x80000000 else a
+            b = (b ^ 0xFFFFFFFF) + 1 & 0xFFFFFFFF if b & 0x80000000 else b
+        else:
+            overflow = False
+        if b <= 1 or a == 0 or overflow or (a < 16 and b < 16):
+            return self.timing.div_fast_latency
+        return self.timing.div_latency
+
+    def _issue(self, issue: int, unit: int) -> int:
+        """Issue cycle of an instruction for unit whose operands are ready at
+        issue; takes its slot in that cycle's issue group"""
+        stalls = self.stalls
+        # Non-MUL instructions wait for the multiplier to drain
+        if unit != UNIT_MUL and self.mul_done > issue:
+            stalls['mul'] += self.mul_done - issue
+            issue = self.mul_done
+
+        # Slot allocation within the issue group
+        while True:
+            if issue > self.cycle:
+                self.cycle = issue
+                self.used = [False] * len(self.slots)
+            slot = next((i for i, caps in enumerate(self.slots)
+                         if caps[unit] and not self.used[i]), None)
+            if slot is not None:
+                break
+            if not all(self.used):
+                # A slot is free but lacks the unit (e.g. MUL only in EXU0)
+                stalls['structural'] += 1
+            issue += 1
+        self.used[slot] = True
+        return issue
+
+    def nop(self, d: DecodedInstruction):
+        """Forward to the inner sink and issue the NOP on an ALU slot"""
+        self.inner.nop(d)
+        self.next_issue = self._issue(self.next_issue, UNIT_ALU)
+        self.nops += 1
+
+    def record(self, d: DecodedInstruction, kind: int, rd: int, value: int, addr: int):
+        """Forward to the inner sink and schedule the instruction"""
+        self.inner.record(d, kind, rd, value, addr)
+        info = self.pc_info.get(d.pc)
+        if info is None or info[0] != d.inst:
+            info = self._decode(d)
+        _, cls, unit, reads_rs1, reads_rs2 = info
+        timing = self.timing
+        stalls = self.stalls
+
+        # Operand readiness
+        issue = self.next_issue
+        for reg, used in ((d.rs1, reads_rs1), (d.rs2, reads_rs2)):
+            if used and self.ready[reg] > issue:
+                stalls['load_use' if self.loaded[reg] else 'dependency'] += self.ready[reg] - issue
+                issue = self.ready[reg]
+        issue = self._issue(issue, unit)
+
+        # Latency and follow-on constraints
+        if unit == UNIT_MUL:
+            latency = timing.mul_latency
+            self.mul_done = issue + latency
+        elif unit == UNIT_DIV:
+            latency = self._div_latency(d)
+        elif cls == CLS_LOAD:
+            latency = 1 + timing.load_use_penalty
+        else:
+            latency = 1
+
+        self.next_issue = issue
+        if unit == UNIT_DIV:
+            # Blocking divider: nothing issues until it finishes
+            self.next_issue = issue + latency
+            stalls['div'] += latency - 1
+        elif kind == EFF_TAKEN or kind == EFF_JUMP:
+            self.next_issue = issue + 1 + timing.branch_penalty
+            stalls['branch'] += timing.branch_penalty
+
+        done = issue + latency
+        if rd and kind in (EFF_REG, EFF_LOAD, EFF_JUMP):
+            self.ready[rd] = done
+            self.loaded[rd] = cls == CLS_LOAD
+            self.shadow[rd] = value & 0xFFFFFFFF
+        if self.first_done is None:
+            self.first_done = done
+        if done > self.last_done:
+            self.last_done = done
+        self.instructions += 1
+
+    @property
+    def cycles(self) -> int:
+        """Cycles between the first and the last retirement (as in stats.txt)"""
+        return 0 if self.first_done is None else self.last_done - self.first_done
+
+    def report(self) -> Dict:
+        cycles = self.cycles
+        return {
+            'hw_config': self.hw.name,
+            'instructions': self.instructions,
+            'nops': self.nops,
+            'cycles': cycles,
+            'ipc': self.instructions / cycles if cycles else 0.0,
+            'cpi': cycles / self.instructions if self.instructions else 0.0,
+            'stall_cycles': dict(self.stalls),
+        }
+
+
+def predict(elf_file: str, hw_configs: Sequence[HwConfig], entry: Optional[int] = None,
+            hex_file: Optional[str] = None, translate: bool = False,
+            max_instructions: Optional[int] = None) -> List[Dict]:
+    """Run elf_file once through the ISS and time it under every preset"""
+    iss = RISC_V_ISS(entry or 0, 0x7FFFF000, 0x1000)
+    if entry is None:
+        # Same reset vector as sim_manager: the _start symbol
+        iss.load_elf(elf_file)
+        if '_start' not in iss.symbols:
+            raise ValueError(f"{elf_file}: no _start symbol; pass --entry")
+        iss.text_start = iss.symbols['_start']
+
+    sink: TraceWriter = NullTraceWriter()
+    models = []
+    for hw in hw_configs:
+        sink = TimingModel(hw, iss.regs.regs, sink)
+        models.append(sink)
+    iss.run(elf_file, sink, hex_file, max_instructions, translate)
+    return [model.report() for model in models]
+
+
+def read_stats(path: str) -> Dict[str, float]:
+    """Parse the Metric | Value table written by sim_manager.calculate_perf_stats"""
+    stats = {}
+    with open(path, 'r') as f:
+        for line in f:
+            if '|' not in line:
+                continue
+            metric, value = (part.strip() for part in line.split('|', 1))
+            try:
+                stats[metric] = float(value)
+            except ValueError:
+                continue
+    return stats
+
+
+def calibrate(work_dir: str, tests: Sequence[str], hw_override: Optional[HwConfig] = None,
+              translate: bool = False) -> List[Dict]:
+    """Predict every finished RTL run in work_dir and compare with its stats.txt"""
+    if not tests:
+        tests = sorted(name for name in os.listdir(work_dir)
+                       if os.path.exists(os.path.join(work_dir, name, 'stats.txt')))
+    rows = []
+    for test in tests:
+        test_dir = os.path.join(work_dir, test)
+        hw = hw_override
+        if hw is None:
+            # The preset the RTL ran with, as recorded by sim_manager
+            artifact = os.path.join(test_dir, 'hw_config.json')
+            source = None
+            if os.path.exists(artifact):
+                with open(artifact, 'r') as f:
+                    source = json.load(f).get('source_path')
+            hw = load_hw_config(source if source and os.path.exists(source) else None)
+        # Same data image as sim_manager's ISS run: the test's own .mem file when
+        # it has one (work/<test>/dmem.hex is the annotated DCCM image, not ISS input),
+        # otherwise just the ELF sections
+        kind, _, name = test.partition('.')
+        mem = os.path.join(os.path.dirname(os.path.abspath(work_dir)), 'tests', kind, name + '.mem')
+        stats = read_stats(os.path.join(test_dir, 'stats.txt'))
+        report = predict(os.path.join(test_dir, 'test.elf'), [hw],
+                         hex_file=mem if os.path.exists(mem) else None,
+                         translate=translate)[0]
+        rtl_cycles = stats.get('Number of cycles', 0)
+        rows.append({
+            'test': test,
+            'hw_config': hw.name,
+            'rtl_cycles': int(rtl_cycles),
+            'predicted_cycles': report['cycles'],
+            'error': (report['cycles'] - rtl_cycles) / rtl_cycles if rtl_cycles else 0.0,
+            'rtl_ipc': stats.get('Instructions per cycle', 0.0),
+            'predicted_ipc': report['ipc'],
+        })
+    return rows
+
+
+def print_table(headers: List[str], rows: List[List]):
+    widths = [max(len(str(cell)) for cell in column) for column in zip(headers, *rows)]
+    print(" | ".join(f"{h:<{w}}" for h, w in zip(headers, widths)))
+    print("-+-".join('-' * w for w in widths))
+    for row in rows:
+        print(" | ".join(f"{str(c):<{w}}" for c, w in zip(row, widths)))
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Cycle-approximate timing model on top of the RISC-V ISS',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog='''
+Examples:
+  %(prog)s predict tests/elf/dhrystone
+  %(prog)s predict work/c.matmul/test.elf --hw-config hw/presets/rv32im_scalar.yaml \\
+      --hw-config hw/presets/rv32im_superscalar_2x.yaml
+  %(prog)s calibrate --work work
+        '''
+    )
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    predict_parser = subparsers.add_parser('predict', help='Predict cycles and IPC of an ELF')
+    predict_parser.add_argument('elf_file', metavar='ELF_FILE')
+    predict_parser.add_argument('--entry', type=lambda x: int(x, 16), default=None,
+                                help='Entry PC (hex; default: the _start symbol)')
+    predict_parser.add_argument('-m', '--mem-file', default=None, metavar='HEX_FILE',
+                                help='Hex file to preload data memory')
+    predict_parser.add_argument('--hw-config', action='append', default=None,
+                                help='Hardware preset YAML (repeatable; default: rv32im_scalar)')
+    predict_parser.add_argument('--max-instructions', type=int, default=None, metavar='N')
+    predict_parser.add_argument('--json', action='store_true', help='Print the reports as JSON')
+
+    calibrate_parser = subparsers.add_parser(
+        'calibrate', help='Compare predictions with stats.txt of RTL runs')
+    calibrate_parser.add_argument('tests', nargs='*', metavar='TEST',
+                                  help='Tests to compare (default: every work/<test> with stats.txt)')
+    calibrate_parser.add_argument('--work', default='work', help='Work directory (default: work)')
+    calibrate_parser.add_argument('--hw-config', default=None,
+                                  help='Preset to predict with (default: the one each test ran with)')
+    calibrate_parser.add_argument('--json', action='store_true', help='Print the rows as JSON')
+
+    for sub in (predict_parser, calibrate_parser):
+        sub.add_argument('--translate', action='store_true',
+                         help='Execute through compiled basic blocks (same results, faster)')
+
+    args = parser.parse_args()
+
+    try:
+        if args.command == 'predict':
+            paths = args.hw_config or [str(default_hw_config_path())]
+            reports = predict(args.elf_file, [load_hw_config(path) for path in paths],
+                              args.entry, args.mem_file, args.translate, args.max_instructions)
+            if args.json:
+                print(json.dumps(reports, indent=2))
+            else:
+                print_table(
+                    ["Preset", "Instructions", "Cycles", "IPC", "CPI"],
+                    [[r['hw_config'], r['instructions'], r['cycles'], f"{r['ipc']:.4f}",
+                      f"{r['cpi']:.4f}"] for r in reports])
+        else:
+            hw = load_hw_config(args.hw_config) if args.hw_config else None
+            rows = calibrate(args.work, args.tests, hw, args.translate)
+            if args.json:
+                print(json.dumps(rows, indent=2))
+            elif rows:
+                print_table(
+                    ["Test", "Preset", "RTL cycles", "Predicted", "Error", "RTL IPC", "Pred IPC"],
+                    [[r['test'], r['hw_config'], r['rtl_cycles'], r['predicted_cycles'],
+                      f"{r['error'] * 100:+.1f}%", f"{r['rtl_ipc']:.4f}",
+                      f"{r['predicted_ipc']:.4f}"] for r in rows])
+                mean = sum(abs(r['error']) for r in rows) / len(rows)
+                print(f"\nMean absolute cycle error: {mean * 100:.1f}% over {len(rows)} test(s)")
+            else:
+                print(f"No finished RTL runs (stats.txt) found in {args.work}")
+    except (OSError, ValueError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
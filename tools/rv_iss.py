@@ -8,10 +8,18 @@ RISC-V Instruction Set Simulator (RV32I)
 Hardware verification ISS that generates execution traces
 """
 
+import io
+import os
 import sys
+import json
+import zlib
+import bisect
+import shutil
+import tempfile
+import concurrent.futures
 import struct
 import argparse
-from typing import Dict, List, Tuple, Optional
+from typing import IO, Callable, Dict, List, NamedTuple, Sequence, Tuple, Optional, Union
 
 try:
     from elftools.elf.elffile import ELFFile
@@ -44,7 +52,7 @@ class RegisterFile:
 
 
 class Memory:
-    """Byte-addressable memory"""
+    """Byte-addressable memory (one dict entry per byte)"""
     def __init__(self):
         self.mem: Dict[int, int] = {}
     
@@ -82,6 +90,1159 @@ class Memory:
         """Load data into memory starting at address"""
         for i, byte in enumerate(data):
             self.write_byte(addr + i, byte)
+    
+    def image(self) -> Dict[int, bytes]:
+        """Non-zero contents as {base address: 4 KiB chunk}"""
+        chunks: Dict[int, bytearray] = {}
+        for addr, value in self.mem.items():
+            if value:
+                chunk = chunks.setdefault(addr & ~0xFFF, bytearray(0x1000))
+                chunk[addr & 0xFFF] = value
+        return {base: bytes(chunk) for base, chunk in chunks.items()}
+    
+    def clear(self):
+        """Zero all of memory"""
+        self.mem.clear()
+
+
+_HALF = struct.Struct('<H')
+_WORD = struct.Struct('<I')
+
+
+class PagedMemory:
+    """Sparse byte-addressable memory backed by 4 KiB bytearray pages"""
+    PAGE_BITS = 12
+    PAGE_SIZE = 1 << PAGE_BITS
+    PAGE_MASK = PAGE_SIZE - 1
+    
+    def __init__(self):
+        # Page table: page number -> page contents, allocated on first write
+        self.pages: Dict[int, bytearray] = {}
+    
+    def _page(self, addr: int) -> bytearray:
+        """Return the page holding addr, allocating it if needed"""
+        page_num = addr >> self.PAGE_BITS
+        page = self.pages.get(page_num)
+        if page is None:
+            page = self.pages[page_num] = bytearray(self.PAGE_SIZE)
+        return page
+    
+    def read_byte(self, addr: int) -> int:
+        """Read byte from memory"""
+        page = self.pages.get(addr >> self.PAGE_BITS)
+        if page is None:
+            return 0
+        return page[addr & self.PAGE_MASK]
+    
+    def write_byte(self, addr: int, value: int):
+        """Write byte to memory"""
+        self._page(addr)[addr & self.PAGE_MASK] = value & 0xFF
+    
+    def read_word(self, addr: int) -> int:
+        """Read 32-bit word from memory (little-endian)"""
+        offset = addr & self.PAGE_MASK
+        if offset > self.PAGE_SIZE - 4:
+            # Word straddles a page boundary
+            val = 0
+            for i in range(4):
+                val |= (self.read_byte(addr + i) << (i * 8))
+            return val
+        page = self.pages.get(addr >> self.PAGE_BITS)
+        if page is None:
+            return 0
+        return _WORD.unpack_from(page, offset)[0]
+    
+    def write_word(self, addr: int, value: int):
+        """Write 32-bit word to memory (little-endian)"""
+        offset = addr & self.PAGE_MASK
+        if offset > self.PAGE_SIZE - 4:
+            for i in range(4):
+                self.write_byte(addr + i, (value >> (i * 8)) & 0xFF)
+            return
+        _WORD.pack_into(self._page(addr), offset, value & 0xFFFFFFFF)
+    
+    def read_half(self, addr: int) -> int:
+        """Read 16-bit halfword from memory (little-endian)"""
+        offset = addr & self.PAGE_MASK
+        if offset == self.PAGE_MASK:
+            return self.read_byte(addr) | (self.read_byte(addr + 1) << 8)
+        page = self.pages.get(addr >> self.PAGE_BITS)
+        if page is None:
+            return 0
+        return _HALF.unpack_from(page, offset)[0]
+    
+    def write_half(self, addr: int, value: int):
+        """Write 16-bit halfword to memory (little-endian)"""
+        offset = addr & self.PAGE_MASK
+        if offset == self.PAGE_MASK:
+            self.write_byte(addr, value & 0xFF)
+            self.write_byte(addr + 1, (value >> 8) & 0xFF)
+            return
+        _HALF.pack_into(self._page(addr), offset, value & 0xFFFF)
+    
+    def load_data(self, addr: int, data: bytes):
+        """Load data into memory starting at address"""
+        view = memoryview(data)
+        pos = 0
+        while pos < len(view):
+            offset = (addr + pos) & self.PAGE_MASK
+            chunk = min(self.PAGE_SIZE - offset, len(view) - pos)
+            self._page(addr + pos)[offset:offset + chunk] = view[pos:pos + chunk]
+            pos += chunk
+    
+    def image(self) -> Dict[int, bytes]:
+        """Non-zero contents as {base address: page}"""
+        return {num << self.PAGE_BITS: bytes(page) for num, page in self.pages.items()
+                if page.count(0) != self.PAGE_SIZE}
+    
+    def clear(self):
+        """Zero all of memory"""
+        self.pages.clear()
+
+
+# Selectable memory backends (--mem-backend); 'dict' is kept for comparison runs
+MEMORY_BACKENDS = {
+    'paged': PagedMemory,
+    'dict': Memory,
+}
+
+
+class TraceWriter:
+    """Streaming trace file writer that flushes buffered lines in fixed-size chunks.
+    
+    output_file is a path, or an open text stream (e.g. io.StringIO) that the
+    writer flushes into but leaves open; this is the trace sink taken by
+    RISC_V_ISS.run.
+    """
+    FORMAT = 'text'
+    MNEMONICS = True    # lines carry the disassembly field
+    BUFFERED = True     # translated blocks append rendered entries to self.buffer
+    CHUNK_LINES = 16384
+    MODE = 'w'
+    
+    def __init__(self, output_file: Union[str, IO], chunk_lines: int = CHUNK_LINES):
+        self.owns_file = not hasattr(output_file, 'write')
+        self.file = open(output_file, self.MODE) if self.owns_file else output_file
+        self.chunk_lines = chunk_lines
+        self.buffer: List[str] = []
+        self.lines_written = 0
+    
+    def write(self, line: str):
+        """Queue one trace line, flushing once a full chunk is buffered"""
+        self.buffer.append(line)
+        if len(self.buffer) >= self.chunk_lines:
+            self.flush()
+    
+    def record(self, d: 'DecodedInstruction', kind: int, rd: int, value: int, addr: int):
+        """Queue the trace line of one retired instruction and its effect"""
+        self.buffer.append(d.trace_prefix + _EFFECT_FORMAT[kind](rd, value, addr))
+        if len(self.buffer) >= self.chunk_lines:
+            self.flush()
+    
+    def nop(self, d: 'DecodedInstruction'):
+        """A retired NOP (ADDI x0, x0, 0): never traced, but seen by sinks that time the stream"""
+    
+    def flush(self):
+        """Write buffered lines (newline-separated, no trailing newline)"""
+        if not self.buffer:
+            return
+        if self.lines_written:
+            self.file.write('\n')
+        self.file.write('\n'.join(self.buffer))
+        self.lines_written += len(self.buffer)
+        self.buffer.clear()
+    
+    def close(self):
+        self.flush()
+        if self.owns_file:
+            self.file.close()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc):
+        self.close()
+
+
+class RawTraceWriter(TraceWriter):
+    """Text trace with an empty disassembly field (PC;INSTR;;EFFECTS).
+    
+    Mnemonics are rendered on demand from the instruction word, e.g. by
+    trace_format.py pretty or in mismatch reports.
+    """
+    FORMAT = 'raw'
+    MNEMONICS = False
+
+
+# Binary trace layout (see tools/trace_format.py for the NumPy reader):
+# a fixed header followed by one fixed-width little-endian record per
+# traced instruction. Records carry the effect kind and its raw operands
+# instead of rendered text; cycle is 0 in ISS traces.
+TRACE_MAGIC = b'RVTRACE\0'
+TRACE_VERSION = 1
+TRACE_SOURCE_ISS = 0
+TRACE_SOURCE_RTL = 1
+TRACE_HEADER = struct.Struct('<8sHHI')          # magic, version, source, record size
+TRACE_RECORD = struct.Struct('<IIIBBII')        # cycle, pc, instr, kind, rd, value, addr
+
+
+class BinaryTraceWriter(TraceWriter):
+    """Streaming writer for the packed binary trace format"""
+    FORMAT = 'binary'
+    MNEMONICS = False
+    MODE = 'wb'
+    
+    def __init__(self, output_file: Union[str, IO], chunk_lines: int = TraceWriter.CHUNK_LINES,
+                 source: int = TRACE_SOURCE_ISS):
+        super().__init__(output_file, chunk_lines)
+        self.buffer: List[bytes] = []
+        self.file.write(TRACE_HEADER.pack(TRACE_MAGIC, TRACE_VERSION, source, TRACE_RECORD.size))
+    
+    def write(self, line: str):
+        raise TypeError("binary traces hold records, not text lines")
+    
+    def record(self, d: 'DecodedInstruction', kind: int, rd: int, value: int, addr: int):
+        """Queue the packed record of one retired instruction and its effect"""
+        self.buffer.append(TRACE_RECORD.pack(0, d.pc, d.inst, kind, rd, value, addr))
+        if len(self.buffer) >= self.chunk_lines:
+            self.flush()
+    
+    def flush(self):
+        """Write buffered records"""
+        if not self.buffer:
+            return
+        self.file.write(b''.join(self.buffer))
+        self.lines_written += len(self.buffer)
+        self.buffer.clear()
+
+
+class NullTraceWriter(TraceWriter):
+    """Sink that discards everything, used while fast-forwarding untraced"""
+    FORMAT = 'none'
+    MNEMONICS = False
+    
+    def __init__(self, output_file: Union[str, IO, None] = None,
+                 chunk_lines: int = TraceWriter.CHUNK_LINES):
+        self.owns_file = False
+        self.file = None
+        self.chunk_lines = TraceWriter.CHUNK_LINES
+        self.buffer: List[str] = []
+        self.lines_written = 0
+    
+    def write(self, line: str):
+        pass
+    
+    def record(self, d: 'DecodedInstruction', kind: int, rd: int, value: int, addr: int):
+        pass
+    
+    def flush(self):
+        pass
+
+
+class TeeSink(TraceWriter):
+    """Base of the analysis sinks (Profiler, BbvCollector, iss_timing.TimingModel).
+    
+    These are not buffered: they see every traced instruction through
+    record() and every NOP through nop(), and forward everything to inner,
+    another sink (a trace writer by default discarding, so sinks can be
+    chained).
+    """
+    BUFFERED = False
+    
+    def __init__(self, inner: Optional[TraceWriter] = None):
+        self.inner = inner if inner is not None else NullTraceWriter()
+        self.MNEMONICS = self.inner.MNEMONICS
+        self.owns_file = False
+        self.file = None
+        self.chunk_lines = TraceWriter.CHUNK_LINES
+        self.buffer: List[str] = []
+        self.lines_written = 0
+    
+    def write(self, line: str):
+        self.inner.write(line)
+    
+    def record(self, d: 'DecodedInstruction', kind: int, rd: int, value: int, addr: int):
+        self.inner.record(d, kind, rd, value, addr)
+    
+    def nop(self, d: 'DecodedInstruction'):
+        self.inner.nop(d)
+    
+    def flush(self):
+        self.inner.flush()
+    
+    def close(self):
+        self.inner.close()
+
+
+TRACE_FORMATS = {
+    'text': TraceWriter,
+    'raw': RawTraceWriter,
+    'binary': BinaryTraceWriter,
+    'none': NullTraceWriter,
+}
+
+
+# Checkpoint file: CHECKPOINT_HEADER, then a zlib stream holding the 32
+# registers followed by (address, length, bytes) memory chunks
+CHECKPOINT_MAGIC = b'RVCKPT\0\0'
+CHECKPOINT_VERSION = 1
+CHECKPOINT_HEADER = struct.Struct('<8sHIQII')   # magic, version, pc, instruction count, .text bounds
+_CHECKPOINT_REGS = struct.Struct('<32I')
+_CHECKPOINT_CHUNK = struct.Struct('<II')        # address, length
+
+
+class TraceWindows(NamedTuple):
+    """Fast-forward and sampling plan for RISC_V_ISS.run.
+    
+    Execution is untraced until start_pc (or start_symbol) is reached, then
+    for start_count more instructions; after that, length instructions are
+    traced (None: to the end). With every set, a new window of length
+    instructions opens every `every` instructions until the program ends.
+    """
+    start_pc: Optional[int] = None
+    start_symbol: Optional[str] = None
+    start_count: int = 0
+    length: Optional[int] = None
+    every: Optional[int] = None
+
+
+# Trace effect kinds returned by the instruction handlers; the text trace
+# renders them through _EFFECT_FORMAT, other sinks consume them as-is
+EFF_NONE = 0        # no architectural effect (fence, unknown opcodes)
+EFF_REG = 1         # x<rd>=<value>
+EFF_LOAD = 2        # x<rd>=<value> // Loading from <addr>
+EFF_JUMP = 3        # x<rd>=<value>;pc=<addr>
+EFF_TAKEN = 4       # taken=true;pc=<addr>
+EFF_NOT_TAKEN = 5   # taken=false
+EFF_STORE = 6       # mem[<addr>]=<value>
+EFF_ECALL = 7
+EFF_EBREAK = 8
+
+_EFFECT_FORMAT = (
+    lambda rd, value, addr: "",
+    lambda rd, value, addr: f"x{rd}=0x{value:08X}",
+    lambda rd, value, addr: f"x{rd}=0x{value:08X} // Loading from 0x{addr:08X}",
+    lambda rd, value, addr: f"x{rd}=0x{value:08X};pc=0x{addr:08X}",
+    lambda rd, value, addr: f"taken=true;pc=0x{addr:08X}",
+    lambda rd, value, addr: "taken=false",
+    lambda rd, value, addr: f"mem[0x{addr:08X}]=0x{value:08X}",
+    lambda rd, value, addr: "ecall",
+    lambda rd, value, addr: "ebreak",
+)
+
+
+# The same layouts as str.format templates, used by the block translator to
+# splice runtime expressions into generated f-strings
+_EFFECT_TEMPLATE = (
+    "",
+    "x{rd}=0x{value}",
+    "x{rd}=0x{value} // Loading from 0x{addr}",
+    "x{rd}=0x{value};pc=0x{addr}",
+    "taken=true;pc=0x{addr}",
+    "taken=false",
+    "mem[0x{addr}]=0x{value}",
+    "ecall",
+    "ebreak",
+)
+
+
+def format_effect(kind: int, rd: int, value: int, addr: int) -> str:
+    """Render one effect as the resources part of a trace line"""
+    return _EFFECT_FORMAT[kind](rd, value, addr)
+
+
+class SimulationHalt(Exception):
+    """Raised by a store to the termination address, after the store retired"""
+    def __init__(self, effect: Tuple[int, int, int, int, int]):
+        super().__init__("termination address written")
+        self.effect = effect
+
+
+def _sign_extend(value: int, bits: int) -> int:
+    """Sign extend value to 32 bits"""
+    sign_bit = 1 << (bits - 1)
+    if value & sign_bit:
+        return value | (~((1 << bits) - 1) & 0xFFFFFFFF)
+    return value & ((1 << bits) - 1)
+
+
+def _imm_u(inst: int) -> int:
+    return (inst >> 12) << 12
+
+
+def _imm_i(inst: int) -> int:
+    return _sign_extend((inst >> 20) & 0xFFF, 12)
+
+
+def _imm_s(inst: int) -> int:
+    imm = ((inst >> 25) & 0x7F) << 5
+    imm |= ((inst >> 7) & 0x1F)
+    return _sign_extend(imm, 12)
+
+
+def _imm_b(inst: int) -> int:
+    imm = ((inst >> 31) & 0x1) << 12
+    imm |= ((inst >> 7) & 0x1) << 11
+    imm |= ((inst >> 25) & 0x3F) << 5
+    imm |= ((inst >> 8) & 0xF) << 1
+    return _sign_extend(imm, 13)
+
+
+def _imm_j(inst: int) -> int:
+    imm = ((inst >> 31) & 0x1) << 20
+    imm |= ((inst >> 21) & 0x3FF) << 1
+    imm |= ((inst >> 20) & 0x1) << 11
+    imm |= ((inst >> 12) & 0xFF) << 12
+    return _sign_extend(imm, 21)
+
+
+# Immediate extraction by opcode; opcodes not listed have imm = 0
+_IMM_DECODERS = {
+    0x37: _imm_u,  # LUI
+    0x17: _imm_u,  # AUIPC
+    0x6F: _imm_j,  # JAL
+    0x67: _imm_i,  # JALR
+    0x63: _imm_b,  # Branch
+    0x03: _imm_i,  # Load
+    0x23: _imm_s,  # Store
+    0x13: _imm_i,  # ALU immediate
+    0x73: _imm_i,  # SYSTEM
+}
+
+
+def decode_fields(inst: int) -> Dict[str, int]:
+    """Split an instruction word into opcode, register, funct and immediate fields"""
+    opcode = inst & 0x7F
+    imm_decoder = _IMM_DECODERS.get(opcode)
+    return {
+        'opcode': opcode,
+        'rd': (inst >> 7) & 0x1F,
+        'rs1': (inst >> 15) & 0x1F,
+        'rs2': (inst >> 20) & 0x1F,
+        'funct3': (inst >> 12) & 0x7,
+        'funct7': (inst >> 25) & 0x7F,
+        'inst': inst,
+        'imm': imm_decoder(inst) if imm_decoder else 0,
+    }
+
+
+def _lookup(table: Dict, opcode: int, funct3: int, funct7: int):
+    """Resolve (opcode, funct3, funct7), falling back to wildcard (None) entries"""
+    entry = table.get((opcode, funct3, funct7))
+    if entry is None:
+        entry = table.get((opcode, funct3, None))
+        if entry is None:
+            entry = table.get((opcode, None, None))
+    return entry
+
+
+def _fmt_imm(val: int) -> str:
+    """Format immediate as hex, using 8 digits for negative values"""
+    if val < 0:
+        return f"0x{val & 0xFFFFFFFF:08X}"
+    return f"0x{val:X}"
+
+
+def _dis_r(name: str):
+    return lambda rd, rs1, rs2, imm: f"{name} x{rd},x{rs1},x{rs2}"
+
+
+def _dis_i(name: str):
+    return lambda rd, rs1, rs2, imm: f"{name} x{rd},x{rs1},{_fmt_imm(imm)}"
+
+
+def _dis_shift(name: str):
+    return lambda rd, rs1, rs2, imm: f"{name} x{rd},x{rs1},{imm & 0x1F}"
+
+
+def _dis_branch(name: str):
+    return lambda rd, rs1, rs2, imm: f"{name} x{rs1},x{rs2},{_fmt_imm(imm)}"
+
+
+def _dis_load(name: str):
+    return lambda rd, rs1, rs2, imm: f"{name} x{rd},{_fmt_imm(imm)}(x{rs1})"
+
+
+def _dis_store(name: str):
+    return lambda rd, rs1, rs2, imm: f"{name} x{rs2},{_fmt_imm(imm)}(x{rs1})"
+
+
+def _dis_system(rd: int, rs1: int, rs2: int, imm: int) -> Optional[str]:
+    return {0: "ecall", 1: "ebreak"}.get(imm)
+
+
+# Disassembly: (opcode, funct3, funct7) -> formatter(rd, rs1, rs2, imm);
+# None in a key is a wildcard, a formatter returning None means unknown
+_DISASM = {
+    (0x37, None, None): lambda rd, rs1, rs2, imm: f"lui x{rd},{_fmt_imm(imm >> 12)}",
+    (0x17, None, None): lambda rd, rs1, rs2, imm: f"auipc x{rd},{_fmt_imm(imm >> 12)}",
+    (0x6F, None, None): lambda rd, rs1, rs2, imm: f"jal x{rd},{_fmt_imm(imm)}",
+    (0x67, None, None): lambda rd, rs1, rs2, imm: f"jalr x{rd},x{rs1},{_fmt_imm(imm)}",
+    (0x63, 0, None): _dis_branch('beq'),
+    (0x63, 1, None): _dis_branch('bne'),
+    (0x63, 4, None): _dis_branch('blt'),
+    (0x63, 5, None): _dis_branch('bge'),
+    (0x63, 6, None): _dis_branch('bltu'),
+    (0x63, 7, None): _dis_branch('bgeu'),
+    (0x63, None, None): _dis_branch('unknown'),
+    (0x03, 0, None): _dis_load('lb'),
+    (0x03, 1, None): _dis_load('lh'),
+    (0x03, 2, None): _dis_load('lw'),
+    (0x03, 4, None): _dis_load('lbu'),
+    (0x03, 5, None): _dis_load('lhu'),
+    (0x03, None, None): _dis_load('unknown'),
+    (0x23, 0, None): _dis_store('sb'),
+    (0x23, 1, None): _dis_store('sh'),
+    (0x23, 2, None): _dis_store('sw'),
+    (0x23, None, None): _dis_store('unknown'),
+    (0x13, 0, None): _dis_i('addi'),
+    (0x13, 1, None): _dis_shift('slli'),
+    (0x13, 2, None): _dis_i('slti'),
+    (0x13, 3, None): _dis_i('sltiu'),
+    (0x13, 4, None): _dis_i('xori'),
+    (0x13, 5, 0x00): _dis_shift('srli'),
+    (0x13, 5, 0x20): _dis_shift('srai'),
+    (0x13, 6, None): _dis_i('ori'),
+    (0x13, 7, None): _dis_i('andi'),
+    (0x33, 0, 0x00): _dis_r('add'),
+    (0x33, 0, 0x20): _dis_r('sub'),
+    (0x33, 0, 0x01): _dis_r('mul'),
+    (0x33, 1, 0x00): _dis_r('sll'),
+    (0x33, 1, 0x01): _dis_r('mulh'),
+    (0x33, 2, 0x00): _dis_r('slt'),
+    (0x33, 2, 0x01): _dis_r('mulhsu'),
+    (0x33, 3, 0x00): _dis_r('sltu'),
+    (0x33, 3, 0x01): _dis_r('mulhu'),
+    (0x33, 4, 0x00): _dis_r('xor'),
+    (0x33, 4, 0x01): _dis_r('div'),
+    (0x33, 5, 0x00): _dis_r('srl'),
+    (0x33, 5, 0x20): _dis_r('sra'),
+    (0x33, 5, 0x01): _dis_r('divu'),
+    (0x33, 6, 0x00): _dis_r('or'),
+    (0x33, 6, 0x01): _dis_r('rem'),
+    (0x33, 7, 0x00): _dis_r('and'),
+    (0x33, 7, 0x01): _dis_r('remu'),
+    (0x73, 0, None): _dis_system,
+    (0x0F, None, None): lambda rd, rs1, rs2, imm: "fence",
+}
+
+
+def disassemble(inst: int) -> str:
+    """Disassemble an instruction word to an assembly string"""
+    f = decode_fields(inst)
+    formatter = _lookup(_DISASM, f['opcode'], f['funct3'], f['funct7'])
+    text = formatter(f['rd'], f['rs1'], f['rs2'], f['imm']) if formatter else None
+    return text if text is not None else f"unknown(0x{inst:08X})"
+
+
+def _div(a: int, b: int) -> int:
+    """RV32M DIV on unsigned 32-bit operands (rounds toward zero)"""
+    a = (a ^ 0x80000000) - 0x80000000
+    b = (b ^ 0x80000000) - 0x80000000
+    if b == 0:
+        return 0xFFFFFFFF
+    if a == -0x80000000 and b == -1:
+        return 0x80000000
+    quotient = abs(a) // abs(b)
+    if (a < 0) != (b < 0):
+        quotient = -quotient
+    return quotient & 0xFFFFFFFF
+
+
+def _divu(a: int, b: int) -> int:
+    """RV32M DIVU on unsigned 32-bit operands"""
+    if b == 0:
+        return 0xFFFFFFFF
+    return a // b
+
+
+def _rem(a: int, b: int) -> int:
+    """RV32M REM on unsigned 32-bit operands (sign follows the dividend)"""
+    sa = (a ^ 0x80000000) - 0x80000000
+    sb = (b ^ 0x80000000) - 0x80000000
+    if sb == 0:
+        return a
+    if sa == -0x80000000 and sb == -1:
+        return 0
+    remainder = abs(sa) % abs(sb)
+    if sa < 0:
+        remainder = -remainder
+    return remainder & 0xFFFFFFFF
+
+
+def _remu(a: int, b: int) -> int:
+    """RV32M REMU on unsigned 32-bit operands"""
+    if b == 0:
+        return a
+    return a % b
+
+
+# ALU operations on unsigned 32-bit operands, shared by OP and OP-IMM
+_ALU_OPS = {
+    'add': lambda a, b: (a + b) & 0xFFFFFFFF,
+    'sub': lambda a, b: (a - b) & 0xFFFFFFFF,
+    'sll': lambda a, b: (a << (b & 0x1F)) & 0xFFFFFFFF,
+    'slt': lambda a, b: 1 if (a ^ 0x80000000) < (b ^ 0x80000000) else 0,
+    'sltu': lambda a, b: 1 if a < b else 0,
+    'xor': lambda a, b: a ^ b,
+    'srl': lambda a, b: a >> (b & 0x1F),
+    'sra': lambda a, b: (((a ^ 0x80000000) - 0x80000000) >> (b & 0x1F)) & 0xFFFFFFFF,
+    'or': lambda a, b: a | b,
+    'and': lambda a, b: a & b,
+    'mul': lambda a, b: (a * b) & 0xFFFFFFFF,
+    'mulh': lambda a, b: ((((a ^ 0x80000000) - 0x80000000) * ((b ^ 0x80000000) - 0x80000000)) >> 32) & 0xFFFFFFFF,
+    'mulhsu': lambda a, b: ((((a ^ 0x80000000) - 0x80000000) * b) >> 32) & 0xFFFFFFFF,
+    'mulhu': lambda a, b: (a * b) >> 32,
+    'div': _div,
+    'divu': _divu,
+    'rem': _rem,
+    'remu': _remu,
+}
+
+_OP_NAMES = {
+    (0, 0x00): 'add', (0, 0x20): 'sub', (0, 0x01): 'mul',
+    (1, 0x00): 'sll', (1, 0x01): 'mulh',
+    (2, 0x00): 'slt', (2, 0x01): 'mulhsu',
+    (3, 0x00): 'sltu', (3, 0x01): 'mulhu',
+    (4, 0x00): 'xor', (4, 0x01): 'div',
+    (5, 0x00): 'srl', (5, 0x20): 'sra', (5, 0x01): 'divu',
+    (6, 0x00): 'or', (6, 0x01): 'rem',
+    (7, 0x00): 'and', (7, 0x01): 'remu',
+}
+
+_OP_IMM_NAMES = {
+    (0, None): 'add', (1, None): 'sll', (2, None): 'slt', (3, None): 'sltu',
+    (4, None): 'xor', (5, 0x00): 'srl', (5, 0x20): 'sra', (6, None): 'or', (7, None): 'and',
+}
+
+
+def make_handlers(iss: 'RISC_V_ISS') -> Dict:
+    """Build the (opcode, funct3, funct7) -> handler dispatch table for one ISS.
+    
+    Handlers close over the register list and memory accessors so the hot loop
+    performs no method lookups. Each handler takes a DecodedInstruction and
+    returns (next_pc, effect_kind, rd, value, addr); a store to the termination
+    address raises SimulationHalt carrying that tuple instead.
+    """
+    regs = iss.regs.regs
+    mem = iss.mem
+    invalidate = iss.invalidate_decoded
+    termination_addr = iss.TERMINATION_ADDR
+    handlers = {}
+    
+    def lui(d):
+        rd = d.rd
+        if rd:
+            regs[rd] = d.imm
+        return d.next_pc, EFF_REG, rd, regs[rd], 0
+    
+    def auipc(d):
+        result = (d.pc + d.imm) & 0xFFFFFFFF
+        if d.rd:
+            regs[d.rd] = result
+        return d.next_pc, EFF_REG, d.rd, result, 0
+    
+    def jal(d):
+        # Show register write even for x0 (trace format)
+        link = d.pc + 4
+        if d.rd:
+            regs[d.rd] = link & 0xFFFFFFFF
+        target = (d.pc + d.imm) & 0xFFFFFFFF
+        return target, EFF_JUMP, d.rd, link, target
+    
+    def jalr(d):
+        link = d.pc + 4
+        target = (regs[d.rs1] + d.imm) & 0xFFFFFFFE  # Clear LSB
+        if d.rd:
+            regs[d.rd] = link & 0xFFFFFFFF
+        return target, EFF_JUMP, d.rd, link, target
+    
+    handlers[(0x37, None, None)] = lui
+    handlers[(0x17, None, None)] = auipc
+    handlers[(0x6F, None, None)] = jal
+    handlers[(0x67, None, None)] = jalr
+    
+    def branch(taken_if):
+        def handler(d):
+            if taken_if(regs[d.rs1], regs[d.rs2]):
+                target = (d.pc + d.imm) & 0xFFFFFFFF
+                return target, EFF_TAKEN, 0, 0, target
+            return d.next_pc, EFF_NOT_TAKEN, 0, 0, 0
+        return handler
+    
+    handlers[(0x63, 0, None)] = branch(lambda a, b: a == b)
+    handlers[(0x63, 1, None)] = branch(lambda a, b: a != b)
+    handlers[(0x63, 4, None)] = branch(lambda a, b: (a ^ 0x80000000) < (b ^ 0x80000000))
+    handlers[(0x63, 5, None)] = branch(lambda a, b: (a ^ 0x80000000) >= (b ^ 0x80000000))
+    handlers[(0x63, 6, None)] = branch(lambda a, b: a < b)
+    handlers[(0x63, 7, None)] = branch(lambda a, b: a >= b)
+    handlers[(0x63, None, None)] = branch(lambda a, b: False)
+    
+    def load(read, sign_bit, extend):
+        def handler(d):
+            addr = (regs[d.rs1] + d.imm) & 0xFFFFFFFF
+            val = read(addr)
+            if val & sign_bit:
+                val |= extend
+            if d.rd:
+                regs[d.rd] = val
+            return d.next_pc, EFF_LOAD, d.rd, regs[d.rd], addr
+        return handler
+    
+    handlers[(0x03, 0, None)] = load(mem.read_byte, 0x80, 0xFFFFFF00)
+    handlers[(0x03, 1, None)] = load(mem.read_half, 0x8000, 0xFFFF0000)
+    handlers[(0x03, 2, None)] = load(mem.read_word, 0, 0)
+    handlers[(0x03, 4, None)] = load(mem.read_byte, 0, 0)
+    handlers[(0x03, 5, None)] = load(mem.read_half, 0, 0)
+    handlers[(0x03, None, None)] = load(lambda addr: 0, 0, 0)
+    
+    def store(write, mask, size):
+        def handler(d):
+            addr = (regs[d.rs1] + d.imm) & 0xFFFFFFFF
+            stored_val = regs[d.rs2] & mask
+            write(addr, stored_val)
+            # Self-modifying code: stale decodes must not be replayed
+            if addr < iss.text_end_addr and addr + size > iss.text_start_addr:
+                invalidate(addr, size)
+            if addr == termination_addr:
+                raise SimulationHalt((d.next_pc, EFF_STORE, 0, stored_val, addr))
+            return d.next_pc, EFF_STORE, 0, stored_val, addr
+        return handler
+    
+    def invalid_store(d):
+        addr = (regs[d.rs1] + d.imm) & 0xFFFFFFFF
+        if addr == termination_addr:
+            raise SimulationHalt((d.next_pc, EFF_NONE, 0, 0, 0))
+        return d.next_pc, EFF_NONE, 0, 0, 0
+    
+    handlers[(0x23, 0, None)] = store(mem.write_byte, 0xFF, 1)
+    handlers[(0x23, 1, None)] = store(mem.write_half, 0xFFFF, 2)
+    handlers[(0x23, 2, None)] = store(mem.write_word, 0xFFFFFFFF, 4)
+    handlers[(0x23, None, None)] = invalid_store
+    
+    def alu_imm(op):
+        def handler(d):
+            if d.rd:
+                regs[d.rd] = op(regs[d.rs1], d.imm)
+            return d.next_pc, EFF_REG, d.rd, regs[d.rd], 0
+        return handler
+    
+    def alu_reg(op):
+        def handler(d):
+            if d.rd:
+                regs[d.rd] = op(regs[d.rs1], regs[d.rs2])
+            return d.next_pc, EFF_REG, d.rd, regs[d.rd], 0
+        return handler
+    
+    for (funct3, funct7), name in _OP_IMM_NAMES.items():
+        handlers[(0x13, funct3, funct7)] = alu_imm(_ALU_OPS[name])
+    for (funct3, funct7), name in _OP_NAMES.items():
+        handlers[(0x33, funct3, funct7)] = alu_reg(_ALU_OPS[name])
+    # Unsupported funct7 encodings write zero to rd
+    handlers[(0x13, 5, None)] = alu_imm(lambda a, b: 0)
+    handlers[(0x33, None, None)] = alu_reg(lambda a, b: 0)
+    
+    def system(d):
+        if d.imm == 0:
+            return d.next_pc, EFF_ECALL, 0, 0, 0
+        if d.imm == 1:
+            return d.next_pc, EFF_EBREAK, 0, 0, 0
+        return d.next_pc, EFF_NONE, 0, 0, 0
+    
+    def no_effect(d):
+        # FENCE is a NOP for our purposes; unknown encodings only advance the PC
+        return d.next_pc, EFF_NONE, 0, 0, 0
+    
+    handlers[(0x73, 0, None)] = system
+    handlers[None] = no_effect
+    return handlers
+
+
+class DecodedInstruction(NamedTuple):
+    """Immutable predecoded instruction, cached per PC by the ISS"""
+    pc: int
+    next_pc: int
+    inst: int
+    opcode: int
+    rd: int
+    rs1: int
+    rs2: int
+    funct3: int
+    funct7: int
+    imm: int
+    disasm: str
+    trace_prefix: str  # "PC;INST;DISASM;" columns of the trace line
+    handler: Callable
+
+
+class TranslatedBlock(NamedTuple):
+    """Basic block compiled to a Python function by BlockTranslator"""
+    pc: int
+    length: int
+    run: object  # run(regs, emit) -> (next_pc, executed, halted)
+    source: str
+
+
+_SIGNED = "(({0} ^ 0x80000000) - 0x80000000)"
+
+# ALU register ops: (funct3, funct7) -> expression over operands {a}, {b}
+_TRANSLATE_OP = {
+    (0, 0x00): "({a} + {b}) & 0xFFFFFFFF",
+    (0, 0x20): "({a} - {b}) & 0xFFFFFFFF",
+    (0, 0x01): "({a} * {b}) & 0xFFFFFFFF",
+    (1, 0x00): "({a} << ({b} & 0x1F)) & 0xFFFFFFFF",
+    (1, 0x01): f"({_SIGNED.format('{a}')} * {_SIGNED.format('{b}')} >> 32) & 0xFFFFFFFF",
+    (2, 0x00): "1 if ({a} ^ 0x80000000) < ({b} ^ 0x80000000) else 0",
+    (2, 0x01): f"({_SIGNED.format('{a}')} * {{b}} >> 32) & 0xFFFFFFFF",
+    (3, 0x00): "1 if {a} < {b} else 0",
+    (3, 0x01): "({a} * {b}) >> 32",
+    (4, 0x00): "{a} ^ {b}",
+    (4, 0x01): "_div({a}, {b})",
+    (5, 0x00): "{a} >> ({b} & 0x1F)",
+    (5, 0x20): f"({_SIGNED.format('{a}')} >> ({{b}} & 0x1F)) & 0xFFFFFFFF",
+    (5, 0x01): "_divu({a}, {b})",
+    (6, 0x00): "{a} | {b}",
+    (6, 0x01): "_rem({a}, {b})",
+    (7, 0x00): "{a} & {b}",
+    (7, 0x01): "_remu({a}, {b})",
+}
+
+# Loads: funct3 -> (memory reader, sign bit, sign extension mask)
+_TRANSLATE_LOAD = {
+    0: ('read_byte', 0x80, 0xFFFFFF00),
+    1: ('read_half', 0x8000, 0xFFFF0000),
+    2: ('read_word', 0, 0),
+    4: ('read_byte', 0, 0),
+    5: ('read_half', 0, 0),
+}
+
+# Stores: funct3 -> (memory writer, stored value mask, access size)
+_TRANSLATE_STORE = {
+    0: ('write_byte', 0xFF, 1),
+    1: ('write_half', 0xFFFF, 2),
+    2: ('write_word', 0xFFFFFFFF, 4),
+}
+
+
+class BlockTranslator:
+    """Basic-block translator: turns straight-line .text runs into compiled Python.
+    
+    Blocks are discovered lazily at first execution and end at the first
+    jump/branch (inclusive), at an invalid word, at the end of .text, or after
+    MAX_BLOCK_LENGTH instructions. Register values are hoisted into locals and
+    written back on every block exit. Each block appends exactly the trace
+    entries the interpreter would produce (text lines or packed binary records,
+    per trace_format), so both engines yield byte-identical traces.
+    """
+    MAX_BLOCK_LENGTH = 64
+    
+    def __init__(self, iss: 'RISC_V_ISS', trace_format: str = 'text', buffered: bool = True):
+        self.iss = iss
+        self.trace_format = trace_format
+        # Sinks that are not buffered are passed to blocks as emit, and get
+        # record(D_<pc>, kind, rd, value, addr) and nop(D_<pc>) calls
+        self.buffered = buffered
+        self.cache = iss.block_cache.setdefault(trace_format, {})
+        mem = iss.mem
+        self.namespace = {
+            'pack_record': TRACE_RECORD.pack,
+            '_div': _div,
+            '_divu': _divu,
+            '_rem': _rem,
+            '_remu': _remu,
+            '_store_exit': self._store_exit,
+            'read_byte': mem.read_byte,
+            'read_half': mem.read_half,
+            'read_word': mem.read_word,
+            'write_byte': mem.write_byte,
+            'write_half': mem.write_half,
+            'write_word': mem.write_word,
+        }
+    
+    def _store_exit(self, addr: int, size: int, next_pc: int, executed: int) -> Tuple[int, int, bool]:
+        """Leave a block after a store to the termination address or into .text"""
+        if size:
+            self.iss.invalidate_decoded(addr, size)
+        return next_pc, executed, addr == self.iss.TERMINATION_ADDR
+    
+    def translate(self, pc: int) -> Optional[TranslatedBlock]:
+        """Translate and cache the block starting at pc (None if pc holds an invalid word)"""
+        iss = self.iss
+        instructions = []
+        addr = pc
+        while len(instructions) < self.MAX_BLOCK_LENGTH and iss.text_start_addr <= addr < iss.text_end_addr:
+            decoded = iss.decode_cache.get(addr)
+            if decoded is None:
+                decoded = iss.predecode(addr)
+            if decoded.inst == 0 or decoded.inst == 0xFFFFFFFF:
+                break
+            instructions.append((addr, decoded))
+            if decoded.opcode in (0x6F, 0x67, 0x63):
+                break
+            addr += 4
+        if not instructions:
+            return None
+        
+        source = self._generate(pc, instructions)
+        name = f"block_{pc:08X}"
+        exec(compile(source, f"<block 0x{pc:08X}>", 'exec'), self.namespace)
+        block = TranslatedBlock(pc, len(instructions), self.namespace.pop(name), source)
+        self.cache[pc] = block
+        return block
+    
+    def _generate(self, block_pc: int, instructions: List[Tuple[int, DecodedInstruction]]) -> str:
+        """Generate the Python source of one block function"""
+        body: List[str] = []
+        used = set()
+        written = set()
+        exits: List[int] = []
+        if not self.buffered:
+            render = self._render_record
+            for _, d in instructions:
+                self.namespace[f"D_{d.pc:08X}"] = d
+        else:
+            render = {'binary': self._render_binary, 'none': self._render_none}.get(
+                self.trace_format, self._render_text)
+        
+        def reg(num: int) -> str:
+            if num == 0:
+                return "0"
+            used.add(num)
+            return f"x{num}"
+        
+        def write(rd: int, expr: str):
+            """Assign rd and return the traced value (constant or expression)"""
+            if rd == 0:
+                return 0
+            used.add(rd)
+            written.add(rd)
+            body.append(f"x{rd} = {expr}")
+            return f"x{rd}"
+        
+        next_pc = "0x%08X" % ((instructions[-1][0] + 4) & 0xFFFFFFFF)
+        for index, (pc, d) in enumerate(instructions):
+            executed = index + 1
+            op, rd, funct3, funct7, imm = d.opcode, d.rd, d.funct3, d.funct7, d.imm
+            body.append(f"# 0x{pc:08X}: {d.disasm}")
+            
+            def effect(kind: int, rd: int = 0, value=0, addr=0, indent: str = ""):
+                statement = render(d, kind, rd, value, addr)
+                if statement:
+                    body.append(indent + statement)
+            
+            if d.inst == 0x00000013:
+                # NOP: executed and counted, never traced (sinks still see it)
+                if not self.buffered:
+                    body.append(f"nop(D_{pc:08X})")
+                continue
+            
+            if op == 0x37:  # LUI
+                if rd:
+                    write(rd, f"0x{imm & 0xFFFFFFFF:08X}")
+                effect(EFF_REG, rd, (imm & 0xFFFFFFFF) if rd else 0)
+            
+            elif op == 0x17:  # AUIPC
+                result = (pc + imm) & 0xFFFFFFFF
+                if rd:
+                    write(rd, f"0x{result:08X}")
+                effect(EFF_REG, rd, result)
+            
+            elif op == 0x6F:  # JAL
+                target = (pc + imm) & 0xFFFFFFFF
+                if rd:
+                    write(rd, f"0x{pc + 4:08X}")
+                effect(EFF_JUMP, rd, pc + 4, target)
+                next_pc = f"0x{target:08X}"
+            
+            elif op == 0x67:  # JALR
+                body.append(f"target = ({reg(d.rs1)} + 0x{imm:X}) & 0xFFFFFFFE")
+                if rd:
+                    write(rd, f"0x{pc + 4:08X}")
+                effect(EFF_JUMP, rd, pc + 4, "target")
+                next_pc = "target"
+            
+            elif op == 0x63:  # Branch
+                a, b = reg(d.rs1), reg(d.rs2)
+                cond = {
+                    0: f"{a} == {b}",
+                    1: f"{a} != {b}",
+                    4: f"({a} ^ 0x80000000) < ({b} ^ 0x80000000)",
+                    5: f"({a} ^ 0x80000000) >= ({b} ^ 0x80000000)",
+                    6: f"{a} < {b}",
+                    7: f"{a} >= {b}",
+                }.get(funct3, "False")
+                taken = (pc + imm) & 0xFFFFFFFF
+                body.append(f"if {cond}:")
+                effect(EFF_TAKEN, addr=taken, indent="    ")
+                body.append(f"    target = 0x{taken:08X}")
+                body.append("else:")
+                effect(EFF_NOT_TAKEN, indent="    ")
+                body.append(f"    target = 0x{(pc + 4) & 0xFFFFFFFF:08X}")
+                next_pc = "target"
+            
+            elif op == 0x03:  # Load
+                body.append(f"addr = ({reg(d.rs1)} + 0x{imm:X}) & 0xFFFFFFFF")
+                load = _TRANSLATE_LOAD.get(funct3)
+                if load is None:
+                    value = write(rd, "0")
+                elif rd == 0:
+                    value = 0
+                else:
+                    reader, sign_bit, extend = load
+                    if sign_bit:
+                        body.append(f"value = {reader}(addr)")
+                        value = write(rd, f"value | 0x{extend:08X} if value & 0x{sign_bit:X} else value")
+                    else:
+                        value = write(rd, f"{reader}(addr)")
+                effect(EFF_LOAD, rd, value, "addr")
+            
+            elif op == 0x23:  # Store
+                body.append(f"addr = ({reg(d.rs1)} + 0x{imm:X}) & 0xFFFFFFFF")
+                store = _TRANSLATE_STORE.get(funct3)
+                size = 0
+                if store is None:
+                    effect(EFF_NONE)
+                    body.append(f"if addr == 0x{RISC_V_ISS.TERMINATION_ADDR:08X}:")
+                else:
+                    writer, mask, size = store
+                    value = reg(d.rs2)
+                    body.append(f"{writer}(addr, {value})")
+                    stored = value if mask == 0xFFFFFFFF else f"({value} & 0x{mask:X})"
+                    effect(EFF_STORE, 0, stored, "addr")
+                    # Overlap with .text, written so that it holds for .text at address 0
+                    body.append(f"if addr == 0x{RISC_V_ISS.TERMINATION_ADDR:08X} or "
+                                f"(addr + {size} > 0x{self.iss.text_start_addr:08X} "
+                                f"and addr < 0x{self.iss.text_end_addr:08X}):")
+                exits.append(len(body))
+                body.append(f"    return _store_exit(addr, {size}, 0x{(pc + 4) & 0xFFFFFFFF:08X}, {executed})")
+            
+            elif op == 0x13:  # ALU immediate
+                a = reg(d.rs1)
+                shamt = imm & 0x1F
+                expr = {
+                    0: f"({a} + 0x{imm:X}) & 0xFFFFFFFF",
+                    1: f"({a} << {shamt}) & 0xFFFFFFFF",
+                    2: f"1 if {_SIGNED.format(a)} < {self.iss.to_signed32(imm)} else 0",
+                    3: f"1 if {a} < 0x{imm:X} else 0",
+                    4: f"{a} ^ 0x{imm:X}",
+                    5: {0x00: f"{a} >> {shamt}",
+                        0x20: f"({_SIGNED.format(a)} >> {shamt}) & 0xFFFFFFFF"}.get(funct7, "0"),
+                    6: f"{a} | 0x{imm:X}",
+                    7: f"{a} & 0x{imm:X}",
+                }[funct3]
+                effect(EFF_REG, rd, write(rd, expr))
+            
+            elif op == 0x33:  # ALU register
+                template = _TRANSLATE_OP.get((funct3, funct7), "0")
+                value = write(rd, template.format(a=reg(d.rs1), b=reg(d.rs2))) if rd else 0
+                effect(EFF_REG, rd, value)
+            
+            elif op == 0x73 and funct3 == 0 and imm in (0, 1):  # ECALL / EBREAK
+                effect(EFF_ECALL if imm == 0 else EFF_EBREAK)
+            
+            else:  # FENCE, unsupported SYSTEM and unknown opcodes: no effect
+                effect(EFF_NONE)
+        
+        writeback = [f"regs[{num}] = x{num}" for num in sorted(written)]
+        source = [f"def block_{block_pc:08X}(regs, emit):"]
+        source += [f"    x{num} = regs[{num}]" for num in sorted(used)]
+        if not self.buffered:
+            source.append("    record, nop = emit.record, emit.nop")
+        for index, stmt in enumerate(body):
+            if index in exits:
+                # Early exit from inside an if-statement: write back first
+                source += [f"        {w}" for w in writeback]
+            source.append(f"    {stmt}")
+        source += [f"    {w}" for w in writeback]
+        source.append(f"    return {next_pc}, {len(instructions)}, False")
+        return "\n".join(source) + "\n"
+    
+    @staticmethod
+    def _render_text(d: DecodedInstruction, kind: int, rd: int, value, addr) -> str:
+        """Statement appending one text trace line; str operands are runtime expressions"""
+        def field(operand) -> str:
+            return f"{operand:08X}" if isinstance(operand, int) else "{" + operand + ":08X}"
+        
+        tail = _EFFECT_TEMPLATE[kind].format(rd=rd, value=field(value), addr=field(addr))
+        prefix = d.trace_prefix
+        assert '"' not in prefix and '\\' not in prefix
+        if '{' not in tail:
+            return f'emit("{prefix}{tail}")'
+        prefix = prefix.replace('{', '{{').replace('}', '}}')
+        return f'emit(f"{prefix}{tail}")'
+    
+    @staticmethod
+    def _render_record(d: DecodedInstruction, kind: int, rd: int, value, addr) -> str:
+        """Statement passing one effect to the sink's record method"""
+        return (f"record(D_{d.pc:08X}, {kind}, {rd}, "
+                f"{value if isinstance(value, str) else hex(value)}, "
+                f"{addr if isinstance(addr, str) else hex(addr)})")
+    
+    @staticmethod
+    def _render_none(d: DecodedInstruction, kind: int, rd: int, value, addr) -> Optional[str]:
+        """Untraced blocks build no trace entries at all"""
+        return None
+    
+    @staticmethod
+    def _render_binary(d: DecodedInstruction, kind: int, rd: int, value, addr) -> str:
+        """Statement appending one packed trace record; constant records are prebuilt"""
+        if isinstance(value, int) and isinstance(addr, int):
+            return f"emit({TRACE_RECORD.pack(0, d.pc, d.inst, kind, rd, value, addr)!r})"
+        return (f"emit(pack_record(0, 0x{d.pc:08X}, 0x{d.inst:08X}, {kind}, {rd}, "
+                f"{value if isinstance(value, str) else hex(value)}, "
+                f"{addr if isinstance(addr, str) else hex(addr)}))")
+
+
+class ElfImage(NamedTuple):
+    """Loadable contents of an ELF file"""
+    sections: List[Tuple[int, bytes]]  # (address, data), .text first
+    text_start: int
+    text_end: int
+    symbols: Dict[str, int]            # empty if the ELF is stripped
+
+
+def read_elf(elf_file: Union[str, bytes]) -> ElfImage:
+    """Read the .text and data sections and the symbols of an ELF file (path or image bytes)"""
+    if isinstance(elf_file, (bytes, bytearray, memoryview)):
+        stream = io.BytesIO(elf_file)
+    else:
+        stream = open(elf_file, 'rb')
+    with stream as f:
+        elf = ELFFile(f)
+        
+        text_section = elf.get_section_by_name('.text')
+        if text_section is None:
+            raise ValueError("No .text section found in ELF file")
+        text_start = text_section['sh_addr']
+        text_data = text_section.data()
+        sections = [(text_start, text_data)]
+        
+        # Other sections (data, rodata, etc.)
+        for section in elf.iter_sections():
+            if section.name in ['.data', '.rodata', '.bss', '.sdata', ".init_array", ".fini_array"] and section.data_size > 0:
+                sections.append((section['sh_addr'], section.data()))
+        
+        symtab = elf.get_section_by_name('.symtab')
+        symbols = {}
+        if symtab is not None:
+            symbols = {sym.name: sym['st_value'] for sym in symtab.iter_symbols() if sym.name}
+    return ElfImage(sections, text_start, text_start + len(text_data), symbols)
+
+
+def _unpack_checkpoint_header(path: str, header: bytes) -> Tuple[int, int, int, int]:
+    """Validate a checkpoint header; returns (pc, instruction_count, text_start, text_end)"""
+    if len(header) < CHECKPOINT_HEADER.size:
+        raise ValueError(f"{path}: truncated checkpoint")
+    magic, version, pc, count, text_start, text_end = CHECKPOINT_HEADER.unpack(header)
+    if magic != CHECKPOINT_MAGIC or version != CHECKPOINT_VERSION:
+        raise ValueError(f"{path}: not a version {CHECKPOINT_VERSION} ISS checkpoint")
+    return pc, count, text_start, text_end
+
+
+def checkpoint_instruction_count(path: str) -> int:
+    """Instruction count since reset recorded in a checkpoint's header"""
+    with open(path, 'rb') as f:
+        return _unpack_checkpoint_header(path, f.read(CHECKPOINT_HEADER.size))[1]
 
 
 class RISC_V_ISS:
@@ -90,535 +1251,132 @@ class RISC_V_ISS:
     # Termination address: writing to this address terminates simulation
     TERMINATION_ADDR = 0x10000000
     
-    def __init__(self, text_start: int, stack_base: int, stack_size: int):
+    def __init__(self, text_start: int, stack_base: int, stack_size: int,
+                 mem_backend: str = 'paged'):
         self.regs = RegisterFile()
-        self.mem = Memory()
+        self.mem = MEMORY_BACKENDS[mem_backend]()
         self.pc = text_start
         self.text_start = text_start
         self.stack_base = stack_base
         self.stack_size = stack_size
         
+        # Predecoded instructions keyed by PC, valid while .text is unmodified
+        self.decode_cache: Dict[int, DecodedInstruction] = {}
+        # Translated basic blocks keyed by trace format, then start PC (--translate)
+        self.block_cache: Dict[str, Dict[int, TranslatedBlock]] = {}
+        self.handlers = make_handlers(self)
+        # Disassemble into the trace; off for formats that render mnemonics lazily
+        self.trace_mnemonics = True
+        self.text_start_addr = 0
+        self.text_end_addr = 0
+        # Symbol name -> address from the ELF .symtab (empty if stripped)
+        self.symbols: Dict[str, int] = {}
+        # Instructions executed since reset (restored from checkpoints)
+        self.instruction_count = 0
+        # Pending (instruction count, path) checkpoints, in count order
+        self.checkpoints: List[Tuple[int, str]] = []
+        
         # Initialize stack pointer
         self.regs.write(2, stack_base + stack_size)  # x2 is stack pointer
     
     def sign_extend(self, value: int, bits: int) -> int:
         """Sign extend value to 32 bits"""
-        sign_bit = 1 << (bits - 1)
-        if value & sign_bit:
-            return value | (~((1 << bits) - 1) & 0xFFFFFFFF)
-        return value & ((1 << bits) - 1)
+        return _sign_extend(value, bits)
     
     def to_signed32(self, value: int) -> int:
         """Convert 32-bit unsigned value to signed integer"""
-        value = value & 0xFFFFFFFF
-        if value & 0x80000000:
-            return value - 0x100000000
-        return value
+        return ((value & 0xFFFFFFFF) ^ 0x80000000) - 0x80000000
     
-    def decode_instruction(self, inst: int) -> Tuple[str, Dict]:
+    def decode_instruction(self, inst: int) -> Tuple[int, Dict]:
         """Decode RISC-V instruction and return (opcode, fields)"""
-        opcode = inst & 0x7F
-        rd = (inst >> 7) & 0x1F
-        funct3 = (inst >> 12) & 0x7
-        rs1 = (inst >> 15) & 0x1F
-        rs2 = (inst >> 20) & 0x1F
-        funct7 = (inst >> 25) & 0x7F
+        fields = decode_fields(inst)
+        return fields['opcode'], fields
+    
+    def predecode(self, pc: int) -> DecodedInstruction:
+        """Fetch, decode and (unless disabled) disassemble the instruction at pc into the decode cache"""
+        inst = self.mem.read_word(pc)
+        f = decode_fields(inst)
+        handler = _lookup(self.handlers, f['opcode'], f['funct3'], f['funct7']) or self.handlers[None]
+        disasm = disassemble(inst) if self.trace_mnemonics else ""
+        decoded = DecodedInstruction(
+            pc=pc,
+            next_pc=(pc + 4) & 0xFFFFFFFF,
+            disasm=disasm,
+            trace_prefix=f"0x{pc:08X};0x{inst:08X};{disasm};",
+            handler=handler,
+            **f,
+        )
+        self.decode_cache[pc] = decoded
+        return decoded
+    
+    def set_trace_mnemonics(self, enabled: bool):
+        """Switch disassembly on or off for newly decoded instructions"""
+        if enabled and not self.trace_mnemonics:
+            # Entries decoded without a mnemonic must not reach a text trace
+            self.decode_cache.clear()
+        self.trace_mnemonics = enabled
+    
+    def invalidate_decoded(self, addr: int, size: int):
+        """Drop cached decodes for words overlapping a store into .text"""
+        if addr < self.text_end_addr and addr + size > self.text_start_addr:
+            for word_addr in range(addr & ~0x3, addr + size, 4):
+                self.decode_cache.pop(word_addr, None)
+            # Blocks span many words; retranslate everything after a code write
+            for blocks in self.block_cache.values():
+                blocks.clear()
+    
+    def save_checkpoint(self, path: str):
+        """Write pc, registers, instruction count and the memory image to path"""
+        body = [_CHECKPOINT_REGS.pack(*self.regs.regs)]
+        for base, data in sorted(self.mem.image().items()):
+            body.append(_CHECKPOINT_CHUNK.pack(base, len(data)))
+            body.append(data)
+        with open(path, 'wb') as f:
+            f.write(CHECKPOINT_HEADER.pack(CHECKPOINT_MAGIC, CHECKPOINT_VERSION, self.pc,
+                                           self.instruction_count, self.text_start_addr,
+                                           self.text_end_addr))
+            f.write(zlib.compress(b''.join(body), 1))
+    
+    def restore_checkpoint(self, path: str):
+        """Replace the architectural state with the one saved in path"""
+        with open(path, 'rb') as f:
+            header = f.read(CHECKPOINT_HEADER.size)
+            payload = f.read()
+        pc, count, text_start, text_end = _unpack_checkpoint_header(path, header)
         
-        fields = {
-            'opcode': opcode,
-            'rd': rd,
-            'rs1': rs1,
-            'rs2': rs2,
-            'funct3': funct3,
-            'funct7': funct7,
-            'inst': inst
-        }
+        body = memoryview(zlib.decompress(payload))
+        # Registers and memory are updated in place: handlers and translated
+        # blocks hold references to both
+        self.regs.regs[:] = _CHECKPOINT_REGS.unpack_from(body, 0)
+        self.mem.clear()
+        pos = _CHECKPOINT_REGS.size
+        while pos < len(body):
+            base, length = _CHECKPOINT_CHUNK.unpack_from(body, pos)
+            pos += _CHECKPOINT_CHUNK.size
+            self.mem.load_data(base, body[pos:pos + length])
+            pos += length
         
-        # Extract immediates based on instruction type
-        if opcode == 0x37:  # LUI
-            imm = (inst >> 12) << 12
-            fields['imm'] = imm
-        elif opcode == 0x17:  # AUIPC
-            imm = (inst >> 12) << 12
-            fields['imm'] = imm
-        elif opcode == 0x6F:  # JAL
-            imm = ((inst >> 31) & 0x1) << 20
-            imm |= ((inst >> 21) & 0x3FF) << 1
-            imm |= ((inst >> 20) & 0x1) << 11
-            imm |= ((inst >> 12) & 0xFF) << 12
-            fields['imm'] = self.sign_extend(imm, 21)
-        elif opcode == 0x67:  # JALR
-            imm = (inst >> 20) & 0xFFF
-            fields['imm'] = self.sign_extend(imm, 12)
-        elif opcode == 0x63:  # Branch
-            imm = ((inst >> 31) & 0x1) << 12
-            imm |= ((inst >> 7) & 0x1) << 11
-            imm |= ((inst >> 25) & 0x3F) << 5
-            imm |= ((inst >> 8) & 0xF) << 1
-            fields['imm'] = self.sign_extend(imm, 13)
-        elif opcode == 0x03:  # Load
-            imm = (inst >> 20) & 0xFFF
-            fields['imm'] = self.sign_extend(imm, 12)
-        elif opcode == 0x23:  # Store
-            imm = ((inst >> 25) & 0x7F) << 5
-            imm |= ((inst >> 7) & 0x1F)
-            fields['imm'] = self.sign_extend(imm, 12)
-        elif opcode in [0x13, 0x73]:  # I-type (ALU immediate, SYSTEM)
-            imm = (inst >> 20) & 0xFFF
-            fields['imm'] = self.sign_extend(imm, 12)
-        else:
-            fields['imm'] = 0
-        
-        return opcode, fields
+        self.pc = pc
+        self.instruction_count = count
+        self.text_start_addr = text_start
+        self.text_end_addr = text_end
+        self.decode_cache.clear()
+        self.block_cache.clear()
     
     def disassemble(self, inst: int, fields: Dict) -> str:
         """Disassemble instruction to assembly string"""
-        opcode = fields['opcode']
-        rd = fields['rd']
-        rs1 = fields['rs1']
-        rs2 = fields['rs2']
-        funct3 = fields['funct3']
-        funct7 = fields['funct7']
-        imm = fields.get('imm', 0)
-        
-        # Format immediate as hex
-        def fmt_imm(val):
-            # Show as hex, using 8 digits for negative values
-            if val < 0:
-                return f"0x{val & 0xFFFFFFFF:08X}"
-            else:
-                return f"0x{val:X}"
-        
-        # LUI
-        if opcode == 0x37:
-            return f"lui {self.regs.get_name(rd)},{fmt_imm(imm >> 12)}"
-        
-        # AUIPC
-        if opcode == 0x17:
-            return f"auipc {self.regs.get_name(rd)},{fmt_imm(imm >> 12)}"
-        
-        # JAL
-        if opcode == 0x6F:
-            return f"jal {self.regs.get_name(rd)},{fmt_imm(imm)}"
-        
-        # JALR
-        if opcode == 0x67:
-            return f"jalr {self.regs.get_name(rd)},{self.regs.get_name(rs1)},{fmt_imm(imm)}"
-        
-        # Branch
-        if opcode == 0x63:
-            branch_ops = {0: 'beq', 1: 'bne', 4: 'blt', 5: 'bge', 6: 'bltu', 7: 'bgeu'}
-            op = branch_ops.get(funct3, 'unknown')
-            return f"{op} {self.regs.get_name(rs1)},{self.regs.get_name(rs2)},{fmt_imm(imm)}"
-        
-        # Load
-        if opcode == 0x03:
-            load_ops = {0: 'lb', 1: 'lh', 2: 'lw', 4: 'lbu', 5: 'lhu'}
-            op = load_ops.get(funct3, 'unknown')
-            return f"{op} {self.regs.get_name(rd)},{fmt_imm(imm)}({self.regs.get_name(rs1)})"
-        
-        # Store
-        if opcode == 0x23:
-            store_ops = {0: 'sb', 1: 'sh', 2: 'sw'}
-            op = store_ops.get(funct3, 'unknown')
-            return f"{op} {self.regs.get_name(rs2)},{fmt_imm(imm)}({self.regs.get_name(rs1)})"
-        
-        # ALU immediate
-        if opcode == 0x13:
-            if funct3 == 0:  # ADDI
-                return f"addi {self.regs.get_name(rd)},{self.regs.get_name(rs1)},{fmt_imm(imm)}"
-            elif funct3 == 1:  # SLLI
-                shamt = imm & 0x1F
-                return f"slli {self.regs.get_name(rd)},{self.regs.get_name(rs1)},{shamt}"
-            elif funct3 == 2:  # SLTI
-                return f"slti {self.regs.get_name(rd)},{self.regs.get_name(rs1)},{fmt_imm(imm)}"
-            elif funct3 == 3:  # SLTIU
-                return f"sltiu {self.regs.get_name(rd)},{self.regs.get_name(rs1)},{fmt_imm(imm)}"
-            elif funct3 == 4:  # XORI
-                return f"xori {self.regs.get_name(rd)},{self.regs.get_name(rs1)},{fmt_imm(imm)}"
-            elif funct3 == 5:
-                shamt = imm & 0x1F
-                if funct7 == 0:  # SRLI
-                    return f"srli {self.regs.get_name(rd)},{self.regs.get_name(rs1)},{shamt}"
-                elif funct7 == 0x20:  # SRAI
-                    return f"srai {self.regs.get_name(rd)},{self.regs.get_name(rs1)},{shamt}"
-            elif funct3 == 6:  # ORI
-                return f"ori {self.regs.get_name(rd)},{self.regs.get_name(rs1)},{fmt_imm(imm)}"
-            elif funct3 == 7:  # ANDI
-                return f"andi {self.regs.get_name(rd)},{self.regs.get_name(rs1)},{fmt_imm(imm)}"
-        
-        # ALU register
-        if opcode == 0x33:
-            if funct3 == 0:
-                if funct7 == 0:  # ADD
-                    return f"add {self.regs.get_name(rd)},{self.regs.get_name(rs1)},{self.regs.get_name(rs2)}"
-                elif funct7 == 0x20:  # SUB
-                    return f"sub {self.regs.get_name(rd)},{self.regs.get_name(rs1)},{self.regs.get_name(rs2)}"
-                elif funct7 == 0x01:  # MUL (M extension)
-                    return f"mul {self.regs.get_name(rd)},{self.regs.get_name(rs1)},{self.regs.get_name(rs2)}"
-            elif funct3 == 1:
-                if funct7 == 0:  # SLL
-                    return f"sll {self.regs.get_name(rd)},{self.regs.get_name(rs1)},{self.regs.get_name(rs2)}"
-                elif funct7 == 0x01:  # MULH (M extension)
-                    return f"mulh {self.regs.get_name(rd)},{self.regs.get_name(rs1)},{self.regs.get_name(rs2)}"
-            elif funct3 == 2:
-                if funct7 == 0:  # SLT
-                    return f"slt {self.regs.get_name(rd)},{self.regs.get_name(rs1)},{self.regs.get_name(rs2)}"
-                elif funct7 == 0x01:  # MULHSU (M extension)
-                    return f"mulhsu {self.regs.get_name(rd)},{self.regs.get_name(rs1)},{self.regs.get_name(rs2)}"
-            elif funct3 == 3:
-                if funct7 == 0:  # SLTU
-                    return f"sltu {self.regs.get_name(rd)},{self.regs.get_name(rs1)},{self.regs.get_name(rs2)}"
-                elif funct7 == 0x01:  # MULHU (M extension)
-                    return f"mulhu {self.regs.get_name(rd)},{self.regs.get_name(rs1)},{self.regs.get_name(rs2)}"
-            elif funct3 == 4:
-                if funct7 == 0:  # XOR
-                    return f"xor {self.regs.get_name(rd)},{self.regs.get_name(rs1)},{self.regs.get_name(rs2)}"
-                elif funct7 == 0x01:  # DIV (M extension)
-                    return f"div {self.regs.get_name(rd)},{self.regs.get_name(rs1)},{self.regs.get_name(rs2)}"
-            elif funct3 == 5:
-                if funct7 == 0:  # SRL
-                    return f"srl {self.regs.get_name(rd)},{self.regs.get_name(rs1)},{self.regs.get_name(rs2)}"
-                elif funct7 == 0x20:  # SRA
-                    return f"sra {self.regs.get_name(rd)},{self.regs.get_name(rs1)},{self.regs.get_name(rs2)}"
-                elif funct7 == 0x01:  # DIVU (M extension)
-                    return f"divu {self.regs.get_name(rd)},{self.regs.get_name(rs1)},{self.regs.get_name(rs2)}"
-            elif funct3 == 6:
-                if funct7 == 0:  # OR
-                    return f"or {self.regs.get_name(rd)},{self.regs.get_name(rs1)},{self.regs.get_name(rs2)}"
-                elif funct7 == 0x01:  # REM (M extension)
-                    return f"rem {self.regs.get_name(rd)},{self.regs.get_name(rs1)},{self.regs.get_name(rs2)}"
-            elif funct3 == 7:
-                if funct7 == 0:  # AND
-                    return f"and {self.regs.get_name(rd)},{self.regs.get_name(rs1)},{self.regs.get_name(rs2)}"
-                elif funct7 == 0x01:  # REMU (M extension)
-                    return f"remu {self.regs.get_name(rd)},{self.regs.get_name(rs1)},{self.regs.get_name(rs2)}"
-        
-        # SYSTEM (ECALL, EBREAK)
-        if opcode == 0x73:
-            if funct3 == 0:
-                if imm == 0:  # ECALL
-                    return "ecall"
-                elif imm == 1:  # EBREAK
-                    return "ebreak"
-        
-        # FENCE
-        if opcode == 0x0F:
-            return "fence"
-        
-        return f"unknown(0x{inst:08X})"
+        return disassemble(inst)
     
-    def execute_instruction(self, inst: int, fields: Dict) -> Tuple[bool, List[str]]:
+    def execute_instruction(self, decoded: DecodedInstruction) -> Tuple[bool, List[str]]:
         """Execute instruction and return (should_continue, resources_touched)"""
-        opcode = fields['opcode']
-        rd = fields['rd']
-        rs1 = fields['rs1']
-        rs2 = fields['rs2']
-        funct3 = fields['funct3']
-        funct7 = fields['funct7']
-        imm = fields.get('imm', 0)
-        
-        resources = []
         should_continue = True
-        
-        # LUI
-        if opcode == 0x37:
-            self.regs.write(rd, imm)
-            resources.append(f"{self.regs.get_name(rd)}=0x{self.regs.read(rd):08X}")
-        
-        # AUIPC
-        elif opcode == 0x17:
-            result = (self.pc + imm) & 0xFFFFFFFF
-            self.regs.write(rd, result)
-            resources.append(f"{self.regs.get_name(rd)}=0x{result:08X}")
-        
-        # JAL
-        elif opcode == 0x6F:
-            next_pc = self.pc + 4
-            self.regs.write(rd, next_pc)
-            new_pc = (self.pc + imm) & 0xFFFFFFFF
-            self.pc = new_pc
-            # Show register write even for x0 (trace format)
-            resources.append(f"{self.regs.get_name(rd)}=0x{next_pc:08X}")
-            resources.append(f"pc=0x{new_pc:08X}")
-            return should_continue, resources
-        
-        # JALR
-        elif opcode == 0x67:
-            next_pc = self.pc + 4
-            base = self.regs.read(rs1)
-            target = (base + imm) & 0xFFFFFFFE  # Clear LSB
-            self.regs.write(rd, next_pc)
-            self.pc = target
-            # Show register write even for x0 (trace format)
-            resources.append(f"{self.regs.get_name(rd)}=0x{next_pc:08X}")
-            resources.append(f"pc=0x{target:08X}")
-            return should_continue, resources
-        
-        # Branch
-        elif opcode == 0x63:
-            val1 = self.regs.read(rs1)
-            val2 = self.regs.read(rs2)
-            taken = False
-            
-            if funct3 == 0:  # BEQ
-                taken = (val1 == val2)
-            elif funct3 == 1:  # BNE
-                taken = (val1 != val2)
-            elif funct3 == 4:  # BLT (signed)
-                val1_signed = self.to_signed32(val1)
-                val2_signed = self.to_signed32(val2)
-                taken = (val1_signed < val2_signed)
-            elif funct3 == 5:  # BGE (signed)
-                val1_signed = self.to_signed32(val1)
-                val2_signed = self.to_signed32(val2)
-                taken = (val1_signed >= val2_signed)
-            elif funct3 == 6:  # BLTU (unsigned)
-                taken = (val1 < val2)
-            elif funct3 == 7:  # BGEU (unsigned)
-                taken = (val1 >= val2)
-            
-            if taken:
-                self.pc = (self.pc + imm) & 0xFFFFFFFF
-                resources.append(f"taken=true")
-                resources.append(f"pc=0x{self.pc:08X}")
-            else:
-                # Branch not taken: increment PC by 4 to next instruction
-                self.pc = (self.pc + 4) & 0xFFFFFFFF
-                resources.append(f"taken=false")
-            
-            return should_continue, resources
-        
-        # Load
-        elif opcode == 0x03:
-            base = self.regs.read(rs1)
-            addr = (base + imm) & 0xFFFFFFFF
-            
-            if funct3 == 0:  # LB
-                val = self.mem.read_byte(addr)
-                val = self.sign_extend(val, 8)
-            elif funct3 == 1:  # LH
-                val = self.mem.read_half(addr)
-                val = self.sign_extend(val, 16)
-            elif funct3 == 2:  # LW
-                val = self.mem.read_word(addr)
-            elif funct3 == 4:  # LBU
-                val = self.mem.read_byte(addr)
-            elif funct3 == 5:  # LHU
-                val = self.mem.read_half(addr)
-            else:
-                val = 0
-            
-            self.regs.write(rd, val)
-            resources.append(f"{self.regs.get_name(rd)}=0x{self.regs.read(rd):08X} // Loading from 0x{addr:08X}")
-        
-        # Store
-        elif opcode == 0x23:
-            base = self.regs.read(rs1)
-            addr = (base + imm) & 0xFFFFFFFF
-            val = self.regs.read(rs2)
-            
-            if funct3 == 0:  # SB
-                self.mem.write_byte(addr, val)
-                stored_val = val & 0xFF
-                resources.append(f"mem[0x{addr:08X}]=0x{stored_val:08X}")
-            elif funct3 == 1:  # SH
-                self.mem.write_half(addr, val)
-                stored_val = val & 0xFFFF
-                resources.append(f"mem[0x{addr:08X}]=0x{stored_val:08X}")
-            elif funct3 == 2:  # SW
-                self.mem.write_word(addr, val)
-                stored_val = val & 0xFFFFFFFF
-                resources.append(f"mem[0x{addr:08X}]=0x{stored_val:08X}")
-            
-            # Check for termination address after executing the store
-            if addr == self.TERMINATION_ADDR:
-                should_continue = False
-        
-        # ALU immediate
-        elif opcode == 0x13:
-            rs1_val = self.regs.read(rs1)
-            result = 0
-            
-            if funct3 == 0:  # ADDI
-                result = (rs1_val + imm) & 0xFFFFFFFF
-            elif funct3 == 1:  # SLLI
-                shamt = imm & 0x1F
-                result = (rs1_val << shamt) & 0xFFFFFFFF
-            elif funct3 == 2:  # SLTI
-                # Compare as signed: rs1 (signed) < imm (signed, sign-extended from 12 bits)
-                rs1_signed = self.to_signed32(rs1_val)
-                imm_signed = self.to_signed32(imm)
-                result = 1 if rs1_signed < imm_signed else 0
-            elif funct3 == 3:  # SLTIU
-                result = 1 if (rs1_val < (imm & 0xFFFFFFFF)) else 0
-            elif funct3 == 4:  # XORI
-                result = (rs1_val ^ imm) & 0xFFFFFFFF
-            elif funct3 == 5:
-                shamt = imm & 0x1F
-                if funct7 == 0:  # SRLI
-                    result = (rs1_val >> shamt) & 0xFFFFFFFF
-                elif funct7 == 0x20:  # SRAI
-                    # Arithmetic right shift: convert to signed, shift (preserves sign), mask to 32 bits
-                    rs1_signed = self.to_signed32(rs1_val)
-                    shifted = rs1_signed >> shamt
-                    # Convert back to unsigned 32-bit representation (two's complement)
-                    result = shifted % 0x100000000
-            elif funct3 == 6:  # ORI
-                result = (rs1_val | imm) & 0xFFFFFFFF
-            elif funct3 == 7:  # ANDI
-                result = (rs1_val & imm) & 0xFFFFFFFF
-            
-            self.regs.write(rd, result)
-            resources.append(f"{self.regs.get_name(rd)}=0x{self.regs.read(rd):08X}")
-        
-        # ALU register
-        elif opcode == 0x33:
-            rs1_val = self.regs.read(rs1)
-            rs2_val = self.regs.read(rs2)
-            result = 0
-            
-            if funct3 == 0:
-                if funct7 == 0:  # ADD
-                    result = (rs1_val + rs2_val) & 0xFFFFFFFF
-                elif funct7 == 0x20:  # SUB
-                    result = (rs1_val - rs2_val) & 0xFFFFFFFF
-                elif funct7 == 0x01:  # MUL (M extension)
-                    # MUL: lower 32 bits of multiplication
-                    product = (rs1_val * rs2_val) & 0xFFFFFFFF
-                    result = product
-            elif funct3 == 1:
-                if funct7 == 0:  # SLL
-                    shamt = rs2_val & 0x1F
-                    result = (rs1_val << shamt) & 0xFFFFFFFF
-                elif funct7 == 0x01:  # MULH (M extension)
-                    # MULH: upper 32 bits of signed×signed multiplication
-                    rs1_signed = self.to_signed32(rs1_val)
-                    rs2_signed = self.to_signed32(rs2_val)
-                    product = rs1_signed * rs2_signed
-                    # Get upper 32 bits (sign-extend to 64 bits, then shift right 32)
-                    result = (product >> 32) & 0xFFFFFFFF
-            elif funct3 == 2:
-                if funct7 == 0:  # SLT
-                    # Compare as signed: rs1 (signed) < rs2 (signed)
-                    rs1_signed = self.to_signed32(rs1_val)
-                    rs2_signed = self.to_signed32(rs2_val)
-                    result = 1 if rs1_signed < rs2_signed else 0
-                elif funct7 == 0x01:  # MULHSU (M extension)
-                    # MULHSU: upper 32 bits of signed×unsigned multiplication
-                    rs1_signed = self.to_signed32(rs1_val)
-                    product = rs1_signed * rs2_val
-                    # Get upper 32 bits
-                    result = (product >> 32) & 0xFFFFFFFF
-            elif funct3 == 3:
-                if funct7 == 0:  # SLTU
-                    result = 1 if (rs1_val < rs2_val) else 0
-                elif funct7 == 0x01:  # MULHU (M extension)
-                    # MULHU: upper 32 bits of unsigned×unsigned multiplication
-                    product = rs1_val * rs2_val
-                    # Get upper 32 bits
-                    result = (product >> 32) & 0xFFFFFFFF
-            elif funct3 == 4:
-                if funct7 == 0:  # XOR
-                    result = (rs1_val ^ rs2_val) & 0xFFFFFFFF
-                elif funct7 == 0x01:  # DIV (M extension)
-                    # DIV: signed division (rounds toward zero)
-                    rs1_signed = self.to_signed32(rs1_val)
-                    rs2_signed = self.to_signed32(rs2_val)
-                    if rs2_signed == 0:
-                        # Division by zero: return all 1s
-                        result = 0xFFFFFFFF
-                    elif rs1_signed == -0x80000000 and rs2_signed == -1:
-                        # Overflow: most negative / -1
-                        result = 0x80000000  # Equal to dividend
-                    else:
-                        # Normal division (rounds toward zero)
-                        # Python's // rounds toward -infinity, so we need truncation toward zero
-                        # For truncation: if signs differ and there's a remainder, round up
-                        quotient = rs1_signed // rs2_signed
-                        # If signs differ and there's a remainder, we need to round toward zero (up)
-                        if (rs1_signed < 0) != (rs2_signed < 0) and (rs1_signed % rs2_signed != 0):
-                            quotient += 1
-                        result = quotient % 0x100000000
-            elif funct3 == 5:
-                if funct7 == 0:  # SRL
-                    shamt = rs2_val & 0x1F
-                    result = (rs1_val >> shamt) & 0xFFFFFFFF
-                elif funct7 == 0x20:  # SRA
-                    # Arithmetic right shift: convert to signed, shift (preserves sign), mask to 32 bits
-                    shamt = rs2_val & 0x1F
-                    rs1_signed = self.to_signed32(rs1_val)
-                    shifted = rs1_signed >> shamt
-                    # Convert back to unsigned 32-bit representation (two's complement)
-                    result = shifted % 0x100000000
-                elif funct7 == 0x01:  # DIVU (M extension)
-                    # DIVU: unsigned division
-                    if rs2_val == 0:
-                        # Division by zero: return all 1s
-                        result = 0xFFFFFFFF
-                    else:
-                        result = (rs1_val // rs2_val) & 0xFFFFFFFF
-            elif funct3 == 6:
-                if funct7 == 0:  # OR
-                    result = (rs1_val | rs2_val) & 0xFFFFFFFF
-                elif funct7 == 0x01:  # REM (M extension)
-                    # REM: signed remainder (sign of result = sign of dividend)
-                    rs1_signed = self.to_signed32(rs1_val)
-                    rs2_signed = self.to_signed32(rs2_val)
-                    if rs2_signed == 0:
-                        # Division by zero: remainder equals dividend
-                        result = rs1_val
-                    elif rs1_signed == -0x80000000 and rs2_signed == -1:
-                        # Overflow: remainder is 0
-                        result = 0
-                    else:
-                        # Normal remainder: compute using truncating division
-                        # remainder = dividend - quotient * divisor
-                        # where quotient rounds toward zero
-                        quotient = rs1_signed // rs2_signed
-                        # If signs differ and there's a remainder, adjust quotient for truncation
-                        if (rs1_signed < 0) != (rs2_signed < 0) and (rs1_signed % rs2_signed != 0):
-                            quotient += 1
-                        remainder = rs1_signed - quotient * rs2_signed
-                        result = remainder % 0x100000000
-            elif funct3 == 7:
-                if funct7 == 0:  # AND
-                    result = (rs1_val & rs2_val) & 0xFFFFFFFF
-                elif funct7 == 0x01:  # REMU (M extension)
-                    # REMU: unsigned remainder
-                    if rs2_val == 0:
-                        # Division by zero: remainder equals dividend
-                        result = rs1_val
-                    else:
-                        result = (rs1_val % rs2_val) & 0xFFFFFFFF
-            
-            self.regs.write(rd, result)
-            resources.append(f"{self.regs.get_name(rd)}=0x{self.regs.read(rd):08X}")
-        
-        # SYSTEM (ECALL, EBREAK)
-        elif opcode == 0x73:
-            if funct3 == 0:
-                if imm == 0:  # ECALL
-                    should_continue = True
-                    resources.append("ecall")
-                elif imm == 1:  # EBREAK
-                    should_continue = True
-                    resources.append("ebreak")
-        
-        # FENCE
-        elif opcode == 0x0F:
-            # FENCE is a NOP for our purposes
-            pass
-        
-        # Invalid instruction
-        #else:
-        #    raise ValueError(f"Invalid instruction: 0x{inst:08X} at PC 0x{self.pc:08X} (opcode: 0x{opcode:02X})")
-        
-        # Update PC (unless it was modified by branch/jump)
-        if opcode not in [0x6F, 0x67, 0x63]:
-            self.pc = (self.pc + 4) & 0xFFFFFFFF
-        
-        return should_continue, resources
+        try:
+            self.pc, kind, rd, value, addr = decoded.handler(decoded)
+        except SimulationHalt as halt:
+            self.pc, kind, rd, value, addr = halt.effect
+            should_continue = False
+        resources = format_effect(kind, rd, value, addr)
+        return should_continue, resources.split(";") if resources else []
     
     def load_hex_file(self, hex_file: str, base_addr: int = 0):
         """Load hex file into memory starting at base address.
@@ -627,118 +1385,558 @@ class RISC_V_ISS:
         Words are stored as little-endian bytes in memory.
         """
         with open(hex_file, 'r') as f:
-            addr = base_addr
-            for line in f:
-                line = line.strip()
-                if not line:
-                    continue
-                # Parse hex value (8 hex digits)
-                word = int(line, 16) & 0xFFFFFFFF
-                # Store as little-endian bytes
-                self.mem.write_word(addr, word)
-                addr += 4
-    
-    def run(self, elf_file: str, output_file: str, hex_file: Optional[str] = None):
-        """Load ELF and execute instructions"""
+            # Parse hex values (8 hex digits)
+            words = [int(line, 16) & 0xFFFFFFFF for line in f if line.strip()]
+        # Store as little-endian bytes in a single bulk load
+        self.mem.load_data(base_addr, struct.pack(f'<{len(words)}I', *words))
+    
+    def load_elf(self, elf_file: Union[str, bytes]):
+        """Load .text and data sections from an ELF file (path or image bytes) and record the .text bounds"""
+        image = read_elf(elf_file)
+        for addr, data in image.sections:
+            self.mem.load_data(addr, data)
+        self.symbols = image.symbols
+        
+        # Text section bounds (where we actually loaded it - from ELF, not entry point)
+        # This allows jumping backwards to instructions before the entry point
+        self.text_start_addr = image.text_start
+        self.text_end_addr = image.text_end
+        self.decode_cache.clear()
+        self.block_cache.clear()
+    
+    def load_program(self, elf_file: Union[str, bytes], hex_file: Optional[str] = None,
+                     restore: Optional[str] = None):
+        """Load memory and ELF, then reset to the entry point or restore a checkpoint"""
         # Load hex file first (preload data memory)
         if hex_file:
             self.load_hex_file(hex_file, base_addr=0)
         
-        # Load ELF file
-        text_size = 0
-        with open(elf_file, 'rb') as f:
-            elf = ELFFile(f)
-            
-            # Get entry point and text section base from ELF
-            entry_point = elf.header['e_entry']
-            
-            # Load text section
-            text_section = elf.get_section_by_name('.text')
-            if text_section is None:
-                raise ValueError("No .text section found in ELF file")
-            
-            text_section_addr = text_section['sh_addr']
-            text_data = text_section.data()
-            text_size = len(text_data)
-            
-            # Load text section into memory at its ELF base address (word-aligned array)
-            self.mem.load_data(text_section_addr, text_data)
-            
-            # Load other sections (data, rodata, etc.)
-            for section in elf.iter_sections():
-                if section.name in ['.data', '.rodata', '.bss', '.sdata', ".init_array", ".fini_array"] and section.data_size > 0:
-                    addr = section['sh_addr']
-                    data = section.data()
-                    self.mem.load_data(addr, data)
-
-        # Entry point from command line (self.text_start) is >= text_section_addr
-        # Since we loaded at text_section_addr, PC is simply the entry point
-        self.pc = self.text_start
+        self.load_elf(elf_file)
         
-        # Text section bounds (where we actually loaded it - from ELF, not entry point)
-        # This allows jumping backwards to instructions before the entry point
-        text_start_addr = text_section_addr
-        text_end_addr = text_section_addr + text_size
+        if restore:
+            self.restore_checkpoint(restore)
+        else:
+            # Entry point from command line (self.text_start) is >= text_section_addr
+            # Since we loaded at text_section_addr, PC is simply the entry point
+            self.pc = self.text_start
+            self.instruction_count = 0
+    
+    def run(self, elf_file: Union[str, bytes], output_file: Union[str, IO, TraceWriter],
+            hex_file: Optional[str] = None, max_instructions: Optional[int] = None,
+            translate: bool = False, trace_format: str = 'text',
+            windows: Optional[TraceWindows] = None, checkpoint_at: Sequence[int] = (),
+            checkpoint_file: str = 'iss.ckpt', restore: Optional[str] = None) -> Tuple[int, bool]:
+        """Load ELF and execute instructions (max_instructions=None means no limit).
+        
+        elf_file is a path or the ELF image as bytes. output_file is a path or
+        stream, written in trace_format, or a TraceWriter sink supplied by the
+        caller (flushed, not closed; trace_format is then ignored). windows
+        restricts tracing to fast-forwarded/sampled regions.
         
-        # Execute instructions
-        trace_lines = []
-        max_instructions = 1000000  # Safety limit
+        restore resumes from a checkpoint file instead of the ELF entry point
+        (the ELF still provides symbols). checkpoint_at lists instruction
+        counts since reset at which the state is saved to checkpoint_file,
+        formatted with {count}; execution stops after the last one.
+        Returns (instruction_count, program_finished) for this run.
+        """
+        if isinstance(output_file, TraceWriter):
+            trace = output_file
+        else:
+            trace = TRACE_FORMATS[trace_format](output_file)
+        # Set before loading: the decode cache is rebuilt by load_elf
+        self.trace_mnemonics = trace.MNEMONICS
+        self.load_program(elf_file, hex_file, restore)
+        
+        # Execute instructions, streaming the trace to disk as we go
+        limit = float('inf') if max_instructions is None else max_instructions
+        self.checkpoints = sorted((count, checkpoint_file.format(count=count))
+                                  for count in checkpoint_at)
+        if self.checkpoints:
+            if self.checkpoints[0][0] < self.instruction_count:
+                raise ValueError(f"Checkpoint at {self.checkpoints[0][0]} precedes the "
+                                 f"restored instruction count {self.instruction_count}")
+            limit = min(limit, self.checkpoints[-1][0] - self.instruction_count)
+        try:
+            if windows is not None:
+                instruction_count, finished = self.run_windows(trace, limit, translate, windows)
+            elif isinstance(trace, BbvCollector):
+                instruction_count, finished = self.run_intervals(trace, limit, translate)
+            else:
+                instruction_count, finished = self.execute(trace, limit, translate)
+        finally:
+            if trace is output_file:
+                trace.flush()
+            else:
+                trace.close()
+        
+        if not finished and max_instructions is not None and instruction_count >= max_instructions:
+            print(f"Warning: instruction limit ({max_instructions}) reached at PC "
+                  f"0x{self.pc:08X}; trace truncated", file=sys.stderr)
+        return instruction_count, finished
+    
+    def execute(self, trace: TraceWriter, limit: float, translate: bool = False,
+                stop_pc: Optional[int] = None) -> Tuple[int, bool]:
+        """Run from self.pc with either engine (see run_interpreted), saving
+        pending checkpoints on the way and advancing self.instruction_count"""
+        engine = self.run_translated if translate else self.run_interpreted
+        total = 0
+        while self.checkpoints and self.checkpoints[0][0] - self.instruction_count <= limit - total:
+            count, path = self.checkpoints[0]
+            executed, finished = engine(trace, count - self.instruction_count, stop_pc)
+            total += executed
+            self.instruction_count += executed
+            if self.instruction_count < count:
+                # Program ended or stop_pc reached first
+                return total, finished
+            self.save_checkpoint(path)
+            self.checkpoints.pop(0)
+        executed, finished = engine(trace, limit - total, stop_pc)
+        self.instruction_count += executed
+        return total + executed, finished
+    
+    def run_windows(self, trace: TraceWriter, limit: float, translate: bool,
+                    windows: TraceWindows) -> Tuple[int, bool]:
+        """Fast-forward untraced, then trace the windows of the plan"""
+        untraced = NullTraceWriter()
+        start_pc = windows.start_pc
+        if windows.start_symbol is not None:
+            if windows.start_symbol not in self.symbols:
+                raise ValueError(f"Symbol not found in ELF: {windows.start_symbol}")
+            start_pc = self.symbols[windows.start_symbol]
+        
+        self.set_trace_mnemonics(False)
         instruction_count = 0
+        if start_pc is not None:
+            instruction_count, finished = self.execute(untraced, limit, translate, start_pc)
+            if self.pc != start_pc:
+                return instruction_count, finished
+        if windows.start_count:
+            executed, finished = self.execute(
+                untraced, min(limit - instruction_count, windows.start_count), translate)
+            instruction_count += executed
+            if finished:
+                return instruction_count, True
         
-        while instruction_count < max_instructions:
-            # Check if PC is within text section bounds before fetching
-            # Only execute instructions from the actual text section address range
-            if self.pc < text_start_addr or self.pc >= text_end_addr:
-                # PC is outside the text section, stop execution
-                break
-            
-            # Fetch instruction
-            if self.pc % 4 != 0:
-                raise ValueError(f"Misaligned PC: 0x{self.pc:08X}")
-            
-            # Save PC immediately after checking alignment (before fetching)
-            instruction_pc = self.pc
-            
-            inst = self.mem.read_word(self.pc)
-            
-            # Check for invalid instruction (all zeros or all ones) - but only warn if within bounds
-            if inst == 0 or inst == 0xFFFFFFFF:
-                # This might be padding or end of program, silently stop
-                break
-            
-            # Check for NOP (ADDI x0, x0, 0 = 0x00000013)
-            # NOPs don't touch microarchitectural state, so skip tracing
-            if inst == 0x00000013:
-                # Execute NOP (just updates PC)
-                opcode, fields = self.decode_instruction(inst)
-                should_continue, _ = self.execute_instruction(inst, fields)
-                if not should_continue:
+        length = float('inf') if windows.length is None else windows.length
+        while instruction_count < limit:
+            self.set_trace_mnemonics(trace.MNEMONICS)
+            executed, finished = self.execute(trace, min(limit - instruction_count, length), translate)
+            instruction_count += executed
+            if finished or windows.every is None:
+                return instruction_count, finished
+            # Untraced gap up to the start of the next window
+            self.set_trace_mnemonics(False)
+            gap = min(limit - instruction_count, windows.every - executed)
+            executed, finished = self.execute(untraced, gap, translate)
+            instruction_count += executed
+            if finished:
+                return instruction_count, True
+        return instruction_count, False
+    
+    def run_intervals(self, trace: 'BbvCollector', limit: float,
+                      translate: bool) -> Tuple[int, bool]:
+        """Execute in intervals of trace.interval instructions, marking their boundaries"""
+        instruction_count = 0
+        while instruction_count < limit:
+            trace.start_interval(self.pc, self.instruction_count)
+            executed, finished = self.execute(
+                trace, min(limit - instruction_count, trace.interval), translate)
+            instruction_count += executed
+            trace.end_interval(executed)
+            if finished:
+                return instruction_count, True
+        return instruction_count, False
+    
+    def run_interpreted(self, trace: TraceWriter, limit: float,
+                        stop_pc: Optional[int] = None) -> Tuple[int, bool]:
+        """Interpret up to limit instructions, or until pc == stop_pc.
+        
+        Returns (instruction_count, program_finished).
+        """
+        text_start_addr = self.text_start_addr
+        text_end_addr = self.text_end_addr
+        decode_cache = self.decode_cache
+        record = trace.record
+        nop = trace.nop
+        pc = self.pc
+        instruction_count = 0
+        
+        try:
+            while instruction_count < limit:
+                if pc == stop_pc:
+                    return instruction_count, False
+                
+                # Check if PC is within text section bounds before fetching
+                # Only execute instructions from the actual text section address range
+                if pc < text_start_addr or pc >= text_end_addr:
+                    # PC is outside the text section, stop execution
                     break
+                
+                if pc & 0x3:
+                    raise ValueError(f"Misaligned PC: 0x{pc:08X}")
+                
+                # Fetch and decode only on a decode cache miss
+                decoded = decode_cache.get(pc)
+                if decoded is None:
+                    decoded = self.predecode(pc)
+                inst = decoded.inst
+                
+                # Check for invalid instruction (all zeros or all ones)
+                if inst == 0 or inst == 0xFFFFFFFF:
+                    # This might be padding or end of program, silently stop
+                    break
+                
+                pc, kind, rd, value, addr = decoded.handler(decoded)
                 instruction_count += 1
-                continue
+                
+                # NOPs (ADDI x0, x0, 0) are not traced (the RTL does not log them);
+                # sinks that time the stream still see them
+                if inst != 0x00000013:
+                    record(decoded, kind, rd, value, addr)
+                else:
+                    nop(decoded)
+            else:
+                return instruction_count, False
+        except SimulationHalt as halt:
+            # The store to the termination address is traced, then execution stops
+            pc, kind, rd, value, addr = halt.effect
+            instruction_count += 1
+            record(decoded, kind, rd, value, addr)
+        finally:
+            self.pc = pc
+        
+        return instruction_count, True
+    
+    def run_translated(self, trace: TraceWriter, limit: float,
+                       stop_pc: Optional[int] = None) -> Tuple[int, bool]:
+        """Execute through translated basic blocks; same contract as run_interpreted"""
+        translator = BlockTranslator(self, trace.FORMAT, trace.BUFFERED)
+        text_start_addr = self.text_start_addr
+        text_end_addr = self.text_end_addr
+        regs = self.regs.regs
+        # Blocks append straight to the writer's buffer; flush between blocks
+        emit = trace.buffer.append if trace.BUFFERED else trace
+        buffer = trace.buffer
+        chunk_lines = trace.chunk_lines
+        instruction_count = 0
+        
+        while True:
+            pc = self.pc
+            if pc == stop_pc:
+                return instruction_count, False
+            if pc < text_start_addr or pc >= text_end_addr:
+                return instruction_count, True
+            if pc % 4 != 0:
+                raise ValueError(f"Misaligned PC: 0x{pc:08X}")
             
-            # Decode
-            opcode, fields = self.decode_instruction(inst)
+            block = translator.cache.get(pc)
+            if block is None:
+                block = translator.translate(pc)
+                if block is None:
+                    # Invalid instruction at the block head ends the program
+                    return instruction_count, True
             
-            # Disassemble
-            disasm = self.disassemble(inst, fields)
+            if instruction_count + block.length > limit:
+                # Not enough budget left for the whole block: finish by interpretation
+                executed, finished = self.run_interpreted(trace, limit - instruction_count, stop_pc)
+                return instruction_count + executed, finished
             
-            # Execute
-            should_continue, resources = self.execute_instruction(inst, fields)
+            if stop_pc is not None and pc < stop_pc < pc + 4 * block.length:
+                # Stop point inside the block: step through it by interpretation
+                executed, finished = self.run_interpreted(trace, block.length, stop_pc)
+                instruction_count += executed
+                if finished or self.pc == stop_pc:
+                    return instruction_count, finished
+                continue
             
-            # Generate trace line using the saved PC (before execution)
-            resources_str = ";".join(resources) if resources else ""
-            trace_line = f"0x{instruction_pc:08X};0x{inst:08X};{disasm};{resources_str}"
-            trace_lines.append(trace_line)
+            self.pc, executed, halted = block.run(regs, emit)
+            instruction_count += executed
+            if len(buffer) >= chunk_lines:
+                trace.flush()
+            if halted:
+                return instruction_count, True
+
+
+# Profiler instruction classes
+PROFILE_CLASSES = ('alu', 'mul', 'div', 'load', 'store', 'branch_taken', 'branch_not_taken',
+                   'jump', 'system')
+CLS_ALU, CLS_MUL, CLS_DIV, CLS_LOAD, CLS_STORE, CLS_TAKEN, CLS_NOT_TAKEN, \
+    CLS_JUMP, CLS_SYSTEM = range(len(PROFILE_CLASSES))
+CLS_BRANCH = -1    # resolved to taken/not taken from the effect
+
+
+def instruction_class(d: DecodedInstruction) -> int:
+    """Profiler class of a decoded instruction (CLS_BRANCH for conditional branches)"""
+    op = d.opcode
+    if op == 0x33 and d.funct7 == 0x01:
+        return CLS_MUL if d.funct3 < 4 else CLS_DIV
+    if op in (0x13, 0x33, 0x37, 0x17):
+        return CLS_ALU
+    if op == 0x03:
+        return CLS_LOAD
+    if op == 0x23:
+        return CLS_STORE
+    if op == 0x63:
+        return CLS_BRANCH
+    if op in (0x6F, 0x67):
+        return CLS_JUMP
+    return CLS_SYSTEM
+
+
+def load_functions(elf_file: Union[str, bytes]) -> Tuple[List[int], List[str]]:
+    """Sorted start addresses and names of the code symbols in .symtab"""
+    if isinstance(elf_file, (bytes, bytearray, memoryview)):
+        stream = io.BytesIO(elf_file)
+    else:
+        stream = open(elf_file, 'rb')
+    symbols: Dict[int, Tuple[bool, str]] = {}
+    with stream as f:
+        elf = ELFFile(f)
+        text = elf.get_section_by_name('.text')
+        symtab = elf.get_section_by_name('.symtab')
+        if text is None or symtab is None:
+            return [], []
+        start, end = text['sh_addr'], text['sh_addr'] + text['sh_size']
+        for sym in symtab.iter_symbols():
+            name, addr = sym.name, sym['st_value']
+            kind = sym['st_info']['type']
+            # Skip mapping symbols ($x) and assembler-local labels
+            if (not name or name.startswith(('$', '.L')) or kind not in ('STT_FUNC', 'STT_NOTYPE')
+                    or not start <= addr < end):
+                continue
+            # Prefer function symbols over plain labels at the same address
+            is_func = kind == 'STT_FUNC'
+            if addr not in symbols or (is_func and not symbols[addr][0]):
+                symbols[addr] = (is_func, name)
+    addresses = sorted(symbols)
+    return addresses, [symbols[addr][1] for addr in addresses]
+
+
+class Profiler(TeeSink):
+    """Function-level profiler sink, optionally teeing into another trace sink.
+    
+    Each traced instruction is attributed to the .symtab symbol at or below
+    its PC and counted per PROFILE_CLASSES entry. JAL/JALR that write a link
+    register are calls (recorded as caller -> callee edges and pushed on a
+    shadow stack); JALR x0 through ra is a return. Like the trace, the
+    profile covers traced instructions only (NOPs and untraced windows are
+    not counted).
+    """
+    FORMAT = 'profile'
+    UNKNOWN = '[unknown]'
+    
+    def __init__(self, elf_file: Union[str, bytes], inner: Optional[TraceWriter] = None):
+        super().__init__(inner)
+        self.addresses, self.names = load_functions(elf_file)
+        self.names.append(self.UNKNOWN)
+        self.counts = [[0] * len(PROFILE_CLASSES) for _ in self.names]
+        self.edges: Dict[Tuple[int, int], int] = {}
+        self.stacks: Dict[Tuple[int, ...], int] = {}
+        self.stack: Tuple[int, ...] = ()
+        # pc -> (instruction word, function index, class)
+        self.pc_info: Dict[int, Tuple[int, int, int]] = {}
+    
+    def function_at(self, pc: int) -> int:
+        """Index of the function containing pc (the UNKNOWN entry if none)"""
+        index = bisect.bisect_right(self.addresses, pc) - 1
+        return index if index >= 0 else len(self.names) - 1
+    
+    def record(self, d: DecodedInstruction, kind: int, rd: int, value: int, addr: int):
+        """Forward to the inner sink and account the instruction"""
+        self.inner.record(d, kind, rd, value, addr)
+        info = self.pc_info.get(d.pc)
+        if info is None or info[0] != d.inst:
+            info = self.pc_info[d.pc] = (d.inst, self.function_at(d.pc), instruction_class(d))
+        _, function, cls = info
+        if cls == CLS_BRANCH:
+            cls = CLS_TAKEN if kind == EFF_TAKEN else CLS_NOT_TAKEN
+        self.counts[function][cls] += 1
+        
+        stack = self.stack
+        if not stack or stack[-1] != function:
+            # Fall-through or tail jump into another function replaces the leaf
+            stack = self.stack = stack[:-1] + (function,)
+        self.stacks[stack] = self.stacks.get(stack, 0) + 1
+        
+        if cls == CLS_JUMP:
+            if rd:
+                callee = self.function_at(addr)
+                edge = (function, callee)
+                self.edges[edge] = self.edges.get(edge, 0) + 1
+                self.stack = stack + (callee,)
+            elif d.opcode == 0x67 and d.rs1 == 1 and len(stack) > 1:
+                self.stack = stack[:-1]
+    
+    def report(self) -> Dict:
+        """Profile as a JSON-serializable dict, hottest functions first"""
+        functions = []
+        for index, counts in enumerate(self.counts):
+            total = sum(counts)
+            if not total:
+                continue
+            address = self.addresses[index] if index < len(self.addresses) else None
+            functions.append({
+                'name': self.names[index],
+                'address': None if address is None else f"0x{address:08X}",
+                'instructions': total,
+                'classes': dict(zip(PROFILE_CLASSES, counts)),
+            })
+        functions.sort(key=lambda entry: -entry['instructions'])
+        edges = [{'caller': self.names[caller], 'callee': self.names[callee], 'count': count}
+                 for (caller, callee), count in self.edges.items()]
+        edges.sort(key=lambda entry: -entry['count'])
+        return {
+            'total_instructions': sum(entry['instructions'] for entry in functions),
+            'functions': functions,
+            'call_edges': edges,
+        }
+    
+    def write_json(self, path: str):
+        with open(path, 'w') as f:
+            json.dump(self.report(), f, indent=2)
+            f.write('\n')
+    
+    def write_collapsed(self, path: str):
+        """Collapsed stacks ("main;f;g count" per line) for flamegraph.pl / speedscope"""
+        with open(path, 'w') as f:
+            for stack, count in sorted(self.stacks.items()):
+                f.write(';'.join(self.names[index] for index in stack) + f" {count}\n")
+
+
+class BbvCollector(TeeSink):
+    """Basic-block vector sink for SimPoint-style sampling, optionally teeing into another sink.
+    
+    run() executes with this sink in intervals of `interval` instructions and
+    brackets each with start_interval()/end_interval(). Within an interval,
+    every traced instruction is counted against the leader of its basic
+    block (the first instruction after a branch, jump or system
+    instruction), so each vector entry is block executions times block size.
+    Blocks are numbered from 1 in order of first execution, as SimPoint
+    expects.
+    """
+    FORMAT = 'bbv'
+    
+    def __init__(self, interval: int, inner: Optional[TraceWriter] = None):
+        if interval <= 0:
+            raise ValueError("BBV interval must be positive")
+        super().__init__(inner)
+        self.interval = interval
+        self.block_ids: Dict[int, int] = {}     # leader PC -> block id
+        self.leader = None                      # None: the next instruction starts a block
+        self.current: Dict[int, int] = {}
+        self.start: Tuple[int, int] = (0, 0)
+        # (start PC, instruction count at start, executed instructions, {block id: count})
+        self.intervals: List[Tuple[int, int, int, Dict[int, int]]] = []
+    
+    def record(self, d: DecodedInstruction, kind: int, rd: int, value: int, addr: int):
+        """Forward to the inner sink and count the instruction against its block"""
+        self.inner.record(d, kind, rd, value, addr)
+        leader = self.leader
+        if leader is None:
+            leader = self.block_ids.get(d.pc)
+            if leader is None:
+                leader = self.block_ids[d.pc] = len(self.block_ids) + 1
+        current = self.current
+        current[leader] = current.get(leader, 0) + 1
+        # Branches, jumps and ecall/ebreak end the block
+        self.leader = None if d.opcode in (0x63, 0x6F, 0x67, 0x73) else leader
+    
+    def start_interval(self, pc: int, instruction_count: int):
+        self.start = (pc, instruction_count)
+        self.current = {}
+    
+    def end_interval(self, executed: int):
+        if executed:
+            self.intervals.append(self.start + (executed, self.current))
+        self.current = {}
+    
+    def write_bbv(self, path: str):
+        """Write the vectors in SimPoint's frequency vector format ("T:id:count :id:count ...")
+        and the interval start points and block leaders to path + '.json'"""
+        with open(path, 'w') as f:
+            for _, _, _, vector in self.intervals:
+                f.write('T' + ''.join(f":{block}:{count} " for block, count in sorted(vector.items())) + '\n')
+        leaders = sorted(self.block_ids, key=self.block_ids.get)
+        with open(path + '.json', 'w') as f:
+            json.dump({
+                'interval': self.interval,
+                'blocks': [f"0x{pc:08X}" for pc in leaders],
+                'intervals': [{'start_pc': f"0x{pc:08X}", 'start_count': count, 'length': length}
+                              for pc, count, length, _ in self.intervals],
+            }, f, indent=2)
+            f.write('\n')
+
+
+def _trace_segment(config: Tuple, checkpoint: Optional[str], length: int, output_file: str) -> int:
+    """Trace length instructions from a checkpoint (None: from reset) into output_file"""
+    elf_file, hex_file, text_start, stack_base, stack_size, mem_backend, translate, trace_format = config
+    iss = RISC_V_ISS(text_start, stack_base, stack_size, mem_backend)
+    trace = TRACE_FORMATS[trace_format](output_file)
+    iss.trace_mnemonics = trace.MNEMONICS
+    iss.load_program(elf_file, hex_file, checkpoint)
+    with trace:
+        executed, _ = iss.execute(trace, length, translate)
+    return executed
+
+
+def run_segmented(elf_file: str, output_file: str, text_start: int, stack_base: int,
+                  stack_size: int, hex_file: Optional[str] = None, segment_length: int = 100000,
+                  jobs: Optional[int] = None, translate: bool = False, trace_format: str = 'text',
+                  mem_backend: str = 'paged') -> int:
+    """Two-pass parallel trace generation; the output is byte-identical to a serial run.
+    
+    The first pass executes untraced (through translated blocks) in this
+    process and checkpoints every segment_length instructions. Each segment
+    is traced from its checkpoint in a worker process as soon as the
+    checkpoint exists, and the segment traces are concatenated in order.
+    Returns the total instruction count.
+    """
+    config = (elf_file, hex_file, text_start, stack_base, stack_size, mem_backend,
+              translate, trace_format)
+    workdir = tempfile.mkdtemp(prefix='iss-segments-', dir=os.path.dirname(os.path.abspath(output_file)))
+    try:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=jobs or os.cpu_count()) as pool:
+            segments = [pool.submit(_trace_segment, config, None, segment_length,
+                                    os.path.join(workdir, 'segment0'))]
             
-            if not should_continue:
-                break
+            iss = RISC_V_ISS(text_start, stack_base, stack_size, mem_backend)
+            iss.trace_mnemonics = False
+            iss.load_program(elf_file, hex_file)
+            untraced = NullTraceWriter()
+            while True:
+                _, finished = iss.execute(untraced, segment_length, translate=True)
+                if finished:
+                    break
+                index = len(segments)
+                checkpoint = os.path.join(workdir, f'segment{index}.ckpt')
+                iss.save_checkpoint(checkpoint)
+                segments.append(pool.submit(_trace_segment, config, checkpoint, segment_length,
+                                            os.path.join(workdir, f'segment{index}')))
             
-            instruction_count += 1
+            # Propagate worker failures before touching the output
+            total = sum(segment.result() for segment in segments)
         
-        # Write trace file
-        with open(output_file, 'w') as f:
-            f.write('\n'.join(trace_lines))
+        binary = TRACE_FORMATS[trace_format] is BinaryTraceWriter
+        with open(output_file, 'wb') as out:
+            wrote_lines = False
+            for index in range(len(segments)):
+                with open(os.path.join(workdir, f'segment{index}'), 'rb') as part:
+                    if binary:
+                        # Keep the header of the first segment only
+                        header = part.read(TRACE_HEADER.size)
+                        if index == 0:
+                            out.write(header)
+                    elif part.read(1):
+                        # Text segments have no trailing newline: join them with one
+                        if wrote_lines:
+                            out.write(b'\n')
+                        wrote_lines = True
+                        part.seek(0)
+                    shutil.copyfileobj(part, out)
+        return total
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
 
 def main():
     parser = argparse.ArgumentParser(
@@ -792,10 +1990,213 @@ Examples:
         help='Hex file to preload data memory (one 32-bit word per line, starting at address 0x0)'
     )
     
+    parser.add_argument(
+        '--mem-backend',
+        default='paged',
+        choices=sorted(MEMORY_BACKENDS),
+        help='Memory model: 4 KiB bytearray pages or one dict entry per byte (default: paged)'
+    )
+    
+    parser.add_argument(
+        '--max-instructions',
+        default=None,
+        type=int,
+        metavar='N',
+        help='Stop after N executed instructions (default: no limit)'
+    )
+    
+    parser.add_argument(
+        '--translate',
+        action='store_true',
+        help='Execute through compiled basic blocks instead of the interpreter (same trace)'
+    )
+    
+    parser.add_argument(
+        '--trace-format',
+        default='text',
+        choices=sorted(TRACE_FORMATS),
+        help='Trace encoding: text lines, text without mnemonics (raw), packed '
+             'binary records, or none to execute without a trace (default: text)'
+    )
+    
+    parser.add_argument(
+        '--checkpoint-at',
+        action='append',
+        default=[],
+        type=int,
+        metavar='N',
+        help='Save the state after N instructions since reset and stop after the last '
+             'checkpoint (repeatable)'
+    )
+    
+    parser.add_argument(
+        '--checkpoint-file',
+        default='iss.ckpt',
+        metavar='PATH',
+        help='Checkpoint output path; {count} is replaced by the instruction count '
+             '(required with several --checkpoint-at)'
+    )
+    
+    parser.add_argument(
+        '--restore',
+        default=None,
+        metavar='CHECKPOINT',
+        help='Resume from a checkpoint instead of the ELF entry point'
+    )
+    
+    parser.add_argument(
+        '--segment',
+        default=None,
+        type=int,
+        metavar='N',
+        help='Generate the trace in parallel: checkpoint every N instructions in an '
+             'untraced first pass, trace the segments in worker processes and '
+             'concatenate them (same output as a serial run)'
+    )
+    
+    parser.add_argument(
+        '-j', '--jobs',
+        default=None,
+        type=int,
+        metavar='J',
+        help='Worker processes for --segment (default: CPU count)'
+    )
+    
+    parser.add_argument(
+        '--profile',
+        default=None,
+        metavar='JSON_FILE',
+        help='Write a per-function profile (instruction classes, call edges) of the traced instructions'
+    )
+    
+    parser.add_argument(
+        '--profile-stacks',
+        default=None,
+        metavar='FOLDED_FILE',
+        help='Write collapsed call stacks for flamegraphs'
+    )
+    
+    parser.add_argument(
+        '--bbv',
+        default=None,
+        metavar='BB_FILE',
+        help='Write basic-block vectors per --bbv-interval instructions in SimPoint '
+             'format, with the interval start points in BB_FILE.json'
+    )
+    
+    parser.add_argument(
+        '--bbv-interval',
+        default=1000000,
+        type=int,
+        metavar='N',
+        help='Instructions per basic-block vector (default: 1000000)'
+    )
+    
+    window_group = parser.add_argument_group(
+        'trace windows',
+        'Execute untraced up to a start point, then trace only sampled windows')
+    start = window_group.add_mutually_exclusive_group()
+    start.add_argument(
+        '--start-pc',
+        default=None,
+        type=lambda x: int(x, 16),
+        metavar='ADDR',
+        help='Start tracing when execution first reaches this PC (hex)'
+    )
+    start.add_argument(
+        '--start-symbol',
+        default=None,
+        metavar='NAME',
+        help='Start tracing when execution first reaches this ELF symbol (e.g. main)'
+    )
+    window_group.add_argument(
+        '--start-count',
+        default=0,
+        type=int,
+        metavar='N',
+        help='Skip N more instructions untraced (after --start-pc/--start-symbol if given)'
+    )
+    window_group.add_argument(
+        '--window',
+        default=None,
+        type=int,
+        metavar='N',
+        help='Trace N instructions per window (default: to the end of the program)'
+    )
+    window_group.add_argument(
+        '--every',
+        default=None,
+        type=int,
+        metavar='M',
+        help='Open a new trace window every M instructions (requires --window <= M)'
+    )
+    
     args = parser.parse_args()
+    if args.every is not None and (args.window is None or args.window > args.every):
+        parser.error("--every M requires --window N with N <= M")
+    if args.bbv is not None:
+        if args.bbv_interval <= 0:
+            parser.error("--bbv-interval N must be positive")
+        if (args.start_pc is not None or args.start_symbol is not None or args.start_count
+                or args.window is not None):
+            parser.error("--bbv cannot be combined with trace windows")
+    if len(set(args.checkpoint_at)) > 1 and '{count}' not in args.checkpoint_file:
+        parser.error("several --checkpoint-at need a {count} placeholder in --checkpoint-file")
+    if args.restore and args.checkpoint_at:
+        try:
+            restored = checkpoint_instruction_count(args.restore)
+        except (OSError, ValueError) as e:
+            parser.error(f"--restore: {e}")
+        if min(args.checkpoint_at) < restored:
+            parser.error(f"--checkpoint-at {min(args.checkpoint_at)} precedes the instruction "
+                         f"count {restored} restored from {args.restore}")
+    
+    if args.segment is not None:
+        if args.segment <= 0:
+            parser.error("--segment N must be positive")
+        if (args.max_instructions is not None or args.checkpoint_at or args.restore
+                or args.profile or args.profile_stacks or args.bbv or args.start_pc is not None
+                or args.start_symbol is not None or args.start_count or args.window is not None):
+            parser.error("--segment cannot be combined with --max-instructions, "
+                         "checkpoints, profiling, BBVs or trace windows")
+        if args.trace_format == 'none':
+            parser.error("--segment needs a trace format other than none")
+        run_segmented(args.elf_file, args.output, args.text_start, args.stack_base,
+                      args.stack_size, args.mem_file, args.segment, args.jobs,
+                      args.translate, args.trace_format, args.mem_backend)
+        return
+    
+    windows = None
+    if (args.start_pc is not None or args.start_symbol is not None or args.start_count
+            or args.window is not None):
+        windows = TraceWindows(args.start_pc, args.start_symbol, args.start_count,
+                               args.window, args.every)
+    
+    output = args.output
+    profiler = None
+    if args.profile or args.profile_stacks:
+        output = profiler = Profiler(args.elf_file, TRACE_FORMATS[args.trace_format](args.output))
+    bbv = None
+    if args.bbv:
+        inner = output if profiler is not None else TRACE_FORMATS[args.trace_format](args.output)
+        output = bbv = BbvCollector(args.bbv_interval, inner)
+    
+    iss = RISC_V_ISS(args.text_start, args.stack_base, args.stack_size, args.mem_backend)
+    try:
+        iss.run(args.elf_file, output, args.mem_file, args.max_instructions, args.translate,
+                args.trace_format, windows, args.checkpoint_at, args.checkpoint_file, args.restore)
+    finally:
+        if isinstance(output, TraceWriter):
+            output.close()
+    
+    if bbv is not None:
+        bbv.write_bbv(args.bbv)
     
-    iss = RISC_V_ISS(args.text_start, args.stack_base, args.stack_size)
-    iss.run(args.elf_file, args.output, args.mem_file)
+    if profiler is not None:
+        if args.profile:
+            profiler.write_json(args.profile)
+        if args.profile_stacks:
+            profiler.write_collapsed(args.profile_stacks)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,327 @@
+#!/usr/bin/env python3
+
+# Copyright (c) 2025 Siliscale Consulting, LLC
+# SPDX-License-Identifier: Apache-2.0
+
+"""
+Constrained-random RV32IM program generator
+
+generate(mix, seed) returns the assembly source of one test program. The
+programs do not check their own results: sim_manager runs them on the ISS and
+the RTL and compares the traces, so a program only has to terminate and stay
+inside its own data. The same (mix, seed) always yields the same
+program; sim_manager names such tests rand.<mix>_<seed> and builds them like
+tests/asm programs, ending with .include "eot_sequence.s".
+
+Each mix weights a set of snippets:
+
+  alu          R-type ALU operation
+  imm          I-type ALU operation, LUI or AUIPC
+  muldiv       MUL/DIV/REM operation
+  muldiv_chain 2-4 back-to-back MUL/DIV operations, each consuming the last
+  load         aligned load from the data buffer
+  load_use     load immediately followed by a consumer of its result
+  store        aligned store to the data buffer
+  unaligned    halfword/word store at a misaligned offset (including ones that
+               straddle a word), then aligned word loads of the bytes it wrote
+  branch       forward conditional branch over 1-3 instructions
+  loop         counted loop (1-8 iterations) around a short ALU/MUL body
+  jump         forward JAL or AUIPC+JALR over one instruction
+
+and `dependency` is the probability that a source operand is one of the
+last three registers written, which is what exercises forwarding. Register
+roles: x28 holds the data buffer base, x29 the loop counter, x2 (stack
+pointer) and x30/x31 (end-of-test sequence) are never written.
+"""
+
+import argparse
+import random
+import sys
+from typing import Dict, List, NamedTuple, Tuple
+
+
+class Mix(NamedTuple):
+    weights: Dict[str, int]
+    dependency: float
+    length: int  # approximate number of instructions before the end-of-test sequence
+
+
+MIXES: Dict[str, Mix] = {
+    'mixed': Mix({'alu': 6, 'imm': 4, 'muldiv': 2, 'muldiv_chain': 1, 'load': 2, 'load_use': 2,
+                  'store': 2, 'unaligned': 1, 'branch': 2, 'loop': 1, 'jump': 1}, 0.5, 400),
+    'forwarding': Mix({'alu': 8, 'imm': 4, 'muldiv': 1, 'load': 1, 'store': 1, 'branch': 1},
+                      0.9, 400),
+    'load_use': Mix({'alu': 2, 'imm': 1, 'load': 2, 'load_use': 8, 'store': 3, 'unaligned': 1},
+                    0.7, 400),
+    'muldiv': Mix({'alu': 2, 'imm': 1, 'muldiv': 4, 'muldiv_chain': 6, 'load_use': 1}, 0.7, 300),
+    'unaligned': Mix({'alu': 2, 'imm': 1, 'load': 2, 'store': 2, 'unaligned': 8, 'load_use': 1},
+                     0.5, 400),
+    'branchy': Mix({'alu': 3, 'imm': 2, 'muldiv': 1, 'load': 1, 'branch': 8, 'loop': 3,
+                    'jump': 3}, 0.5, 400),
+}
+DEFAULT_MIX = 'mixed'
+
+BASE_REG = 28
+COUNTER_REG = 29
+# Registers the snippets may write
+WRITABLE = [1] + list(range(3, BASE_REG))
+# Size of the data buffer addressed from BASE_REG, in bytes
+DATA_BYTES = 512
+
+ALU_OPS = ('add', 'sub', 'sll', 'slt', 'sltu', 'xor', 'srl', 'sra', 'or', 'and')
+IMM_OPS = ('addi', 'slti', 'sltiu', 'xori', 'ori', 'andi')
+SHIFT_IMM_OPS = ('slli', 'srli', 'srai')
+MULDIV_OPS = ('mul', 'mulh', 'mulhsu', 'mulhu', 'div', 'divu', 'rem', 'remu')
+LOADS = {'lb': 1, 'lbu': 1, 'lh': 2, 'lhu': 2, 'lw': 4}
+STORES = {'sb': 1, 'sh': 2, 'sw': 4}
+BRANCHES = ('beq', 'bne', 'blt', 'bge', 'bltu', 'bgeu')
+# Operand values that hit the corner cases of the ALU, multiplier and divider
+CORNER_VALUES = (0, 1, 2, 0xFFFFFFFF, 0x80000000, 0x7FFFFFFF, 0xFFFF, 0x8000, 0x80)
+
+_OP = '    {:<8} {}'
+
+
+def parse_test_name(name: str) -> Tuple[str, int]:
+    """(mix, seed) of a rand.<mix>_<seed> test name, or of its <mix>_<seed> part"""
+    body = name.split('.', 1)[1] if name.startswith('rand.') else name
+    mix, _, seed = body.rpartition('_')
+    if mix not in MIXES or not seed.isdigit():
+        raise ValueError(f"Invalid random test name '{name}': expected rand.<mix>_<seed> "
+                         f"with mix in {', '.join(MIXES)}")
+    return mix, int(seed)
+
+
+def test_name(mix: str, seed: int) -> str:
+    return f"rand.{mix}_{seed}"
+
+
+class _Generator:
+    def __init__(self, mix: Mix, seed_key: str):
+        self.mix = mix
+        self.rng = random.Random(seed_key)
+        self.lines: List[str] = []
+        self.count = 0
+        self.labels = 0
+        self.recent: List[int] = []  # most recently written registers, newest last
+        kinds = list(mix.weights)
+        self.kinds = kinds
+        self.cum_weights = []
+        total = 0
+        for kind in kinds:
+            total += mix.weights[kind]
+            self.cum_weights.append(total)
+
+    # Emission helpers
+
+    def op(self, mnemonic: str, operands: str):
+        self.lines.append(_OP.format(mnemonic, operands))
+        self.count += 1
+
+    def label(self, prefix: str) -> str:
+        self.labels += 1
+        return f".L{prefix}_{self.labels}"
+
+    def rd(self) -> int:
+        # Occasionally target x0 so discarded writes are compared too
+        reg = 0 if self.rng.random() < 0.03 else self.rng.choice(WRITABLE)
+        if reg:
+            self.recent = (self.recent + [reg])[-3:]
+        return reg
+
+    def rs(self) -> int:
+        if self.recent and self.rng.random() < self.mix.dependency:
+            return self.rng.choice(self.recent)
+        return self.rng.choice([0] + WRITABLE)
+
+    def value(self) -> int:
+        rng = self.rng
+        choice = rng.random()
+        if choice < 0.4:
+            return rng.choice(CORNER_VALUES)
+        if choice < 0.6:
+            return rng.randrange(-16, 16) & 0xFFFFFFFF
+        return rng.getrandbits(32)
+
+    # Snippets
+
+    def alu(self):
+        rs1, rs2 = self.rs(), self.rs()
+        self.op(self.rng.choice(ALU_OPS), f"x{self.rd()}, x{rs1}, x{rs2}")
+
+    def imm(self):
+        rng = self.rng
+        choice = rng.random()
+        if choice < 0.6:
+            rs1 = self.rs()
+            self.op(rng.choice(IMM_OPS), f"x{self.rd()}, x{rs1}, {rng.randrange(-2048, 2048)}")
+        elif choice < 0.85:
+            rs1 = self.rs()
+            self.op(rng.choice(SHIFT_IMM_OPS), f"x{self.rd()}, x{rs1}, {rng.randrange(32)}")
+        elif choice < 0.95:
+            self.op('lui', f"x{self.rd()}, 0x{rng.getrandbits(20):x}")
+        else:
+            self.op('auipc', f"x{self.rd()}, 0x{rng.getrandbits(20):x}")
+
+    def muldiv(self):
+        rs1, rs2 = self.rs(), self.rs()
+        self.op(self.rng.choice(MULDIV_OPS), f"x{self.rd()}, x{rs1}, x{rs2}")
+
+    def muldiv_chain(self):
+        rd = self.rd()
+        self.op(self.rng.choice(MULDIV_OPS), f"x{rd}, x{self.rs()}, x{self.rs()}")
+        for _ in range(self.rng.randint(1, 3)):
+            other = self.rs()
+            operands = (rd, other) if self.rng.random() < 0.5 else (other, rd)
+            rd = self.rd()
+            self.op(self.rng.choice(MULDIV_OPS), f"x{rd}, x{operands[0]}, x{operands[1]}")
+
+    def _load(self) -> int:
+        mnemonic = self.rng.choice(list(LOADS))
+        size = LOADS[mnemonic]
+        offset = self.rng.randrange(0, DATA_BYTES, size)
+        rd = self.rd()
+        self.op(mnemonic, f"x{rd}, {offset}(x{BASE_REG})")
+        return rd
+
+    def load(self):
+        self._load()
+
+    def load_use(self):
+        rd = self._load()
+        # The consumer reads the loaded register (x0 when the load targeted x0)
+        other = self.rs()
+        operands = (rd, other) if self.rng.random() < 0.5 else (other, rd)
+        mnemonic = self.rng.choice(ALU_OPS + MULDIV_OPS[:1])
+        self.op(mnemonic, f"x{self.rd()}, x{operands[0]}, x{operands[1]}")
+
+    def store(self):
+        mnemonic = self.rng.choice(list(STORES))
+        size = STORES[mnemonic]
+        offset = self.rng.randrange(0, DATA_BYTES, size)
+        self.op(mnemonic, f"x{self.rs()}, {offset}(x{BASE_REG})")
+
+    def unaligned(self):
+        rng = self.rng
+        mnemonic = rng.choice(('sh', 'sw'))
+        size = STORES[mnemonic]
+        offset = rng.randrange(0, DATA_BYTES - 8)
+        if offset % size == 0:
+            offset += 1
+        self.op(mnemonic, f"x{self.rs()}, {offset}(x{BASE_REG})")
+        first = offset & ~3
+        for word in range(first, offset + size, 4):
+            self.op('lw', f"x{self.rd()}, {word}(x{BASE_REG})")
+
+    def _body(self, count: int):
+        """Straight-line ALU/MUL instructions for branch shadows and loop bodies"""
+        for _ in range(count):
+            if self.rng.random() < 0.8:
+                self.alu()
+            else:
+                self.muldiv()
+
+    def branch(self):
+        target = self.label('skip')
+        rs1, rs2 = self.rs(), self.rs()
+        self.op(self.rng.choice(BRANCHES), f"x{rs1}, x{rs2}, {target}")
+        self._body(self.rng.randint(1, 3))
+        self.lines.append(f"{target}:")
+
+    def loop(self):
+        top = self.label('loop')
+        self.op('li', f"x{COUNTER_REG}, {self.rng.randint(1, 8)}")
+        self.lines.append(f"{top}:")
+        self._body(self.rng.randint(2, 5))
+        if self.rng.random() < 0.5:
+            self.branch()
+        self.op('addi', f"x{COUNTER_REG}, x{COUNTER_REG}, -1")
+        self.op('bnez', f"x{COUNTER_REG}, {top}")
+
+    def jump(self):
+        if self.rng.random() < 0.5:
+            target = self.label('jump')
+            self.op('jal', f"x{self.rd()}, {target}")
+            self._body(1)
+            self.lines.append(f"{target}:")
+        else:
+            # auipc t, 0; jalr rd, 12(t) lands just past the one-instruction shadow
+            base = self.rng.choice(WRITABLE)
+            self.recent = (self.recent + [base])[-3:]
+            self.op('auipc', f"x{base}, 0")
+            self.op('jalr', f"x{self.rd()}, 12(x{base})")
+            self._body(1)
+
+    def generate(self) -> List[str]:
+        rng = self.rng
+        self.op('la', f"x{BASE_REG}, rand_data")
+        for reg in WRITABLE:
+            self.op('li', f"x{reg}, 0x{self.value():x}")
+        body_start = self.count
+        while self.count - body_start < self.mix.length:
+            kind = rng.choices(self.kinds, cum_weights=self.cum_weights)[0]
+            getattr(self, kind)()
+        return self.lines
+
+
+def generate(mix: str, seed: int, length: int = None) -> str:
+    """Assembly source of the program for (mix, seed)"""
+    if mix not in MIXES:
+        raise ValueError(f"Unknown mix '{mix}' (choose from {', '.join(MIXES)})")
+    params = MIXES[mix]
+    if length is not None:
+        params = params._replace(length=length)
+    gen = _Generator(params, f"{mix}_{seed}")
+    body = gen.generate()
+    data = [f"    .word    0x{gen.rng.getrandbits(32):08x}" for _ in range(DATA_BYTES // 4)]
+    return "\n".join([
+        f"# Generated by tools/rv_random.py: mix={mix} seed={seed} length={params.length}",
+        "    .globl   _start",
+        "    .section .text",
+        "",
+        "_start:",
+        *body,
+        '    .include "eot_sequence.s"',
+        "",
+        "    .section .data",
+        "    .balign  4",
+        "rand_data:",
+        *data,
+        "",
+    ])
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Generate a constrained-random RV32IM assembly test',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog='''
+Examples:
+  %(prog)s --mix load_use --seed 42 -o load_use_42.s
+  %(prog)s --name rand.branchy_7
+        '''
+    )
+    parser.add_argument('--mix', default=DEFAULT_MIX, choices=list(MIXES),
+                        help=f'Instruction mix (default: {DEFAULT_MIX})')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed (default: 0)')
+    parser.add_argument('--name', default=None,
+                        help='Take mix and seed from a rand.<mix>_<seed> test name')
+    parser.add_argument('--length', type=int, default=None, metavar='N',
+                        help="Approximate instruction count (default: the mix's length)")
+    parser.add_argument('-o', '--output', default=None, help='Output .s file (default: stdout)')
+    args = parser.parse_args()
+
+    try:
+        mix, seed = parse_test_name(args.name) if args.name else (args.mix, args.seed)
+    except ValueError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
+    source = generate(mix, seed, args.length)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(source)
+    else:
+        sys.stdout.write(source)
+
+
+if __name__ == '__main__':
+    main()
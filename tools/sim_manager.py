@@ -5,29 +5,49 @@
 
 
 import argparse
+import contextlib
+import dataclasses
+import hashlib
 import json
 import sys
 import os
+import time
 from pathlib import Path
-from typing import List, Optional
+from collections import deque
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Sequence, Tuple
 
 _REPO_ROOT = Path(__file__).resolve().parents[1]
 if str(_REPO_ROOT) not in sys.path:
     sys.path.insert(0, str(_REPO_ROOT))
 
-from hw import HwConfig, default_hw_config_path, load_hw_config
+from hw import HwConfig, VerilatorConfig, default_hw_config_path, load_hw_config
 from hw.rtl_config import write_hw_config_svh
 from elftools.elf.elffile import ELFFile
 import subprocess
 import shutil
 import concurrent.futures
+import itertools
 import multiprocessing
 import threading
 import traceback
+import numpy as np
 from tqdm import tqdm
+from artifact_cache import ArtifactCache
+from rv_iss import EFF_LOAD, EFF_REG, RISC_V_ISS, disassemble
+from rv_random import DEFAULT_MIX, MIXES, generate as generate_random_program, parse_test_name
+from rv_random import test_name as random_test_name
+from stage_scheduler import StageCost, StageScheduler
+from trace_format import CHUNK_RECORDS, load_columns, merge_split_stores
 
 _console_lock = threading.Lock()
 
+# Persistent ISS worker processes started by main(); None runs the ISS in-process
+_iss_pool: Optional[concurrent.futures.ProcessPoolExecutor] = None
+
+# Stage output cache set up by main(); None runs every stage
+_artifact_cache: Optional[ArtifactCache] = None
+DEFAULT_CACHE_DIR = os.path.join("work", ".cache")
+
 
 def safe_write(msg: str) -> None:
     """Thread-safe console output that does not corrupt tqdm bars."""
@@ -37,6 +57,20 @@ def safe_write(msg: str) -> None:
 IMEM_DEPTH = 2 ** 18
 DMEM_DEPTH = 2 ** 18
 
+RISCV_GCC = "riscv64-unknown-elf-gcc"
+ASM_FLAGS = "-O0 -march=rv32im -mabi=ilp32 -nostdlib -Wl,-Ttext=0x100000"
+C_FLAGS = (
+    "-O0 -march=rv32im -mabi=ilp32 -nostdlib "
+    "-fno-builtin-printf -fno-common -falign-functions=4"
+)
+C_LDFLAGS = "-lgcc -Wl,-Ttext=0x100000 -Wl,--defsym,_start=main"
+
+# Files each cached stage produces in work/<test>
+COMPILE_OUTPUTS = ("test.elf", "test.dump", "compile.log", "test.s")
+ISS_OUTPUTS = ("iss.log",)
+IMAGE_OUTPUTS = ("imem.hex", "dmem.hex")
+RTL_RUN_OUTPUTS = ("rtl.log", "console.log", "sim.log")
+
 
 def _write_hw_config_artifact(test: str, hw_config: HwConfig) -> None:
     out_path = os.path.join("work", test, "hw_config.json")
@@ -44,6 +78,18 @@ def _write_hw_config_artifact(test: str, hw_config: HwConfig) -> None:
         json.dump(hw_config.to_dict(), f, indent=2)
 
 
+def _hw_config_key(test: str) -> str:
+    """work/<test>/hw_config.json as a cache key part.
+
+    source_path is dropped: it is absolute, and would give every checkout
+    its own keys.
+    """
+    with open(os.path.join("work", test, "hw_config.json"), "r", encoding="utf-8") as f:
+        config = json.load(f)
+    config.pop("source_path", None)
+    return json.dumps(config, sort_keys=True)
+
+
 def _pyvedas_python() -> str:
     """Pick a Python interpreter that can run the PyVedas JIT."""
     candidates = [
@@ -63,17 +109,17 @@ def _compile_riscv_elf(test: str, sources: List[str], include_dirs: List[str]) -
     inc_flags = " ".join(f"-I{inc}" for inc in include_dirs)
     source_list = " ".join(sources)
     cmd = (
-        f"riscv64-unknown-elf-gcc -O0 {inc_flags} "
-        f"-march=rv32im -mabi=ilp32 -nostdlib -o work/{test}/test.elf "
-        f"-fno-builtin-printf -fno-common -falign-functions=4 "
-        f"{source_list} -lgcc "
-        f"-Wl,-Ttext=0x100000 -Wl,--defsym,_start=main "
+        f"{RISCV_GCC} {C_FLAGS} {inc_flags} -o work/{test}/test.elf "
+        f"{source_list} {C_LDFLAGS} "
         f"> {compile_log} 2>&1"
     )
     if os.system(cmd) != 0:
         raise RuntimeError(f"RISC-V compile failed for {test}; see {compile_log}")
+    return _elf_start(os.path.join("work", test, "test.elf"))
 
-    elf_path = os.path.join("work", test, "test.elf")
+
+def _elf_start(elf_path: str) -> int:
+    """Address of the _start symbol of an ELF (the reset vector)."""
     with open(elf_path, "rb") as f:
         elf = ELFFile(f)
         symtab = elf.get_section_by_name('.symtab')
@@ -85,16 +131,98 @@ def _compile_riscv_elf(test: str, sources: List[str], include_dirs: List[str]) -
     raise RuntimeError("Could not find _start symbol in ELF file")
 
 
+def _asm_includes(source: str, include_dir: str) -> List[str]:
+    """Files pulled in by the .include directives of an assembly source."""
+    includes = []
+    with open(source, "r") as f:
+        for line in f:
+            line = line.strip()
+            if line.startswith(".include"):
+                includes.append(os.path.join(include_dir, line.split('"')[1]))
+    return includes
+
+
+def _compile_key(test: str) -> Optional[str]:
+    """Cache key of the compile stage, or None when it is not cached.
+
+    PyVedas tests are not: their C comes from the JIT, which depends on the
+    whole pyvedas package. The later stages still hit on an unchanged ELF.
+    """
+    cache = _artifact_cache
+    if cache is None:
+        return None
+    prefix, name = test.split(".", 1)
+    if prefix == "asm":
+        source = os.path.join("tests", "asm", name + ".s")
+        inputs = [source, *_asm_includes(source, os.path.join("tests", "asm"))]
+        flags = ASM_FLAGS
+    elif prefix == "rand":
+        # The program is a function of the name and the generator
+        inputs = [os.path.join(_REPO_ROOT, "tools", "rv_random.py"),
+                  os.path.join("tests", "asm", "eot_sequence.s")]
+        flags = ASM_FLAGS
+    elif prefix == "c":
+        inputs = [os.path.join("tests", "c", name + ".c"),
+                  os.path.join("tests", "c", "asm_functions", "eot_sequence.s"),
+                  os.path.join("sw", "vedas_printf", "vedas_printf.c")]
+        flags = f"{C_FLAGS} {C_LDFLAGS}"
+    elif prefix == "elf":
+        inputs = [os.path.join("tests", "elf", name)]
+        flags = ""
+    else:
+        return None
+    return cache.key(
+        "compile", test, flags, cache.tool_version(RISCV_GCC),
+        _hw_config_key(test),
+        *(cache.file_digest(path) for path in inputs),
+    )
+
+
+def _cache_restore(stage: str, key: Optional[str], test: str, outputs: Sequence[str]) -> Optional[Dict]:
+    """Restore a stage's outputs into work/<test>; metadata on a hit, None otherwise."""
+    if _artifact_cache is None or key is None:
+        return None
+    return _artifact_cache.restore(stage, key, os.path.join("work", test), outputs)
+
+
+def _cache_save(stage: str, key: Optional[str], test: str, outputs: Sequence[str],
+                meta: Optional[Dict] = None) -> None:
+    if _artifact_cache is not None and key is not None:
+        _artifact_cache.save(stage, key, os.path.join("work", test), outputs, meta)
+
+
+def _stage_key(stage: str, test: str, *parts) -> Optional[str]:
+    """Cache key of a stage over the test's hardware config and *parts*, or None without a cache."""
+    cache = _artifact_cache
+    if cache is None:
+        return None
+    return cache.key(stage, _hw_config_key(test), *parts)
+
+
+def _digest(path: str) -> str:
+    return _artifact_cache.file_digest(path) if _artifact_cache is not None else ""
+
+
 def run_gen(test: str, hw_config: HwConfig) -> int:
     """Run the generator for a test."""
     # Create the folder for the test
     os.makedirs(f"work/{test}", exist_ok=True)
     _write_hw_config_artifact(test, hw_config)
+    key = _compile_key(test)
+    if _cache_restore("compile", key, test, COMPILE_OUTPUTS) is not None:
+        return _elf_start(os.path.join("work", test, "test.elf"))
+    reset_vector = _build_test(test, hw_config)
+    _cache_save("compile", key, test, COMPILE_OUTPUTS)
+    return reset_vector
+
+
+def _build_test(test: str, hw_config: HwConfig) -> int:
+    """Compile (or copy) the ELF of a test into work/<test>. Returns the reset vector."""
     test_path = test.split(".")
     extension = ""
     if test_path[0] == "c":
         extension = ".c"
-    elif test_path[0] == "asm":
+    elif test_path[0] in ("asm", "rand"):
         extension = ".s"
     elif test_path[0] == "elf":
         extension = None
@@ -132,7 +260,14 @@ def run_gen(test: str, hw_config: HwConfig) -> int:
             )
             return reset_vector
         elif extension == ".s":
-            os.system(f"riscv64-unknown-elf-gcc -O0 -I{os.path.join('tests', test_path[0])} -march=rv32im -mabi=ilp32 -o work/{test}/test.elf -nostdlib {os.path.join('tests', test_path[0], test_path[1] + extension)} -Wl,-Ttext=0x100000 > {os.path.join('work', test, 'compile.log')}")
+            asm_source = os.path.join('tests', test_path[0], test_path[1] + extension)
+            if test_path[0] == "rand":
+                # Constrained-random program, regenerated from the mix and seed in its name
+                mix, seed = parse_test_name(test)
+                asm_source = os.path.join('work', test, 'test.s')
+                with open(asm_source, 'w') as f:
+                    f.write(generate_random_program(mix, seed))
+            os.system(f"{RISCV_GCC} {ASM_FLAGS} -I{os.path.join('tests', 'asm')} -o work/{test}/test.elf {asm_source} > {os.path.join('work', test, 'compile.log')}")
         elif extension == ".c":
             c_source = os.path.join('tests', test_path[0], test_path[1] + extension)
             eot_source = os.path.join('tests', test_path[0], 'asm_functions', 'eot_sequence.s')
@@ -147,23 +282,28 @@ def run_gen(test: str, hw_config: HwConfig) -> int:
             os.system(f"cp {os.path.join('tests', test_path[0], test_path[1])} work/{test}/test.elf")
 
         os.system(f"riscv64-unknown-elf-objdump -D work/{test}/test.elf > work/{test}/test.dump")
-
-        elf_path = os.path.join("work", test, "test.elf")
-        with open(elf_path, "rb") as f:
-            elf = ELFFile(f)
-            symtab = elf.get_section_by_name('.symtab')
-            if symtab is None:
-                raise RuntimeError("No symbol table found in ELF file")
-            for symbol in symtab.iter_symbols():
-                if symbol.name == "_start":
-                    return symbol['st_value']
-            raise RuntimeError("Could not find _start symbol in ELF file")
+        return _elf_start(os.path.join("work", test, "test.elf"))
     except Exception as e:
         print(f"Error compiling test {test}: {e}")
         sys.exit(1)
 
-def run_iss(test: str, reset_vector: int) -> None:
-    """Run the ISS for a test."""
+def _iss_job(elf_path: str, reset_vector: int, trace_path: str, dmem_path: Optional[str]) -> int:
+    """Run the ISS on one ELF (inside an ISS worker process) and return the instruction count."""
+    iss = RISC_V_ISS(reset_vector, 0x7FFFF000, 0x1000)
+    # Raw trace: no mnemonics; compare_results renders them for mismatches only
+    instruction_count, _ = iss.run(elf_path, trace_path, dmem_path, trace_format="raw")
+    return instruction_count
+
+def start_iss_pool(workers: int) -> concurrent.futures.ProcessPoolExecutor:
+    """Start the persistent ISS workers that run_iss dispatches to."""
+    global _iss_pool
+    _iss_pool = concurrent.futures.ProcessPoolExecutor(max_workers=workers)
+    # Fork the workers now, before any test threads exist
+    _iss_pool.submit(int).result()
+    return _iss_pool
+
+def run_iss(test: str, reset_vector: int) -> int:
+    """Run the ISS for a test and return the number of instructions it executed."""
     # Create the folder for the test
     elf_path = os.path.join("work", test, "test.elf")
     # Check if I have a memory initialization file for this test
@@ -173,21 +313,30 @@ def run_iss(test: str, reset_vector: int) -> None:
     if has_dmem:
         # Copy the file in the work directory
         shutil.copy(dmem_path, os.path.join("work", test, "dmem.hex"))
-    # try and run the ISS
+    key = _stage_key(
+        "iss", test, _digest(elf_path), _digest(dmem_path), reset_vector,
+        _digest(os.path.join(_REPO_ROOT, "tools", "rv_iss.py")),
+    )
+    meta = _cache_restore("iss", key, test, ISS_OUTPUTS)
+    if meta is not None:
+        return meta["instructions"]
+    # Run the ISS in a warm worker process (or in-process without a pool)
+    job = (
+        elf_path,
+        reset_vector,
+        os.path.join("work", test, "iss.log"),
+        os.path.join("work", test, "dmem.hex") if has_dmem else None,
+    )
     try:
-        import subprocess
-        cmd = ""
-        if has_dmem:
-            cmd = f"python3 ./tools/rv_iss.py {elf_path} {hex(reset_vector)} 0x7FFFF000 0x1000 -o {os.path.join('work', test, 'iss.log')} -m {os.path.join('work', test, 'dmem.hex')}"
+        if _iss_pool is not None:
+            instructions = _iss_pool.submit(_iss_job, *job).result()
         else:
-            cmd = f"python3 ./tools/rv_iss.py {elf_path} {hex(reset_vector)} 0x7FFFF000 0x1000 -o {os.path.join('work', test, 'iss.log')}"
-        result = subprocess.run(cmd, shell=True)
-        if result.returncode != 0:
-            print(f"ISS returned error code {result.returncode} for test {test}. See iss.log for details.")
-            sys.exit(1)
+            instructions = _iss_job(*job)
     except Exception as e:
         print(f"Error running ISS for test {test}: {e}")
         sys.exit(1)
+    _cache_save("iss", key, test, ISS_OUTPUTS, {"instructions": instructions})
+    return instructions
 
 def prepare_imem(test: str) -> None:
     """Prepare the IMEM for a test."""
@@ -196,7 +345,13 @@ def prepare_imem(test: str) -> None:
     elf_path = os.path.join("work", test, "test.elf")
 
     test_path = test.split(".")
-    
+    key = _stage_key(
+        "images", test, _digest(elf_path),
+        _digest(os.path.join("tests", test_path[0], test_path[1] + ".mem")), IMEM_DEPTH, DMEM_DEPTH,
+    )
+    if _cache_restore("images", key, test, IMAGE_OUTPUTS) is not None:
+        return
+
     # Read the ELF file using elftools
     with open(elf_path, 'rb') as f:
         elf = ELFFile(f)
@@ -261,6 +416,7 @@ def prepare_imem(test: str) -> None:
             # Convert to hex string, removing '0x' prefix and padding to 8 chars
             hex_str = '{:08x}'.format(int.from_bytes(word, byteorder='little'))
             f.write(f"{hex_str}\n")
+    _cache_save("images", key, test, IMAGE_OUTPUTS)
 
 def read_task_list(filename: str) -> List[str]:
     """Read and return list of tests from file."""
@@ -271,224 +427,480 @@ def read_task_list(filename: str) -> List[str]:
         print(f"Error reading task list file: {e}")
         return []
 
-def run_verilator(test: str, reset_vector: int) -> None:
-    """Execute Verilator simulation."""
-    has_dmem = os.path.exists(os.path.join("work", test, "dmem.hex"))
-    verilator_cmd = f"export PROJ=$(pwd) && cd {os.path.join('work', test)} && verilator --cc --trace --trace-structs --build --timing --top-module core_top_tb --exe $PROJ/dv/verilator/core_top_tb.cpp -I$PROJ/rtl/include -f $PROJ/rtl/core_top.flist -DICCM_INIT_FILE='\"imem.hex\"' -DRESET_VECTOR=32\\'h{hex(reset_vector).lstrip('0x')} -DSTACK_POINTER_INIT_VALUE=32\\'h80000000"
-    if has_dmem:
-        verilator_cmd += f" -DDCCM_INIT_FILE='\"dmem.hex\"'"
-    else:
-        verilator_cmd += f" -DDCCM_INIT_FILE='\"\"'"
-    verilator_cmd += f" && make -j -C obj_dir -f Vcore_top_tb.mk Vcore_top_tb"
-    verilator_cmd += f" && ./obj_dir/Vcore_top_tb"
-    
-    # Redirect both stdout and stderr to sim.log
-    sim_log_path = os.path.join('work', test, 'sim.log')
-    with open(sim_log_path, 'w') as sim_log:
-        process = subprocess.Popen(verilator_cmd, shell=True, stdout=sim_log, stderr=subprocess.STDOUT)
+def _rtl_digest() -> str:
+    """Digest of everything an RTL build reads: the flist, every file it lists,
+    rtl/include (hw_config.svh included) and the Verilator C++ harness."""
+    cache = _artifact_cache
+    flist = os.path.join(_REPO_ROOT, "rtl", "core_top.flist")
+    paths = [flist]
+    with open(flist, "r") as f:
+        for line in f:
+            line = line.strip()
+            if line and not line.startswith("//"):
+                paths.append(line.replace("$PROJ", str(_REPO_ROOT)))
+    include_dir = os.path.join(_REPO_ROOT, "rtl", "include")
+    paths += sorted(os.path.join(include_dir, name) for name in os.listdir(include_dir))
+    paths.append(os.path.join(_REPO_ROOT, "dv", "verilator", "core_top_tb.cpp"))
+    return cache.key("rtl", *(f"{os.path.relpath(path, _REPO_ROOT)}:{cache.file_digest(path)}"
+                             for path in paths))
+
+def _run_logged(cwd: str, cmd: str, tool: str, log_path: str, log_mode: str) -> None:
+    """Run a shell command in *cwd* with $PROJ set, logging stdout and stderr to *log_path*."""
+    cmd = f"export PROJ=$(pwd) && cd {cwd} && {cmd}"
+    with open(log_path, log_mode) as log:
+        process = subprocess.Popen(cmd, shell=True, stdout=log, stderr=subprocess.STDOUT)
         process.wait()
         # Get the exit code
         exit_code = process.returncode
         if exit_code != 0:
-            print(f"Error: Verilator returned exit code {exit_code}")
-            sim_log.close()
+            print(f"Error: {tool} returned exit code {exit_code} (see {log_path})")
+            log.close()
             sys.exit(1)
-    
+
+def _run_in_test_dir(test: str, cmd: str, tool: str, log_mode: str) -> None:
+    """Run a shell command in work/<test>, logging to sim.log."""
+    test_dir = os.path.join("work", test)
+    _run_logged(test_dir, cmd, tool, os.path.join(test_dir, "sim.log"), log_mode)
+
+def _image_plusargs(reset_vector: int, prefix: str = "") -> List[str]:
+    """Runtime plusargs giving the testbench the ICCM image (as *prefix*imem.hex)
+    and the reset vector. The DCCM reads dmem.hex from the working directory."""
+    return [f"ICCM_INIT_FILE={prefix}imem.hex", f"RESET_VECTOR={reset_vector:08x}"]
+
+def _run_key(test: str, build_key: Optional[str], run_args: str) -> Optional[str]:
+    """Cache key of an RTL run: the model's build key, the simulator arguments
+    (without the checkout-specific model path) and the memory images."""
+    if build_key is None:
+        return None
+    return _stage_key(
+        "rtl_run", test, build_key, run_args,
+        _digest(os.path.join("work", test, "imem.hex")),
+        _digest(os.path.join("work", test, "dmem.hex")),
+    )
+
+# Verilator models shared by every test of a run, one per hardware config
+# and waveform format
+MODEL_DIR = os.path.join("work", ".models")
+TRACE_FLAGS = {None: "", "vcd": "--trace --trace-structs", "fst": "--trace-fst --trace-structs"}
+VERILATOR_ARGS = (
+    "--cc --build --timing --top-module core_top_tb "
+    "--exe $PROJ/dv/verilator/core_top_tb.cpp -I$PROJ/rtl/include -f $PROJ/rtl/core_top.flist "
+    "-DSTACK_POINTER_INIT_VALUE=32\\'h80000000"
+)
+_models: Dict[str, Tuple[str, Optional[str]]] = {}
+_model_locks: Dict[str, threading.Lock] = {}
+_models_lock = threading.Lock()
+
+
+class JobBudget:
+    """CPU slots shared by the model builds and simulations of a run, so
+    concurrent tests never run more compile jobs and model threads than
+    there are slots."""
+
+    def __init__(self, total: int):
+        self.total = max(1, total)
+        self._free = self.total
+        self._cond = threading.Condition()
+
+    @contextlib.contextmanager
+    def claim(self, want: int, partial: bool = False) -> Iterator[int]:
+        """Hold *want* slots (at most the total) for the block. With *partial*,
+        take whatever is free once at least one slot is. Yields the count held."""
+        want = max(1, min(want, self.total))
+        with self._cond:
+            self._cond.wait_for(lambda: self._free >= (1 if partial else want))
+            held = min(want, self._free)
+            self._free -= held
+        try:
+            yield held
+        finally:
+            with self._cond:
+                self._free += held
+                self._cond.notify_all()
+
+
+# Replaced by main() with the --jobs budget
+_job_budget = JobBudget(multiprocessing.cpu_count())
+
+# Cycles dumped after --wave-pc, and on each side of the first mismatch
+WAVE_LENGTH = 1000
+
+
+class WaveOptions(NamedTuple):
+    """Waveform capture of a Verilator run.
+
+    The window is cycles [start, stop] (stop None: to the end), or *length*
+    cycles from the first retirement of *pc* when it is set.
+    """
+    format: str = "vcd"
+    depth: int = 99
+    start: int = 0
+    stop: Optional[int] = None
+    pc: Optional[int] = None
+    length: int = WAVE_LENGTH
+
+    @property
+    def file(self) -> str:
+        return f"core_top.{self.format}"
+
+    def plusargs(self) -> List[str]:
+        plusargs = [f"WAVE_FILE={self.file}", f"WAVE_DEPTH={self.depth}"]
+        if self.pc is not None:
+            return plusargs + [f"WAVE_PC={self.pc:08x}", f"WAVE_CYCLES={self.length}"]
+        plusargs.append(f"WAVE_START={self.start}")
+        if self.stop is not None:
+            plusargs.append(f"WAVE_STOP={self.stop}")
+        return plusargs
+
+
+def hw_config_digest(hw_config: HwConfig) -> str:
+    """Short hash of the parts of a hardware config that shape the RTL build,
+    naming the simulator model built for it. The checkout-specific source_path
+    and the ISS-only timing section are left out."""
+    config = hw_config.to_dict()
+    text = json.dumps({field: config[field] for field in ("cpu", "vector", "memory", "verilator")},
+                      sort_keys=True)
+    return hashlib.sha256(text.encode()).hexdigest()[:16]
+
+
+def verilator_flags(config: VerilatorConfig, trace: Optional[str] = None) -> str:
+    """Verilator options selected by a preset's build settings and the waveform format."""
+    flags = [f"-O{config.opt_level}", f"--x-assign {config.x_assign}"]
+    if config.threads > 1:
+        flags.append(f"--threads {config.threads}")
+    if config.output_split:
+        flags.append(f"--output-split {config.output_split}")
+    if trace:
+        flags.append(TRACE_FLAGS[trace])
+    return " ".join(flags)
+
+def verilator_model(
+    hw_config: HwConfig, trace: Optional[str] = None, jobs: Optional[int] = None,
+) -> Tuple[str, Optional[str]]:
+    """Build the Verilator model of *hw_config* on first use in this run.
+
+    *trace* ("vcd" or "fst") builds the variant that can dump waveforms; the
+    default model has no tracing code. Returns the model binary and its
+    cache key (None without a cache). Tests calling concurrently wait for
+    the one build, and on a cache hit the model is restored instead of
+    compiled. The C++ compile runs *jobs* jobs, or takes as many job budget
+    slots as are free when it is None.
+    """
+    name = f"verilator_{hw_config_digest(hw_config)}" + (f"_{trace}" if trace else "")
+    model_dir = os.path.join(MODEL_DIR, name)
+    with _models_lock:
+        lock = _model_locks.setdefault(model_dir, threading.Lock())
+    with lock:
+        if model_dir not in _models:
+            os.makedirs(model_dir, exist_ok=True)
+            config = hw_config.verilator
+            flags = verilator_flags(config, trace)
+            key = None
+            if _artifact_cache is not None:
+                key = _artifact_cache.key(
+                    "rtl_build", "verilator", _artifact_cache.tool_version("verilator"),
+                    VERILATOR_ARGS, flags, _rtl_digest(),
+                )
+            outputs = ("obj_dir/Vcore_top_tb",)
+            if key is None or _artifact_cache.restore("rtl_build", key, model_dir, outputs) is None:
+                # verilated.mk compiles through $OBJCACHE
+                objcache = "OBJCACHE=ccache " if config.ccache and shutil.which("ccache") else ""
+                claim = _job_budget.claim(_job_budget.total, partial=True) if jobs is None \
+                    else contextlib.nullcontext(jobs)
+                with claim as jobs:
+                    build_cmd = (
+                        f"{objcache}verilator {VERILATOR_ARGS} {flags} -j {jobs} "
+                        f"&& {objcache}make -j{jobs} -C obj_dir -f Vcore_top_tb.mk Vcore_top_tb"
+                    )
+                    _run_logged(model_dir, build_cmd, "Verilator", os.path.join(model_dir, "build.log"), "w")
+                if key is not None:
+                    _artifact_cache.save("rtl_build", key, model_dir, outputs)
+            binary = os.path.abspath(os.path.join(model_dir, "obj_dir", "Vcore_top_tb"))
+            _models[model_dir] = (binary, key)
+        return _models[model_dir]
+
+def run_verilator(
+    test: str, reset_vector: int, hw_config: HwConfig, waves: Optional[WaveOptions] = None,
+) -> None:
+    """Execute Verilator simulation."""
+    binary, build_key = verilator_model(hw_config, waves.format if waves else None)
+    plusargs = _image_plusargs(reset_vector) + (waves.plusargs() if waves else [])
+    run_args = " ".join(f"+{arg}" for arg in plusargs)
+    run_cmd = f"{binary} {run_args}"
+    # A restored run would come back without its waveform
+    run_key = _run_key(test, build_key, run_args) if waves is None else None
+    if _cache_restore("rtl_run", run_key, test, RTL_RUN_OUTPUTS) is not None:
+        return
+    with _job_budget.claim(hw_config.verilator.threads):
+        _run_in_test_dir(test, run_cmd, "Verilator", "w")
+    _cache_save("rtl_run", run_key, test, RTL_RUN_OUTPUTS)
+
+def rerun_with_waves(test: str, reset_vector: int, hw_config: HwConfig, waves: WaveOptions) -> str:
+    """Rerun a failing test on the traced model in work/<test>/waves, dumping
+    *waves.length* cycles on each side of the first mismatch (the whole run
+    when it cannot be located). Returns the waveform path."""
+    cycle = mismatch_cycle(test)
+    if cycle is not None:
+        waves = waves._replace(start=max(0, cycle - waves.length), stop=cycle + waves.length, pc=None)
+    binary, _ = verilator_model(hw_config, waves.format)
+    wave_dir = os.path.join("work", test, "waves")
+    os.makedirs(wave_dir, exist_ok=True)
+    # The DCCM image is read from the working directory
+    shutil.copy(os.path.join("work", test, "dmem.hex"), os.path.join(wave_dir, "dmem.hex"))
+    plusargs = _image_plusargs(reset_vector, "../") + waves.plusargs()
+    run_cmd = " ".join([binary, *(f"+{arg}" for arg in plusargs)])
+    with _job_budget.claim(hw_config.verilator.threads):
+        _run_logged(wave_dir, run_cmd, "Verilator", os.path.join(wave_dir, "sim.log"), "w")
+    return os.path.join(wave_dir, waves.file)
+
 def run_xsim(test: str, reset_vector: int) -> None:
     """Execute XSim simulation."""
-    has_dmem = os.path.exists(os.path.join("work", test, "dmem.hex"))
-    xsim_cmd = f"export PROJ=$(pwd) && cd {os.path.join('work', test)} && xvlog -sv -i $PROJ/rtl/include -f $PROJ/rtl/core_top.flist --define ICCM_INIT_FILE='\"imem.hex\"' --define RESET_VECTOR=32\\'h{hex(reset_vector).lstrip('0x')} --define STACK_POINTER_INIT_VALUE=32\\'h80000000"
-    if has_dmem:
-        xsim_cmd += f" --define DCCM_INIT_FILE='\"dmem.hex\"'"
+    build_cmd = (
+        "xvlog -sv -i $PROJ/rtl/include -f $PROJ/rtl/core_top.flist "
+        "--define STACK_POINTER_INIT_VALUE=32\\'h80000000 "
+        "&& xelab -top core_top_tb -snapshot sim --debug wave"
+    )
+    run_cmd = " ".join(["xsim sim --runall", *(f"-testplusarg {arg}" for arg in _image_plusargs(reset_vector))])
+    build_key = run_key = None
+    if _artifact_cache is not None:
+        # The elaborated snapshot records its directory, so it is only reused by the same test
+        build_key = _artifact_cache.key(
+            "rtl_build", "xsim", _artifact_cache.tool_version("xvlog"), build_cmd, _rtl_digest(), test,
+        )
+        run_key = _run_key(test, build_key, run_cmd)
+        if _cache_restore("rtl_run", run_key, test, RTL_RUN_OUTPUTS) is not None:
+            return
+    if _cache_restore("rtl_build", build_key, test, ("xsim.dir",)) is not None:
+        open(os.path.join("work", test, "sim.log"), "w").close()
     else:
-        xsim_cmd += f" --define DCCM_INIT_FILE='\"\"'"
-    xsim_cmd += f" && xelab -top core_top_tb -snapshot sim --debug wave && xsim sim --runall"
-    
-    # Redirect both stdout and stderr to sim.log
-    sim_log_path = os.path.join('work', test, 'sim.log')
-    with open(sim_log_path, 'w') as sim_log:
-        process = subprocess.Popen(xsim_cmd, shell=True, stdout=sim_log, stderr=subprocess.STDOUT)
-        process.wait()
-        # Get the exit code
-        exit_code = process.returncode
-        if exit_code != 0:
-            print(f"Error: XSim returned exit code {exit_code}")
-            sim_log.close()
-            sys.exit(1)
+        _run_in_test_dir(test, build_cmd, "XSim", "w")
+        _cache_save("rtl_build", build_key, test, ("xsim.dir",))
+    _run_in_test_dir(test, run_cmd, "XSim", "a")
+    _cache_save("rtl_run", run_key, test, RTL_RUN_OUTPUTS)
+
+# Lines of each trace shown before and after the first mismatch
+COMPARE_CONTEXT = 5
+
+
+def read_trace_lines(path: str) -> Iterator[str]:
+    """Non-empty lines of a trace file, read incrementally."""
+    with open(path, "r") as f:
+        for line in f:
+            line = line.rstrip("\n")
+            if line:
+                yield line
+
+def _canonical_iss(line: str) -> str:
+    """PC;INSTR;EFFECTS of an ISS line in upper case, without mnemonic and // comments."""
+    fields = line.upper().split(";")
+    touch = fields[3:]
+    if "//" in line:
+        touch = [t.split("//")[0].strip() for t in touch]
+    return ";".join(fields[:2] + touch)
+
+def _canonical_rtl(line: str) -> str:
+    """PC;INSTR;EFFECTS of an RTL line in upper case (the cycle count dropped)."""
+    return line.upper().partition(";")[2]
 
-def read_iss_log(test: str):
-    """Read and parse ISS log file."""
-    with open(os.path.join("work", test, "iss.log"), "r") as f:
-        iss_log = f.read()
-    iss_exe = []
-    for line in iss_log.split("\n"):
-        if line != "":
-            line = line.split(";") 
-            iss_exe.append({
-                'pc': line[0],
-                'instr': line[1],
-                'mnemonic': line[2],
-                'touch': line[3:]
-            })
-    return iss_exe
-
-def read_rtl_log(test: str):
-    """Read and parse RTL log file."""
-    with open(os.path.join("work", test, "rtl.log"), "r") as f:
-        rtl_log = f.read()
-    rtl_exe = []
-    for line in rtl_log.split("\n"):
-        if line != "":
-            line = line.split(";")
-            rtl_exe.append({
-                'pc': line[1],
-                'instr': line[2],
-                'touch': line[3:]
-            })
-    return rtl_exe
-
-def compare_results(test: str, show_progress: bool = True) -> None:
-    # Read both log files in parallel using threads
+def _describe_mismatch(iss_line: str, rtl_line: str) -> List[str]:
+    """Error lines for the first differing field of two non-matching trace lines."""
+    iss = iss_line.split(";")
+    rtl = rtl_line.split(";")[1:]
+    rtl += [""] * (2 - len(rtl))
+    pc = iss[0]
+    if pc.upper() != rtl[0].upper():
+        return [f"Error: PC Mismatch at PC {pc}", f"ISS: {pc}", f"RTL: {rtl[0]}"]
+    if iss[1].upper() != rtl[1].upper():
+        return [f"Error: Instruction mismatch at PC {pc}", f"ISS: {iss[1]}", f"RTL: {rtl[1]}"]
+    mnemonic = iss[2] if len(iss) > 2 and iss[2] else disassemble(int(iss[1], 16))
+    header = f"Error: Result mismatch at PC {pc} for instruction --> {mnemonic}"
+    iss_touch, rtl_touch = iss[3:], rtl[2:]
+    if len(iss_touch) != len(rtl_touch):
+        return [header, f"ISS: {iss_touch}", f"RTL: {rtl_touch}"]
+    for iss_value, rtl_value in zip(iss_touch, rtl_touch):
+        if iss_value.split("//")[0].strip().upper() != rtl_value.upper():
+            return [header, f"ISS: {iss_value}", f"RTL: {rtl_value}"]
+    return [header]
+
+def compare_traces(
+    iss_lines: Iterable[str],
+    rtl_lines: Iterable[str],
+    context: int = COMPARE_CONTEXT,
+    progress: Optional[tqdm] = None,
+    start: int = 0,
+) -> Tuple[bool, List[str]]:
+    """Compare two traces line by line, stopping at the first divergence.
+
+    Returns (passed, report); the report holds the mismatch and up to *context*
+    lines of both traces before and after it. Memory use is bounded by
+    *context*, not by the trace length. RTL lines past the end of the ISS
+    trace are not compared. *start* is the instruction number of the first
+    line, when the traces are passed from the middle.
+    """
+    history: deque = deque(maxlen=context)
+    iss_iter, rtl_iter = iter(iss_lines), iter(rtl_lines)
+    index = start
+    consumed = 0
+    for iss_line in iss_iter:
+        rtl_line = next(rtl_iter, None)
+        if rtl_line is None:
+            report = [f"Error: RTL trace ended after {index} instructions; "
+                      f"ISS continues at PC {iss_line.split(';')[0]}"]
+            break
+        if _canonical_iss(iss_line) != _canonical_rtl(rtl_line):
+            report = _describe_mismatch(iss_line, rtl_line)
+            break
+        history.append((iss_line, rtl_line))
+        index += 1
+        if progress is not None:
+            consumed += len(iss_line) + 1
+            if not (index - start) & 0xFFF:
+                progress.update(consumed)
+                consumed = 0
+    else:
+        return True, []
+
+    after_iss = list(itertools.islice(iss_iter, context))
+    after_rtl = list(itertools.islice(rtl_iter, context))
+    first = index - len(history)
+    for name, side, current, after in (
+        ("ISS", 0, iss_line, after_iss),
+        ("RTL", 1, rtl_line, after_rtl),
+    ):
+        lines = [pair[side] for pair in history]
+        if current is not None:
+            lines.append(current)
+        lines += after
+        if not lines:
+            continue
+        report.append(f"{name} trace, instructions {first}-{first + len(lines) - 1}:")
+        for offset, line in enumerate(lines):
+            marker = ">" if first + offset == index else " "
+            report.append(f"{marker} {first + offset:>8}  {line}")
+    return False, report
+
+def first_divergence(iss: Dict[str, np.ndarray], rtl: Dict[str, np.ndarray]) -> Optional[int]:
+    """Index of the first instruction where the ISS and RTL trace columns differ,
+    the RTL length if the RTL trace ends early, or None if they match.
+
+    ISS loads compare as plain register writes, since the RTL does not log
+    the load address. The columns are compared CHUNK_RECORDS at a time.
+    """
+    iss_length, rtl_length = len(iss["pc"]), len(rtl["pc"])
+    length = min(iss_length, rtl_length)
+    for begin in range(0, length, CHUNK_RECORDS):
+        end = min(begin + CHUNK_RECORDS, length)
+        window = slice(begin, end)
+        kind = iss["kind"][window]
+        load = kind == EFF_LOAD
+        differ = (
+            (iss["pc"][window] != rtl["pc"][window])
+            | (iss["instr"][window] != rtl["instr"][window])
+            | (np.where(load, EFF_REG, kind) != rtl["kind"][window])
+            | (iss["rd"][window] != rtl["rd"][window])
+            | (iss["value"][window] != rtl["value"][window])
+            | (np.where(load, 0, iss["addr"][window]) != rtl["addr"][window])
+        )
+        hits = np.flatnonzero(differ)
+        if hits.size:
+            return begin + int(hits[0])
+    return rtl_length if rtl_length < iss_length else None
+
+def mismatch_cycle(test: str) -> Optional[int]:
+    """RTL cycle of the first divergence of a test's traces (the last logged
+    cycle when the RTL trace ends early), or None when it cannot be located."""
     try:
-        with concurrent.futures.ThreadPoolExecutor(max_workers=2) as executor:
-            iss_future = executor.submit(read_iss_log, test)
-            rtl_future = executor.submit(read_rtl_log, test)
-            
-            # Wait for both to complete
-            iss_exe = iss_future.result()
-            rtl_exe = rtl_future.result()
-
-        # Compare the logs
-        test_passed = True
-        sim_log_path = os.path.join('work', test, 'sim.log')
-        with open(sim_log_path, 'a') as sim_log:
-            indices = range(len(iss_exe))
-            pbar = tqdm(
-                indices,
+        rtl = load_columns(os.path.join("work", test, "rtl.log"))[0]
+        divergence = first_divergence(load_columns(os.path.join("work", test, "iss.log"))[0], rtl)
+    except (OSError, ValueError):
+        return None
+    if divergence is None or not len(rtl["cycle"]):
+        return None
+    return int(rtl["cycle"][min(divergence, len(rtl["cycle"]) - 1)])
+
+def ingest_traces(test: str) -> None:
+    """Parse iss.log and rtl.log of a test into their column caches, once."""
+    for name in ("iss.log", "rtl.log"):
+        try:
+            load_columns(os.path.join("work", test, name))
+        except ValueError:
+            # Unparsable line: compare_results falls back to the text comparison,
+            # which reports it
+            pass
+
+def compare_results(
+    test: str,
+    show_progress: bool = True,
+    show_status: bool = True,
+    context: int = COMPARE_CONTEXT,
+) -> bool:
+    """Compare the ISS and RTL traces of a test and return whether they match.
+
+    The parsed trace columns locate the first divergence; the text of both
+    traces is then read only up to it, to report it with its context.
+    """
+    iss_path = os.path.join("work", test, "iss.log")
+    sim_log_path = os.path.join("work", test, "sim.log")
+    try:
+        try:
+            divergence = first_divergence(
+                load_columns(iss_path)[0],
+                load_columns(os.path.join("work", test, "rtl.log"))[0],
+            )
+        except ValueError:
+            divergence = 0
+        if divergence is None:
+            test_passed, report = True, []
+        else:
+            start = max(0, divergence - context)
+            with tqdm(
+                total=os.path.getsize(iss_path),
                 desc=f"Comparing {test}",
-                unit="instr",
+                unit="B",
+                unit_scale=True,
                 ncols=100,
                 leave=False,
                 disable=not show_progress,
-            )
-            for iss_idx in pbar:
-                if str(iss_exe[iss_idx]['pc']).upper() != str(rtl_exe[iss_idx]['pc']).upper():
-                    sim_log.write(f"Error: PC Mismatch at PC {iss_exe[iss_idx]['pc']}\n")
-                    sim_log.write(f"ISS: {iss_exe[iss_idx]['pc']}\n")
-                    sim_log.write(f"RTL: {rtl_exe[iss_idx]['pc']}\n")
-                    test_passed = False
-                elif str(iss_exe[iss_idx]['instr']).upper() != str(rtl_exe[iss_idx]['instr']).upper():
-                    sim_log.write(f"Error: Instruction mismatch at PC {iss_exe[iss_idx]['pc']}\n")
-                    sim_log.write(f"ISS: {iss_exe[iss_idx]['instr']}\n")
-                    sim_log.write(f"RTL: {rtl_exe[iss_idx]['instr']}\n")
-                    test_passed = False
-                # Diffetent lenght of touch
-                elif len(iss_exe[iss_idx]['touch']) != len(rtl_exe[iss_idx]['touch']):
-                    sim_log.write(f"Error: Result mismatch at PC {iss_exe[iss_idx]['pc']} for instruction --> {iss_exe[iss_idx]['mnemonic']}\n")
-                    sim_log.write(f"ISS: {iss_exe[iss_idx]['touch']}\n")
-                    sim_log.write(f"RTL: {rtl_exe[iss_idx]['touch']}\n")
-                    test_passed = False
-                # Same length, check each element
-                else:
-                    for touch_idx in range(len(iss_exe[iss_idx]['touch'])):
-                        # Remove comments after '//' from ISS value before comparison
-                        iss_touch = str(iss_exe[iss_idx]['touch'][touch_idx])
-                        iss_touch = iss_touch.split("//")[0].strip() if "//" in iss_touch else iss_touch
-                        rtl_touch = str(rtl_exe[iss_idx]['touch'][touch_idx])
-                        if iss_touch.upper() != rtl_touch.upper():
-                            sim_log.write(f"Error: Result mismatch at PC {iss_exe[iss_idx]['pc']} for instruction --> {iss_exe[iss_idx]['mnemonic']}\n")
-                            sim_log.write(f"ISS: {iss_exe[iss_idx]['touch'][touch_idx]}\n")
-                            sim_log.write(f"RTL: {rtl_exe[iss_idx]['touch'][touch_idx]}\n")
-                            test_passed = False
-                if not test_passed:
-                    break
-    except:
-        test_passed = False
-
-    status = "\033[92mPASSED\033[0m" if test_passed else "\033[91mFAILED\033[0m"
-    safe_write(f"{test} {'.' * (50 - len(test))}. {status}")
-
-def process_rtl_log(test: str, show_progress: bool = True):
-    """Process the RTL log file."""
-    with open(os.path.join("work", test, "rtl.log"), "r") as f:
-        rtl_lines = f.readlines()
-    
-    # Remove newlines and filter empty lines
-    rtl_lines = [line.rstrip('\n') for line in rtl_lines if line.strip()]
-    total_lines = len(rtl_lines) - 1
-    line_idx = 0
-    pbar = tqdm(
-        total=total_lines,
-        desc=f"Processing RTL log {test}",
-        unit="line",
-        leave=False,
-        ncols=100,
-        disable=not show_progress,
-    )
-
-    while line_idx < total_lines:
-        if line_idx + 1 >= len(rtl_lines):
-            break
-            
-        line_parts = rtl_lines[line_idx].split(";")
-        nxt_line_parts = rtl_lines[line_idx + 1].split(";")
-        
-        # Check if we need to merge (same PC and instruction, both have memory effects)
-        if (len(line_parts) > 3 and len(nxt_line_parts) > 3 and 
-            line_parts[1] == nxt_line_parts[1] and 
-            line_parts[2] == nxt_line_parts[2] and
-            "mem[" in line_parts[3] and "mem[" in nxt_line_parts[3]):
-            
-            effect = line_parts[3]
-            nxt_effect = nxt_line_parts[3]
-            
-            # Get the memory address
-            mem_addr = effect.split("[")[1].split("]")[0]
-            alignment = int(mem_addr, 16) % 4
-            
-            # For unaligned stores, we need to merge the two parts
-            # First part is the lower bytes (at higher address)
-            # Second part is the higher bytes (at lower address)
-            # For example, storing 0xCAFEBABE at 0xE:
-            # First store: mem[0xE]=0xBABE (lower 2 bytes)
-            # Second store: mem[0x10]=0xCAFE (higher 2 bytes)
-            # We need to merge them to get: mem[0xE]=0xCAFEBABE
-            lower_bytes = effect.split("=")[1].lstrip("0x")[:8-alignment*2]
-            higher_bytes = nxt_effect.split("=")[1].lstrip("0x")[:8-alignment*2]
-            
-            # Combine them to get the full value
-            merged_value = higher_bytes + lower_bytes
-            
-            # Update the current line with merged value
-            rtl_lines[line_idx] = f"{line_parts[0]};{line_parts[1]};{line_parts[2]};mem[{mem_addr}]=0x{merged_value}"
-            
-            # Remove the next line
-            del rtl_lines[line_idx + 1]
-            total_lines -= 1
-            line_idx += 1
-        else:
-            line_idx += 1
-        
-        if show_progress:
-            pbar.update(1)
+            ) as pbar:
+                test_passed, report = compare_traces(
+                    itertools.islice(read_trace_lines(iss_path), start, None),
+                    itertools.islice(read_rtl_trace(test), start, None),
+                    context, pbar if show_progress else None, start,
+                )
+    except OSError as e:
+        test_passed, report = False, [f"Error: Cannot compare traces: {e}"]
+    if report:
+        with open(sim_log_path, "a") as sim_log:
+            sim_log.write("\n".join(report) + "\n")
+
+    if show_status:
+        status = "\033[92mPASSED\033[0m" if test_passed else "\033[91mFAILED\033[0m"
+        safe_write(f"{test} {'.' * (50 - len(test))}. {status}")
+    return test_passed
 
-    # Write the updated rtl_log
-    with open(os.path.join("work", test, "rtl.log"), "w") as f:
-        f.write("\n".join(rtl_lines))
+def read_rtl_trace(test: str) -> Iterator[str]:
+    """Canonical lines of work/<test>/rtl.log, read incrementally."""
+    return merge_split_stores(read_trace_lines(os.path.join("work", test, "rtl.log")))
 
 def calculate_perf_stats(test: str):
-    # Open the rtl log file for this test
-    rtl_log_path = os.path.join("work", test, "rtl.log")
-    with open(rtl_log_path, "r") as f:
-        rtl_lines = f.readlines()
-    # Get the first line of the rtl log
-    first_line = rtl_lines[0].split(";")
-    # Get The last line of the rtl log
-    last_line = rtl_lines[-1].split(";")
-    # The number of instructions is how many lines in the RTL log we have
-    num_instructions = len(rtl_lines)
+    # The cycle column of the canonical rtl log of this test; the number of
+    # instructions is how many lines it has
+    try:
+        cycles = load_columns(os.path.join("work", test, "rtl.log"))[0]["cycle"]
+        num_instructions = len(cycles)
+        first_cycle, last_cycle = int(cycles[0]), int(cycles[-1])
+    except ValueError:
+        # An effect the column parser rejects (compare_results reports it):
+        # take the cycles from the text
+        num_instructions = 0
+        for line in read_rtl_trace(test):
+            if not num_instructions:
+                first_cycle = int(line.split(";")[0])
+            last_line = line
+            num_instructions += 1
+        last_cycle = int(last_line.split(";")[0])
     # The number of cycles is the difference between the last line and the first line
-    num_cycles = int(last_line[0]) - int(first_line[0])
+    num_cycles = last_cycle - first_cycle
     # The number of cycles per instruction is the number of cycles divided by the number of instructions
     cycles_per_instruction = num_cycles / num_instructions
     # The number of instructions per cycle is the number of instructions divided by the number of cycles
@@ -523,24 +935,266 @@ def run_e2e(
     simulator: str,
     hw_config: HwConfig,
     show_progress: bool = True,
-):
-    """Run a test through the entire pipeline."""
+    show_status: bool = True,
+    stats: Optional[Dict[str, float]] = None,
+    context: int = COMPARE_CONTEXT,
+    waves: Optional[WaveOptions] = None,
+    waves_on_fail: Optional[WaveOptions] = None,
+) -> bool:
+    """Run a test through the entire pipeline and return whether the traces match.
+
+    When *stats* is given, the seconds spent in each stage and the ISS
+    instruction count are added to it. *waves* dumps a waveform of the
+    Verilator run; *waves_on_fail* reruns a failing test to dump one around
+    the first mismatch instead, so passing tests are simulated untraced.
+    """
+    stats = {} if stats is None else stats
+    start = time.perf_counter()
+
+    def stage(name: str) -> None:
+        nonlocal start
+        now = time.perf_counter()
+        stats[name] = stats.get(name, 0.0) + now - start
+        start = now
+
     try:
         reset_vector = run_gen(test, hw_config)
-        run_iss(test, reset_vector)
+        stage("gen")
+        stats["instructions"] = stats.get("instructions", 0) + run_iss(test, reset_vector)
+        stage("iss")
         prepare_imem(test)
+        stage("imem")
         if simulator == "verilator":
-            run_verilator(test, reset_vector)
+            run_verilator(test, reset_vector, hw_config, waves)
         else:
             run_xsim(test, reset_vector)
-        process_rtl_log(test, show_progress=show_progress)
-        compare_results(test, show_progress=show_progress)
+        stage("rtl")
+        ingest_traces(test)
+        stage("ingest")
+        passed = compare_results(test, show_progress, show_status, context)
+        stage("compare")
+        if not passed and waves_on_fail is not None and simulator == "verilator":
+            wave_path = rerun_with_waves(test, reset_vector, hw_config, waves_on_fail)
+            stage("waves")
+            if show_status:
+                safe_write(f"{test}: waveform around the first mismatch in {wave_path}")
         calculate_perf_stats(test)
+        return passed
     except Exception as e:
         print(f"Error running test {test}: {e}")
         print(traceback.format_exc())
         sys.exit(1)
 
+CAMPAIGN_STAGES = ("gen", "iss", "imem", "rtl", "ingest", "compare")
+
+
+def run_campaign(
+    count: int,
+    hours: Optional[float],
+    mixes: Sequence[str],
+    first_seed: int,
+    simulator: str,
+    hw_config: HwConfig,
+    workers: int,
+    context: int = COMPARE_CONTEXT,
+    waves_on_fail: Optional[WaveOptions] = None,
+) -> Dict:
+    """Run constrained-random programs until *count* have finished or *hours* have
+    passed (whichever is set and comes first), keeping only the work directories
+    of failing seeds. Writes work/campaign.json and work/campaign_failures.tlist
+    and returns the summary."""
+    deadline = time.time() + hours * 3600 if hours else None
+    stage_seconds = dict.fromkeys(CAMPAIGN_STAGES, 0.0)
+    per_mix = {mix: {"programs": 0, "failed": 0} for mix in mixes}
+    failures: List[str] = []
+    instructions = 0
+    submitted = finished = 0
+    start = time.time()
+
+    def more() -> bool:
+        if count and submitted >= count:
+            return False
+        return deadline is None or time.time() < deadline
+
+    def run_one(test: str) -> Dict:
+        stats: Dict[str, float] = {}
+        try:
+            stats["passed"] = run_e2e(
+                test, simulator, hw_config, False, False, stats, context, waves_on_fail=waves_on_fail,
+            )
+        except (Exception, SystemExit):
+            stats["passed"] = False
+        return stats
+
+    pbar = tqdm(total=count or None, desc="Random campaign", unit="prog", ncols=100)
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+        pending = {}
+        while True:
+            while more() and len(pending) < workers:
+                mix = mixes[submitted % len(mixes)]
+                test = random_test_name(mix, first_seed + submitted)
+                pending[executor.submit(run_one, test)] = (test, mix)
+                submitted += 1
+            if not pending:
+                break
+            done, _ = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                test, mix = pending.pop(future)
+                stats = future.result()
+                finished += 1
+                per_mix[mix]["programs"] += 1
+                instructions += int(stats.get("instructions", 0))
+                for name in CAMPAIGN_STAGES:
+                    stage_seconds[name] += stats.get(name, 0.0)
+                if stats["passed"]:
+                    shutil.rmtree(os.path.join("work", test), ignore_errors=True)
+                else:
+                    failures.append(test)
+                    per_mix[mix]["failed"] += 1
+                    safe_write(f"{test} {'.' * (50 - len(test))}. \033[91mFAILED\033[0m")
+                elapsed_hours = max(time.time() - start, 1e-9) / 3600
+                pbar.set_postfix(failed=len(failures), per_hour=f"{finished / elapsed_hours:.0f}")
+                pbar.update(1)
+    pbar.close()
+
+    elapsed = time.time() - start
+    elapsed_hours = max(elapsed, 1e-9) / 3600
+    summary = {
+        "hw_config": hw_config.name,
+        "simulator": simulator,
+        "mixes": list(mixes),
+        "first_seed": first_seed,
+        "programs": finished,
+        "failed": len(failures),
+        "failing_tests": failures,
+        "instructions": instructions,
+        "wall_seconds": elapsed,
+        "workers": workers,
+        "programs_per_hour": finished / elapsed_hours,
+        "instructions_per_hour": instructions / elapsed_hours,
+        "programs_per_cpu_hour": finished / (elapsed_hours * workers),
+        "stage_seconds": stage_seconds,
+        "per_mix": per_mix,
+    }
+    with open(os.path.join("work", "campaign.json"), "w") as f:
+        json.dump(summary, f, indent=2)
+    with open(os.path.join("work", "campaign_failures.tlist"), "w") as f:
+        f.write("".join(f"{test}\n" for test in failures))
+    return summary
+
+# Declared cost of each regression stage kind (see stage_scheduler.StageCost).
+# run_regression sizes the model build to the slots and an RTL run to the model threads.
+STAGE_COSTS = {
+    "gen": StageCost(cpu=1, memory_mb=256, weight=2),
+    "iss": StageCost(cpu=1, memory_mb=512, weight=5),
+    "imem": StageCost(cpu=1, memory_mb=256, weight=1),
+    "build": StageCost(cpu=0, memory_mb=4096, limit=1, weight=60),
+    "rtl": StageCost(cpu=1, memory_mb=1024, weight=10),
+    "ingest": StageCost(cpu=1, memory_mb=512, weight=1),
+    "compare": StageCost(cpu=1, memory_mb=512, weight=1),
+}
+
+
+def run_regression(
+    tests: Sequence[str],
+    simulator: str,
+    hw_config: HwConfig,
+    cpus: int,
+    memory_mb: Optional[int] = None,
+    limits: Optional[Dict[str, int]] = None,
+    show_progress: bool = True,
+    context: int = COMPARE_CONTEXT,
+    waves: Optional[WaveOptions] = None,
+    waves_on_fail: Optional[WaveOptions] = None,
+    desc: str = "tests",
+) -> List[str]:
+    """Run *tests* as a DAG of stages on a StageScheduler and return the tests
+    whose stages raised.
+
+    Each test is gen -> (iss, imem); imem and the shared Verilator model
+    build -> rtl; (iss, rtl) -> ingest -> compare. Stages of different tests
+    overlap within *cpus* slots and *memory_mb* (default: the machine's),
+    and *limits* caps how many stages of a kind run at once.
+    """
+    costs = dict(STAGE_COSTS)
+    costs["rtl"] = costs["rtl"]._replace(cpu=hw_config.verilator.threads if simulator == "verilator" else 1)
+    # Leave a slot for the tests' compile and ISS stages while the model builds
+    costs["build"] = costs["build"]._replace(cpu=max(1, cpus - 1))
+    for kind, limit in (limits or {}).items():
+        costs[kind] = costs[kind]._replace(limit=limit)
+    scheduler = StageScheduler(cpus, memory_mb, costs)
+
+    build = None
+    if simulator == "verilator":
+        trace = waves.format if waves else None
+        build = scheduler.add("verilator model", "build", lambda jobs: verilator_model(hw_config, trace, jobs))
+
+    test_of: Dict[int, str] = {}
+    for test in tests:
+        state: Dict[str, int] = {}
+
+        def gen(_, test=test, state=state):
+            state["reset_vector"] = run_gen(test, hw_config)
+
+        def rtl(_, test=test, state=state):
+            if simulator == "verilator":
+                run_verilator(test, state["reset_vector"], hw_config, waves)
+            else:
+                run_xsim(test, state["reset_vector"])
+
+        def compare(_, test=test, state=state):
+            passed = compare_results(test, show_progress, True, context)
+            calculate_perf_stats(test)
+            if not passed and waves_on_fail is not None and simulator == "verilator":
+                wave_path = rerun_with_waves(test, state["reset_vector"], hw_config, waves_on_fail)
+                safe_write(f"{test}: waveform around the first mismatch in {wave_path}")
+            return passed
+
+        gen_node = scheduler.add(f"{test} gen", "gen", gen)
+        iss_node = scheduler.add(
+            f"{test} iss", "iss", lambda _, test=test, state=state: run_iss(test, state["reset_vector"]),
+            [gen_node],
+        )
+        imem_node = scheduler.add(f"{test} imem", "imem", lambda _, test=test: prepare_imem(test), [gen_node])
+        rtl_node = scheduler.add(f"{test} rtl", "rtl", rtl, [imem_node] + ([build] if build else []))
+        ingest_node = scheduler.add(
+            f"{test} ingest", "ingest", lambda _, test=test: ingest_traces(test), [iss_node, rtl_node],
+        )
+        compare_node = scheduler.add(f"{test} compare", "compare", compare, [ingest_node])
+        for node in (gen_node, iss_node, imem_node, rtl_node, ingest_node, compare_node):
+            test_of[id(node)] = test
+
+    parallel = len(tests) > 1
+    suite_pbar = tqdm(total=len(tests), desc=f"Running {desc}", unit="test", ncols=100, disable=not parallel)
+    failed: List[str] = []
+
+    def on_done(node) -> None:
+        test = test_of.get(id(node))
+        if node.state == "failed":
+            safe_write(f"Error running {node.name}: {node.error}")
+            if test is None:
+                return
+        if test is None or test in failed:
+            return
+        if node.state != "done":
+            failed.append(test)
+            suite_pbar.update(1)
+        elif node.kind == "compare":
+            suite_pbar.update(1)
+
+    scheduler.run(on_done)
+    suite_pbar.close()
+    return failed
+
+def report_cache() -> None:
+    """Print the artifact cache hits and misses of each stage looked up in this run."""
+    if _artifact_cache is None:
+        return
+    summary = _artifact_cache.summary()
+    if summary:
+        stages = ", ".join(f"{stage} {hits}/{hits + misses}" for stage, hits, misses in summary)
+        safe_write(f"Cache hits ({_artifact_cache.root}): {stages}")
+
 def main():
     # Parse arguments
     parser = argparse.ArgumentParser(
@@ -550,6 +1204,12 @@ def main():
     group = parser.add_mutually_exclusive_group(required=True)
     group.add_argument("-t", "--task-list", help="Path to the task list file")
     group.add_argument("-n", "--test-name", help="Name of the test to run")
+    group.add_argument(
+        "--campaign",
+        type=int,
+        metavar="N",
+        help="Run N constrained-random programs (0: until --campaign-hours), keeping only failing seeds",
+    )
     
     parser.add_argument(
         "-s", "--simulator",
@@ -562,15 +1222,219 @@ def main():
         default=str(default_hw_config_path()),
         help="Hardware preset YAML (cpu/vector/memory/software contract)",
     )
+    parser.add_argument(
+        "--compare-context",
+        type=int,
+        default=COMPARE_CONTEXT,
+        metavar="N",
+        help=f"Trace lines logged before and after the first mismatch (default: {COMPARE_CONTEXT})",
+    )
+    parser.add_argument(
+        "--campaign-hours",
+        type=float,
+        default=None,
+        metavar="H",
+        help="Stop the random campaign after H hours",
+    )
+    parser.add_argument(
+        "--mix",
+        action="append",
+        choices=list(MIXES),
+        default=None,
+        help=f"Random program mix, repeatable to rotate through several (default: {DEFAULT_MIX})",
+    )
+    parser.add_argument(
+        "--seed",
+        type=int,
+        default=None,
+        help="First seed of the random campaign (default: current time)",
+    )
+    parser.add_argument(
+        "-j", "--jobs",
+        type=int,
+        default=None,
+        metavar="N",
+        help="CPU slots shared by Verilator builds and simulations (default: all cores)",
+    )
+    parser.add_argument(
+        "--memory-budget",
+        type=float,
+        default=None,
+        metavar="GB",
+        help="Memory the stages of a regression may hold at once (default: physical memory)",
+    )
+    parser.add_argument(
+        "--stage-limit",
+        action="append",
+        default=[],
+        metavar="STAGE=N",
+        help=f"Run at most N stages of a kind at once, repeatable ({', '.join(STAGE_COSTS)})",
+    )
+    parser.add_argument(
+        "--verilator-threads",
+        type=int,
+        default=None,
+        metavar="N",
+        help="Build a multithreaded Verilator model (default: from the preset)",
+    )
+    parser.add_argument(
+        "--verilator-opt",
+        type=int,
+        choices=range(4),
+        default=None,
+        metavar="N",
+        help="Verilator -O level, 0-3 (default: from the preset)",
+    )
+    parser.add_argument(
+        "--x-assign",
+        choices=["0", "1", "fast", "unique"],
+        default=None,
+        help="Verilator --x-assign (default: from the preset)",
+    )
+    parser.add_argument(
+        "--output-split",
+        type=int,
+        default=None,
+        metavar="N",
+        help="Verilator --output-split, 0 to disable (default: from the preset)",
+    )
+    parser.add_argument(
+        "--no-ccache",
+        action="store_true",
+        help="Do not compile the Verilator model through ccache",
+    )
+    parser.add_argument(
+        "--waves",
+        action="store_true",
+        help="Dump a waveform of every Verilator run (work/<test>/core_top.<format>)",
+    )
+    parser.add_argument(
+        "--waves-on-fail",
+        action="store_true",
+        help="Rerun failing tests with a waveform around the first mismatch (work/<test>/waves/)",
+    )
+    parser.add_argument(
+        "--wave-format",
+        choices=["vcd", "fst"],
+        default="vcd",
+        help="Waveform format (default: vcd)",
+    )
+    parser.add_argument(
+        "--wave-depth",
+        type=int,
+        default=99,
+        metavar="N",
+        help="Hierarchy levels dumped (default: 99, all)",
+    )
+    parser.add_argument(
+        "--wave-window",
+        metavar="START:END",
+        default=None,
+        help="Dump only cycles START to END (either may be empty)",
+    )
+    parser.add_argument(
+        "--wave-pc",
+        type=lambda value: int(value, 0),
+        default=None,
+        metavar="ADDR",
+        help="Dump --wave-length cycles from the first retirement of ADDR",
+    )
+    parser.add_argument(
+        "--wave-length",
+        type=int,
+        default=WAVE_LENGTH,
+        metavar="N",
+        help=f"Cycles dumped after --wave-pc and on each side of a mismatch (default: {WAVE_LENGTH})",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        default=DEFAULT_CACHE_DIR,
+        help=f"Artifact cache shared by runs and checkouts (default: {DEFAULT_CACHE_DIR})",
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Run every stage, neither reading nor filling the artifact cache",
+    )
 
     args = parser.parse_args()
+    stage_limits = {}
+    for limit in args.stage_limit:
+        kind, _, count = limit.partition("=")
+        if kind not in STAGE_COSTS or not count.isdigit():
+            print(f"Error: bad --stage-limit '{limit}', expected STAGE=N with STAGE one of {', '.join(STAGE_COSTS)}")
+            sys.exit(1)
+        stage_limits[kind] = int(count)
+    waves = waves_on_fail = None
+    if args.waves or args.waves_on_fail:
+        if args.simulator != "verilator":
+            print("Error: waveform options need -s verilator")
+            sys.exit(1)
+        wave_options = WaveOptions(args.wave_format, args.wave_depth, pc=args.wave_pc, length=args.wave_length)
+        if args.wave_window:
+            start, _, stop = args.wave_window.partition(":")
+            try:
+                wave_options = wave_options._replace(start=int(start or 0), stop=int(stop) if stop else None)
+            except ValueError:
+                print(f"Error: bad --wave-window '{args.wave_window}', expected START:END")
+                sys.exit(1)
+        waves = wave_options if args.waves else None
+        waves_on_fail = wave_options if args.waves_on_fail and not args.waves else None
     hw_config = load_hw_config(args.hw_config)
+    overrides = {
+        "threads": args.verilator_threads,
+        "opt_level": args.verilator_opt,
+        "x_assign": args.x_assign,
+        "output_split": args.output_split,
+        "ccache": False if args.no_ccache else None,
+    }
+    overrides = {name: value for name, value in overrides.items() if value is not None}
+    if overrides.get("threads", 1) < 1 or overrides.get("output_split", 0) < 0:
+        print("Error: --verilator-threads must be >= 1 and --output-split >= 0")
+        sys.exit(1)
+    if overrides:
+        hw_config = dataclasses.replace(
+            hw_config, verilator=dataclasses.replace(hw_config.verilator, **overrides),
+        )
     write_hw_config_svh(_REPO_ROOT / "rtl" / "include" / "hw_config.svh", hw_config)
     safe_write(f"Hardware preset: {hw_config.name} ({hw_config.cpu.kind.value})")
     
     # Create work directory
     os.makedirs("work", exist_ok=True)
-    
+
+    # Get number of CPU cores
+    num_cores = multiprocessing.cpu_count()
+    global _job_budget
+    _job_budget = JobBudget(args.jobs or num_cores)
+
+    global _artifact_cache
+    if not args.no_cache:
+        # Random programs never repeat, so a campaign only reuses the RTL build
+        stages = ("rtl_build",) if args.campaign is not None else None
+        _artifact_cache = ArtifactCache(args.cache_dir, stages)
+
+    if args.campaign is not None:
+        if args.campaign < 0 or (args.campaign == 0 and not args.campaign_hours):
+            print("Error: --campaign needs N > 0 or --campaign-hours")
+            sys.exit(1)
+        seed = args.seed if args.seed is not None else int(time.time())
+        with start_iss_pool(num_cores):
+            summary = run_campaign(
+                args.campaign, args.campaign_hours, args.mix or [DEFAULT_MIX], seed,
+                args.simulator, hw_config, num_cores, args.compare_context, waves_on_fail,
+            )
+        safe_write(
+            f"\n{summary['programs']} program(s), {summary['failed']} failed, "
+            f"{summary['programs_per_hour']:.0f} programs/hour, "
+            f"{summary['instructions_per_hour']:.3g} instructions/hour "
+            f"({summary['programs_per_cpu_hour']:.0f} programs/CPU-hour)"
+        )
+        report_cache()
+        if summary['failed']:
+            safe_write("Failing seeds kept in work/; rerun with -t work/campaign_failures.tlist")
+            sys.exit(1)
+        return
+
     # Get list of tests to run
     tests = []
     if args.task_list:
@@ -584,44 +1448,20 @@ def main():
     else:
         tests = [args.test_name]
     
-    # Get number of CPU cores
-    num_cores = multiprocessing.cpu_count()
-    parallel = len(tests) > 1
-    show_progress = not parallel
-
-    # Run tests in parallel using thread pool
-    with concurrent.futures.ThreadPoolExecutor(max_workers=num_cores) as executor:
-        future_to_test = {
-            executor.submit(run_e2e, test, args.simulator, hw_config, show_progress): test
-            for test in tests
-        }
-
-        desc = os.path.basename(args.task_list) if args.task_list else "tests"
-        suite_pbar = tqdm(
-            total=len(tests),
-            desc=f"Running {desc}",
-            unit="test",
-            ncols=100,
-            disable=not parallel,
+    # Stages of all tests run on the DAG scheduler; ISS jobs go to the warm worker pool
+    with start_iss_pool(min(num_cores, len(tests))):
+        failed = run_regression(
+            tests, args.simulator, hw_config, _job_budget.total,
+            args.memory_budget * 1024 if args.memory_budget else None, stage_limits,
+            show_progress=len(tests) == 1, context=args.compare_context,
+            waves=waves, waves_on_fail=waves_on_fail,
+            desc=os.path.basename(args.task_list) if args.task_list else "tests",
         )
 
-        failed = []
-        for future in concurrent.futures.as_completed(future_to_test):
-            test = future_to_test[future]
-            try:
-                future.result()
-            except Exception as e:
-                failed.append(test)
-                safe_write(f"Error running test {test}: {e}")
-            if parallel:
-                suite_pbar.update(1)
-
-        if parallel:
-            suite_pbar.close()
-
-        if failed:
-            safe_write(f"\n{len(failed)} test(s) failed: {', '.join(failed)}")
-            sys.exit(1)
+    report_cache()
+    if failed:
+        safe_write(f"\n{len(failed)} test(s) failed: {', '.join(failed)}")
+        sys.exit(1)
 
 if __name__ == "__main__":
     try:
@@ -0,0 +1,293 @@
+#!/usr/bin/env python3
+
+# Copyright (c) 2025 Siliscale Consulting, LLC
+# SPDX-License-Identifier: Apache-2.0
+
+"""
+SimPoint-style representative region selection
+
+Clusters the basic-block vectors written by rv_iss.py --bbv and picks one
+representative interval per cluster, weighted by the share of instructions
+its cluster covers. As in SimPoint, the normalized vectors are randomly
+projected to a few dimensions, k-means runs for k = 1..max_k, and the
+smallest k whose BIC score reaches 90% of the best is chosen.
+
+  pick      cluster a .bb file; write the regions (start PC, instruction
+            count to fast-forward, length, weight) and optionally one
+            ISS checkpoint per region
+  estimate  combine per-region CPIs into a whole-program estimate, either
+            given (e.g. from RTL runs of the regions) or predicted with the
+            ISS timing model
+"""
+
+import argparse
+import json
+import math
+import os
+import sys
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+_REPO_ROOT = Path(__file__).resolve().parents[1]
+if str(_REPO_ROOT) not in sys.path:
+    sys.path.insert(0, str(_REPO_ROOT))
+
+from hw import HwConfig, load_hw_config
+from iss_timing import TimingModel
+from rv_iss import RISC_V_ISS, NullTraceWriter
+
+# Defaults of the SimPoint 3.0 tool
+DEFAULT_MAX_K = 10
+DEFAULT_DIM = 15
+DEFAULT_BIC_THRESHOLD = 0.9
+
+
+def read_bbv(path: str) -> Tuple[np.ndarray, Dict]:
+    """Load a .bb file and its .json sidecar as (intervals x blocks matrix, info)"""
+    rows = []
+    with open(path, 'r') as f:
+        for line in f:
+            if not line.startswith('T'):
+                continue
+            row = {}
+            for entry in line[1:].split():
+                _, block, count = entry.split(':')
+                row[int(block)] = int(count)
+            rows.append(row)
+    with open(path + '.json', 'r') as f:
+        info = json.load(f)
+    if len(rows) != len(info['intervals']):
+        raise ValueError(f"{path}: {len(rows)} vectors but {len(info['intervals'])} intervals in the sidecar")
+    blocks = max((max(row) for row in rows if row), default=0)
+    matrix = np.zeros((len(rows), blocks), dtype=np.float64)
+    for i, row in enumerate(rows):
+        for block, count in row.items():
+            matrix[i, block - 1] = count
+    return matrix, info
+
+
+def project(vectors: np.ndarray, dim: int, seed: int) -> np.ndarray:
+    """Normalize each vector to sum 1 and randomly project it to dim dimensions"""
+    totals = vectors.sum(axis=1, keepdims=True)
+    normalized = vectors / np.where(totals == 0, 1, totals)
+    if normalized.shape[1] <= dim:
+        return normalized
+    rng = np.random.default_rng(seed)
+    return normalized @ rng.uniform(-1.0, 1.0, size=(normalized.shape[1], dim))
+
+
+def kmeans(points: np.ndarray, k: int, seed: int, inits: int = 5,
+           iterations: int = 100) -> Tuple[np.ndarray, np.ndarray, float]:
+    """Best of `inits` k-means++ runs as (labels, centroids, sum of squared distances)"""
+    rng = np.random.default_rng(seed)
+    best = None
+    for _ in range(inits):
+        # k-means++ seeding
+        centroids = [points[rng.integers(len(points))]]
+        for _ in range(1, k):
+            distances = np.min([((points - c) ** 2).sum(axis=1) for c in centroids], axis=0)
+            total = distances.sum()
+            if total == 0:
+                centroids.append(points[rng.integers(len(points))])
+            else:
+                centroids.append(points[rng.choice(len(points), p=distances / total)])
+        centroids = np.array(centroids)
+        labels = None
+        for _ in range(iterations):
+            distances = ((points[:, None, :] - centroids[None, :, :]) ** 2).sum(axis=2)
+            new_labels = distances.argmin(axis=1)
+            if labels is not None and np.array_equal(labels, new_labels):
+                break
+            labels = new_labels
+            for c in range(k):
+                members = points[labels == c]
+                if len(members):
+                    centroids[c] = members.mean(axis=0)
+        sse = float(((points - centroids[labels]) ** 2).sum())
+        if best is None or sse < best[2]:
+            best = (labels, centroids, sse)
+    return best
+
+
+def bic(points: np.ndarray, labels: np.ndarray, k: int, sse: float) -> float:
+    """Bayesian information criterion of a clustering (spherical Gaussians, as in X-means)"""
+    r, m = points.shape
+    variance = sse / (m * max(r - k, 1)) or 1e-12
+    likelihood = 0.0
+    for c in range(k):
+        size = int((labels == c).sum())
+        if size:
+            likelihood += (size * math.log(size) - size * math.log(r)
+                           - size * m / 2 * math.log(2 * math.pi * variance)
+                           - (size - k) / 2)
+    parameters = (k - 1) + m * k + 1
+    return likelihood - parameters / 2 * math.log(r)
+
+
+def pick(bbv_file: str, max_k: int = DEFAULT_MAX_K, dim: int = DEFAULT_DIM, seed: int = 1,
+         threshold: float = DEFAULT_BIC_THRESHOLD) -> Dict:
+    """Cluster the intervals of bbv_file and return the representative regions"""
+    vectors, info = read_bbv(bbv_file)
+    if not len(vectors):
+        raise ValueError(f"{bbv_file}: no intervals")
+    points = project(vectors, dim, seed)
+    clusterings = []
+    for k in range(1, min(max_k, len(points)) + 1):
+        labels, centroids, sse = kmeans(points, k, seed + k)
+        clusterings.append((k, labels, centroids, bic(points, labels, k, sse)))
+    scores = [score for _, _, _, score in clusterings]
+    low, high = min(scores), max(scores)
+    k, labels, centroids, _ = next(c for c in clusterings
+                                   if c[3] >= low + threshold * (high - low))
+
+    intervals = info['intervals']
+    lengths = np.array([interval['length'] for interval in intervals], dtype=np.float64)
+    regions = []
+    for c in range(k):
+        members = np.flatnonzero(labels == c)
+        if not len(members):
+            continue
+        # Representative: the member closest to the centroid
+        distances = ((points[members] - centroids[c]) ** 2).sum(axis=1)
+        index = int(members[distances.argmin()])
+        regions.append({
+            'cluster': c,
+            'interval': index,
+            'start_pc': intervals[index]['start_pc'],
+            'start_count': intervals[index]['start_count'],
+            'length': intervals[index]['length'],
+            'weight': float(lengths[members].sum() / lengths.sum()),
+        })
+    regions.sort(key=lambda region: region['start_count'])
+    return {
+        'bbv': bbv_file,
+        'interval': info['interval'],
+        'intervals': len(intervals),
+        'instructions': int(lengths.sum()),
+        'k': k,
+        'bic': dict(zip(range(1, len(scores) + 1), scores)),
+        'regions': regions,
+    }
+
+
+def save_checkpoints(simpoints: Dict, elf_file: str, text_start: int, directory: str,
+                     hex_file: Optional[str] = None, stack_base: int = 0x7FFFF000,
+                     stack_size: int = 0x1000):
+    """Checkpoint the ISS at the start of every region in one untraced run"""
+    os.makedirs(directory, exist_ok=True)
+    template = os.path.join(directory, 'simpoint_{count}.ckpt')
+    counts = [region['start_count'] for region in simpoints['regions']]
+    iss = RISC_V_ISS(text_start, stack_base, stack_size)
+    iss.run(elf_file, NullTraceWriter(), hex_file, translate=True,
+            checkpoint_at=counts, checkpoint_file=template)
+    for region in simpoints['regions']:
+        region['checkpoint'] = template.format(count=region['start_count'])
+
+
+def weighted_cpi(simpoints: Dict, cpis: Sequence[float]) -> float:
+    """Whole-program CPI from one CPI per region (in the order of simpoints['regions'])"""
+    regions = simpoints['regions']
+    if len(cpis) != len(regions):
+        raise ValueError(f"expected {len(regions)} region CPIs, got {len(cpis)}")
+    weights = sum(region['weight'] for region in regions)
+    return sum(region['weight'] * cpi for region, cpi in zip(regions, cpis)) / weights
+
+
+def predict_regions(simpoints: Dict, elf_file: str, text_start: int, hw_config: HwConfig,
+                    hex_file: Optional[str] = None) -> List[float]:
+    """CPI of every region under the ISS timing model, starting from its
+    checkpoint if one was saved, otherwise fast-forwarding from reset"""
+    cpis = []
+    for region in simpoints['regions']:
+        iss = RISC_V_ISS(text_start, 0x7FFFF000, 0x1000)
+        iss.trace_mnemonics = False
+        checkpoint = region.get('checkpoint')
+        iss.load_program(elf_file, hex_file, checkpoint)
+        if not checkpoint:
+            iss.execute(NullTraceWriter(), region['start_count'], translate=True)
+        model = TimingModel(hw_config, iss.regs.regs)
+        iss.execute(model, region['length'], translate=True)
+        cpis.append(model.report()['cpi'])
+    return cpis
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Pick SimPoint-style representative regions from ISS basic-block vectors',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog='''
+Examples:
+  rv_iss.py prog.elf 0x100000 0x7FFFF000 0x1000 --trace-format none --bbv prog.bb --bbv-interval 1000000
+  %(prog)s pick prog.bb -o simpoints.json --checkpoints ckpt --elf prog.elf --entry 0x100000
+  %(prog)s estimate simpoints.json --cpi 1.31 1.18 2.05
+  %(prog)s estimate simpoints.json --elf prog.elf --entry 0x100000 --hw-config hw/presets/rv32im_scalar.yaml
+        '''
+    )
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    pick_parser = subparsers.add_parser('pick', help='Cluster a .bb file into weighted regions')
+    pick_parser.add_argument('bbv', metavar='BB_FILE', help='Vectors from rv_iss.py --bbv')
+    pick_parser.add_argument('-o', '--output', default='simpoints.json', metavar='JSON_FILE',
+                             help='Region file (default: simpoints.json)')
+    pick_parser.add_argument('--max-k', type=int, default=DEFAULT_MAX_K,
+                             help=f'Largest number of clusters (default: {DEFAULT_MAX_K})')
+    pick_parser.add_argument('--dim', type=int, default=DEFAULT_DIM,
+                             help=f'Random projection dimensions (default: {DEFAULT_DIM})')
+    pick_parser.add_argument('--seed', type=int, default=1)
+    pick_parser.add_argument('--checkpoints', default=None, metavar='DIR',
+                             help='Save an ISS checkpoint at every region start (needs --elf, --entry)')
+
+    estimate_parser = subparsers.add_parser('estimate', help='Weighted whole-program CPI')
+    estimate_parser.add_argument('simpoints', metavar='JSON_FILE', help='Output of pick')
+    source = estimate_parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--cpi', type=float, nargs='+', default=None,
+                        help='Measured CPI of every region, in region order')
+    source.add_argument('--hw-config', default=None,
+                        help='Predict the region CPIs with the ISS timing model under this preset')
+
+    for sub in (pick_parser, estimate_parser):
+        sub.add_argument('--elf', default=None, help='ELF the vectors were collected from')
+        sub.add_argument('--entry', type=lambda x: int(x, 16), default=None,
+                         help='Entry PC used for the collection (hex)')
+        sub.add_argument('-m', '--mem-file', default=None, metavar='HEX_FILE',
+                         help='Hex file to preload data memory')
+
+    args = parser.parse_args()
+    needs_elf = args.checkpoints if args.command == 'pick' else args.hw_config
+    if needs_elf and (args.elf is None or args.entry is None):
+        parser.error("--elf and --entry are required to run the ISS")
+
+    try:
+        if args.command == 'pick':
+            simpoints = pick(args.bbv, args.max_k, args.dim, args.seed)
+            if args.checkpoints:
+                save_checkpoints(simpoints, args.elf, args.entry, args.checkpoints, args.mem_file)
+            with open(args.output, 'w') as f:
+                json.dump(simpoints, f, indent=2)
+                f.write('\n')
+            print(f"{simpoints['intervals']} intervals of {simpoints['interval']} instructions "
+                  f"-> {simpoints['k']} regions ({args.output})")
+            for region in simpoints['regions']:
+                print(f"  interval {region['interval']:5d}  --start-count {region['start_count']:<10d} "
+                      f"PC {region['start_pc']}  length {region['length']:<8d} weight {region['weight']:.4f}")
+        else:
+            with open(args.simpoints, 'r') as f:
+                simpoints = json.load(f)
+            if args.cpi is not None:
+                cpis = args.cpi
+            else:
+                cpis = predict_regions(simpoints, args.elf, args.entry,
+                                       load_hw_config(args.hw_config), args.mem_file)
+            for region, cpi in zip(simpoints['regions'], cpis):
+                print(f"  interval {region['interval']:5d}  weight {region['weight']:.4f}  CPI {cpi:.4f}")
+            cpi = weighted_cpi(simpoints, cpis)
+            print(f"Weighted CPI: {cpi:.4f} (IPC {1 / cpi if cpi else 0:.4f})")
+    except (OSError, ValueError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,192 @@
+# Copyright (c) 2025 Siliscale Consulting, LLC
+# SPDX-License-Identifier: Apache-2.0
+
+"""
+Resource-aware asyncio scheduler for a DAG of blocking stages
+
+Each node is one stage of one test (or a stage shared by several tests, such
+as a simulator model build). A node declares its kind, the nodes it depends
+on, and its cost: CPU slots and memory. It starts once its dependencies have
+finished and the CPU, memory and per-kind concurrency limit allow it. Its
+callable runs in a worker thread, so subprocess-heavy stages from different
+tests overlap. Among the ready nodes, the one with the longest estimated path
+to the end of the graph is started first (critical-path list scheduling), so
+the total wall time approaches the critical path.
+
+A node that raises is recorded as failed, and every node that depends on it is
+skipped; unrelated nodes keep running.
+"""
+
+import asyncio
+import concurrent.futures
+import itertools
+import os
+import traceback
+from typing import Callable, Dict, Iterable, List, NamedTuple, Optional
+
+
+class StageCost(NamedTuple):
+    """Declared cost of a stage kind.
+
+    cpu: slots held while it runs; 0 takes every free slot (at least one),
+    for stages that parallelize internally, such as a C++ build.
+    memory_mb: memory held while it runs.
+    limit: most nodes of the kind running at once (0: no limit).
+    weight: relative duration estimate, used only to rank ready nodes.
+    """
+    cpu: int = 1
+    memory_mb: int = 0
+    limit: int = 0
+    weight: float = 1.0
+
+
+class Node:
+    """One stage: *func(cpus)* runs in a thread with the CPU slots it was granted."""
+
+    def __init__(self, name: str, kind: str, func: Callable[[int], object],
+                 deps: Iterable['Node'] = (), cost: Optional[StageCost] = None):
+        self.name = name
+        self.kind = kind
+        self.func = func
+        self.deps = list(deps)
+        self.cost = cost
+        self.priority = 0.0
+        self.state = 'pending'  # pending, running, done, failed, skipped
+        self.result = None
+        self.error: Optional[str] = None
+
+
+def total_memory_mb() -> int:
+    """Physical memory of the machine in MB (0 if unknown: no memory limit)."""
+    try:
+        return os.sysconf('SC_PHYS_PAGES') * os.sysconf('SC_PAGE_SIZE') // (1 << 20)
+    except (ValueError, OSError, AttributeError):
+        return 0
+
+
+class _Resources:
+    """CPU slots, memory and per-kind limits, granted to waiting nodes by priority."""
+
+    def __init__(self, cpus: int, memory_mb: int):
+        self.cpus = max(1, cpus)
+        self.memory_mb = memory_mb
+        self._free_cpus = self.cpus
+        self._free_memory = memory_mb
+        self._running: Dict[str, int] = {}
+        self._order = itertools.count()
+        # (-priority, arrival, node, cost, future)
+        self._waiting: List[tuple] = []
+
+    def _fits(self, node: Node, cost: StageCost) -> Optional[int]:
+        """CPU slots the node would get now, or None if it has to wait."""
+        if cost.limit and self._running.get(node.kind, 0) >= cost.limit:
+            return None
+        # An oversized node still runs once nothing else holds memory
+        if self.memory_mb and cost.memory_mb > self._free_memory and self._free_memory < self.memory_mb:
+            return None
+        if cost.cpu == 0:
+            return self._free_cpus if self._free_cpus else None
+        want = min(cost.cpu, self.cpus)
+        return want if self._free_cpus >= want else None
+
+    def _dispatch(self) -> None:
+        self._waiting.sort(key=lambda waiter: waiter[:2])
+        for waiter in list(self._waiting):
+            _, _, node, cost, future = waiter
+            cpus = self._fits(node, cost)
+            if cpus is None:
+                continue
+            self._waiting.remove(waiter)
+            self._free_cpus -= cpus
+            self._free_memory -= cost.memory_mb
+            self._running[node.kind] = self._running.get(node.kind, 0) + 1
+            future.set_result(cpus)
+
+    async def acquire(self, node: Node, cost: StageCost) -> int:
+        future = asyncio.get_running_loop().create_future()
+        self._waiting.append((-node.priority, next(self._order), node, cost, future))
+        self._dispatch()
+        return await future
+
+    def release(self, node: Node, cost: StageCost, cpus: int) -> None:
+        self._free_cpus += cpus
+        self._free_memory += cost.memory_mb
+        self._running[node.kind] -= 1
+        self._dispatch()
+
+
+class StageScheduler:
+    """Runs a DAG of Nodes within a CPU and memory budget."""
+
+    def __init__(self, cpus: int, memory_mb: Optional[int] = None,
+                 costs: Optional[Dict[str, StageCost]] = None):
+        """memory_mb defaults to the machine's memory; costs gives the
+        StageCost of each node kind (a node's own cost takes precedence)."""
+        self.cpus = max(1, cpus)
+        self.memory_mb = total_memory_mb() if memory_mb is None else memory_mb
+        self.costs = dict(costs or {})
+        self.nodes: List[Node] = []
+
+    def add(self, name: str, kind: str, func: Callable[[int], object],
+            deps: Iterable[Node] = (), cost: Optional[StageCost] = None) -> Node:
+        node = Node(name, kind, func, deps, cost)
+        self.nodes.append(node)
+        return node
+
+    def _cost(self, node: Node) -> StageCost:
+        return node.cost or self.costs.get(node.kind, StageCost())
+
+    def _prioritize(self) -> None:
+        """Priority of a node: its weight plus the heaviest path through its dependents."""
+        dependents: Dict[int, List[Node]] = {id(node): [] for node in self.nodes}
+        for node in self.nodes:
+            for dep in node.deps:
+                dependents[id(dep)].append(node)
+        # Nodes are added after their dependencies, so a reverse pass sees every dependent first
+        for node in reversed(self.nodes):
+            below = max((child.priority for child in dependents[id(node)]), default=0.0)
+            node.priority = self._cost(node).weight + below
+
+    async def _run_node(self, node: Node, done: Dict[int, asyncio.Event],
+                        resources: _Resources, executor: concurrent.futures.Executor,
+                        on_done: Optional[Callable[[Node], None]]) -> None:
+        try:
+            for dep in node.deps:
+                await done[id(dep)].wait()
+            failed = [dep.name for dep in node.deps if dep.state != 'done']
+            if failed:
+                node.state, node.error = 'skipped', f"dependency {failed[0]} did not complete"
+                return
+            cost = self._cost(node)
+            cpus = await resources.acquire(node, cost)
+            node.state = 'running'
+            try:
+                loop = asyncio.get_running_loop()
+                node.result = await loop.run_in_executor(executor, node.func, cpus)
+                node.state = 'done'
+            except (Exception, SystemExit) as e:
+                node.state = 'failed'
+                node.error = f"{type(e).__name__}: {e}\n{traceback.format_exc()}"
+            finally:
+                resources.release(node, cost, cpus)
+        finally:
+            done[id(node)].set()
+            if on_done is not None:
+                on_done(node)
+
+    async def run_async(self, on_done: Optional[Callable[[Node], None]] = None) -> List[Node]:
+        self._prioritize()
+        resources = _Resources(self.cpus, self.memory_mb)
+        done = {id(node): asyncio.Event() for node in self.nodes}
+        # Granted nodes hold at least one slot each, so this many threads never queue
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.cpus) as executor:
+            await asyncio.gather(*(
+                self._run_node(node, done, resources, executor, on_done) for node in self.nodes
+            ))
+        return self.nodes
+
+    def run(self, on_done: Optional[Callable[[Node], None]] = None) -> List[Node]:
+        """Run every node; *on_done(node)* is called in the event loop as each one
+        finishes, fails or is skipped. Returns the nodes with their state, result
+        and error."""
+        return asyncio.run(self.run_async(on_done))
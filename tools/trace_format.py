@@ -0,0 +1,461 @@
+#!/usr/bin/env python3
+
+# Copyright (c) 2025 Siliscale Consulting, LLC
+# SPDX-License-Identifier: Apache-2.0
+
+"""
+Binary trace format reader and text <-> binary converter
+
+A binary trace is a TRACE_HEADER followed by fixed-width TRACE_RECORDs (see
+rv_iss.py). read_trace() maps the records straight into a NumPy structured
+array, so a multi-million-instruction trace loads without parsing. The text
+helpers parse and render the ';'-separated iss.log / rtl.log layouts and are
+meant for debugging and for converting traces between the two encodings.
+Raw ISS traces (rv_iss.py --trace-format raw) leave the disassembly field
+empty; pretty() renders the mnemonics back in.
+
+Text traces are parsed once: load_columns() stores the parsed trace as one
+raw little-endian file per TRACE_DTYPE field under .trace_cache/ next to the
+trace, with the size, mtime and SHA-256 of the text it came from, and later
+calls memory-map the columns instead of parsing again. An RTL trace is
+cached in canonical form, with split unaligned stores merged
+(merge_split_stores).
+"""
+
+import argparse
+import hashlib
+import itertools
+import json
+import os
+import sys
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from rv_iss import (
+    EFF_EBREAK, EFF_ECALL, EFF_JUMP, EFF_LOAD, EFF_NONE, EFF_NOT_TAKEN, EFF_REG,
+    EFF_STORE, EFF_TAKEN, TRACE_HEADER, TRACE_MAGIC, TRACE_RECORD, TRACE_SOURCE_ISS,
+    TRACE_SOURCE_RTL, TRACE_VERSION, disassemble, format_effect,
+)
+
+# Packed little-endian layout identical to TRACE_RECORD
+TRACE_DTYPE = np.dtype([
+    ('cycle', '<u4'),
+    ('pc', '<u4'),
+    ('instr', '<u4'),
+    ('kind', 'u1'),
+    ('rd', 'u1'),
+    ('value', '<u4'),
+    ('addr', '<u4'),
+])
+assert TRACE_DTYPE.itemsize == TRACE_RECORD.size
+
+SOURCE_NAMES = {TRACE_SOURCE_ISS: 'iss', TRACE_SOURCE_RTL: 'rtl'}
+
+# Records converted to Python tuples at a time when streaming a binary trace
+CHUNK_RECORDS = 65536
+
+# Directory, next to a text trace, that holds its parsed columns
+CACHE_DIR = '.trace_cache'
+CACHE_VERSION = 1
+
+
+def is_binary_trace(path: str) -> bool:
+    """True if path starts with the binary trace magic"""
+    with open(path, 'rb') as f:
+        return f.read(len(TRACE_MAGIC)) == TRACE_MAGIC
+
+
+def read_header(path: str) -> Tuple[int, int]:
+    """Validate the header of a binary trace and return (version, source)"""
+    with open(path, 'rb') as f:
+        raw = f.read(TRACE_HEADER.size)
+    if len(raw) < TRACE_HEADER.size:
+        raise ValueError(f"{path}: truncated trace header")
+    magic, version, source, record_size = TRACE_HEADER.unpack(raw)
+    if magic != TRACE_MAGIC:
+        raise ValueError(f"{path}: not a binary trace")
+    if version != TRACE_VERSION or record_size != TRACE_DTYPE.itemsize:
+        raise ValueError(f"{path}: unsupported trace version {version} (record size {record_size})")
+    return version, source
+
+
+def read_trace(path: str, mmap: bool = True) -> np.ndarray:
+    """Load a binary trace as a structured array of TRACE_DTYPE records.
+
+    With mmap=True the array is a read-only view of the file, so loading is
+    O(1) and only the touched pages are read.
+    """
+    read_header(path)
+    if mmap:
+        with open(path, 'rb') as f:
+            f.seek(0, 2)
+            if f.tell() == TRACE_HEADER.size:
+                # np.memmap refuses empty mappings
+                return np.zeros(0, dtype=TRACE_DTYPE)
+        return np.memmap(path, dtype=TRACE_DTYPE, mode='r', offset=TRACE_HEADER.size)
+    with open(path, 'rb') as f:
+        f.seek(TRACE_HEADER.size)
+        return np.frombuffer(f.read(), dtype=TRACE_DTYPE)
+
+
+def write_trace(path: str, records: np.ndarray, source: int = TRACE_SOURCE_ISS):
+    """Write a structured array of TRACE_DTYPE records as a binary trace"""
+    with open(path, 'wb') as f:
+        f.write(TRACE_HEADER.pack(TRACE_MAGIC, TRACE_VERSION, source, TRACE_DTYPE.itemsize))
+        f.write(np.ascontiguousarray(records, dtype=TRACE_DTYPE).tobytes())
+
+
+def parse_effect(effect: str) -> Tuple[int, int, int, int]:
+    """Parse the effects part of a trace line into (kind, rd, value, addr)"""
+    if effect == "":
+        return EFF_NONE, 0, 0, 0
+    if effect == "ecall":
+        return EFF_ECALL, 0, 0, 0
+    if effect == "ebreak":
+        return EFF_EBREAK, 0, 0, 0
+    if effect == "taken=false":
+        return EFF_NOT_TAKEN, 0, 0, 0
+    if effect.startswith("taken=true;pc="):
+        return EFF_TAKEN, 0, 0, int(effect[14:], 16) & 0xFFFFFFFF
+    if effect.startswith("mem["):
+        addr, value = effect[4:].split("]=")
+        return EFF_STORE, 0, int(value, 16) & 0xFFFFFFFF, int(addr, 16) & 0xFFFFFFFF
+    if effect.startswith("x"):
+        if " // Loading from " in effect:
+            write, addr = effect.split(" // Loading from ")
+            kind = EFF_LOAD
+        elif ";pc=" in effect:
+            write, addr = effect.split(";pc=")
+            kind = EFF_JUMP
+        else:
+            write, addr = effect, "0"
+            kind = EFF_REG
+        rd, value = write[1:].split("=")
+        return kind, int(rd), int(value, 16) & 0xFFFFFFFF, int(addr, 16) & 0xFFFFFFFF
+    raise ValueError(f"unrecognised trace effect: {effect!r}")
+
+
+def _iter_text(lines: Iterable[str]) -> Iterator[Tuple[Tuple[int, ...], int]]:
+    """Yield (record tuple, source) for each instruction line of a text trace"""
+    source = None
+    for line in lines:
+        line = line.rstrip('\n')
+        if not line or line.startswith('['):
+            continue
+        fields = line.split(';')
+        if source is None:
+            source = TRACE_SOURCE_ISS if fields[0].startswith('0x') else TRACE_SOURCE_RTL
+        if source == TRACE_SOURCE_ISS:
+            # PC;INSTR;DISASM;EFFECTS (the disassembly never contains ';')
+            cycle, pc, instr = 0, fields[0], fields[1]
+        else:
+            # CYCLE;PC;INSTR;EFFECTS
+            cycle, pc, instr = int(fields[0]), fields[1], fields[2]
+        kind, rd, value, addr = parse_effect(';'.join(fields[3:]))
+        yield (cycle, int(pc, 16), int(instr, 16), kind, rd, value, addr), source
+
+
+def parse_text_trace(lines: Iterable[str]) -> Tuple[np.ndarray, int]:
+    """Parse iss.log or rtl.log lines into (records, source).
+
+    The source is detected from the first field: ISS lines start with the PC,
+    RTL lines with the cycle count. RTL status lines ("[...] ...") are skipped.
+    """
+    rows: List[Tuple[int, ...]] = []
+    source = TRACE_SOURCE_ISS
+    for row, source in _iter_text(lines):
+        rows.append(row)
+    return np.array(rows, dtype=TRACE_DTYPE), source
+
+
+def _merge_store(first: List[str], second: List[str]) -> str:
+    """One line for an unaligned store the RTL logged in two parts.
+
+    The first part holds the lower bytes (at the store address), the second
+    the higher bytes (at the next word). For example, storing 0xCAFEBABE at
+    0xE logs mem[0xE]=0xBABE then mem[0x10]=0xCAFE, which merge into
+    mem[0xE]=0xCAFEBABE.
+    """
+    effect, nxt_effect = first[3], second[3]
+    mem_addr = effect.split('[')[1].split(']')[0]
+    alignment = int(mem_addr, 16) % 4
+    lower_bytes = effect.split('=')[1].lstrip('0x')[:8 - alignment * 2]
+    higher_bytes = nxt_effect.split('=')[1].lstrip('0x')[:8 - alignment * 2]
+    return f"{first[0]};{first[1]};{first[2]};mem[{mem_addr}]=0x{higher_bytes}{lower_bytes}"
+
+
+def merge_split_stores(rtl_lines: Iterable[str]) -> Iterator[str]:
+    """Canonical RTL trace: rtl_lines with every unaligned store that the RTL
+    logs as two lines (same PC and instruction, both writing memory) merged
+    into one.
+
+    A single linear pass holding one line of lookahead, so it can sit in front
+    of any consumer without rewriting rtl.log.
+    """
+    pending: Optional[List[str]] = None
+    pending_line = ''
+    for line in rtl_lines:
+        parts = line.split(';')
+        if pending is not None:
+            if (len(pending) > 3 and len(parts) > 3 and
+                    pending[1] == parts[1] and pending[2] == parts[2] and
+                    'mem[' in pending[3] and 'mem[' in parts[3]):
+                yield _merge_store(pending, parts)
+                pending = None
+                continue
+            yield pending_line
+        pending, pending_line = parts, line
+    if pending is not None:
+        yield pending_line
+
+
+def format_records(records: np.ndarray, source: int = TRACE_SOURCE_ISS) -> Iterator[str]:
+    """Render records back to iss.log (source ISS) or rtl.log (source RTL) lines"""
+    for cycle, pc, instr, kind, rd, value, addr in records.tolist():
+        effect = format_effect(kind, rd, value, addr)
+        if source == TRACE_SOURCE_ISS:
+            yield f"0x{pc:08X};0x{instr:08X};{disassemble(instr)};{effect}"
+        else:
+            yield f"{cycle:5d};0x{pc:08X};0x{instr:08X};{effect}"
+
+
+def to_binary(input_file: str, output_file: str) -> int:
+    """Convert a text trace to binary; returns the number of records"""
+    with open(input_file, 'r') as f:
+        records, source = parse_text_trace(f)
+    write_trace(output_file, records, source)
+    return len(records)
+
+
+def to_text(input_file: str, output_file: str) -> int:
+    """Convert a binary trace to text (newline-separated, no trailing newline)"""
+    _, source = read_header(input_file)
+    records = read_trace(input_file)
+    with open(output_file, 'w') as f:
+        f.write('\n'.join(format_records(records, source)))
+    return len(records)
+
+
+def load_any(input_file: str) -> Tuple[np.ndarray, int]:
+    """Load a binary or text (full or raw) trace as (records, source)"""
+    if is_binary_trace(input_file):
+        _, source = read_header(input_file)
+        return read_trace(input_file), source
+    columns, source = load_columns(input_file)
+    records = np.empty(len(columns['pc']), dtype=TRACE_DTYPE)
+    for name, column in columns.items():
+        records[name] = column
+    return records, source
+
+
+def _file_digest(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+def _text_lines(f) -> Iterator[str]:
+    """Instruction lines of an open text trace, canonical for RTL traces"""
+    lines = (line.rstrip('\n') for line in f)
+    lines = (line for line in lines if line and not line.startswith('['))
+    first = next(lines, None)
+    if first is None:
+        return
+    lines = itertools.chain([first], lines)
+    if not first.startswith('0x'):
+        lines = merge_split_stores(lines)
+    yield from lines
+
+
+def _cache_path(input_file: str, cache_dir: Optional[str]) -> str:
+    directory = cache_dir or os.path.join(os.path.dirname(os.path.abspath(input_file)), CACHE_DIR)
+    return os.path.join(directory, os.path.basename(input_file))
+
+
+def _open_columns(path: str, meta: Dict) -> Dict[str, np.ndarray]:
+    columns = {}
+    for name in TRACE_DTYPE.names:
+        if meta['records']:
+            columns[name] = np.memmap(os.path.join(path, name), dtype=TRACE_DTYPE[name], mode='r')
+        else:
+            # np.memmap refuses empty mappings
+            columns[name] = np.zeros(0, dtype=TRACE_DTYPE[name])
+    return columns
+
+
+def _write_columns(input_file: str, path: str, meta: Dict) -> Dict:
+    """Parse a text trace into column files under path; returns the completed meta"""
+    os.makedirs(path, exist_ok=True)
+    meta_path = os.path.join(path, 'meta.json')
+    if os.path.exists(meta_path):
+        os.remove(meta_path)
+    source = TRACE_SOURCE_ISS
+    records = 0
+    # New files replace the old ones, so arrays still mapping a stale entry stay valid
+    files = {name: open(os.path.join(path, name + '.tmp'), 'wb') for name in TRACE_DTYPE.names}
+
+    def flush(rows: List[Tuple[int, ...]]):
+        chunk = np.array(rows, dtype=TRACE_DTYPE)
+        for name, column in files.items():
+            chunk[name].tofile(column)
+
+    try:
+        with open(input_file, 'r') as f:
+            rows: List[Tuple[int, ...]] = []
+            for row, source in _iter_text(_text_lines(f)):
+                rows.append(row)
+                if len(rows) == CHUNK_RECORDS:
+                    flush(rows)
+                    records += len(rows)
+                    rows = []
+            flush(rows)
+            records += len(rows)
+    except BaseException:
+        for name, column in files.items():
+            column.close()
+            os.remove(os.path.join(path, name + '.tmp'))
+        raise
+    for column in files.values():
+        column.close()
+    for name in TRACE_DTYPE.names:
+        os.replace(os.path.join(path, name + '.tmp'), os.path.join(path, name))
+    meta.update(source=source, records=records)
+    # The metadata is written last, so an interrupted parse leaves no valid entry
+    with open(meta_path + '.tmp', 'w') as f:
+        json.dump(meta, f, indent=2)
+    os.replace(meta_path + '.tmp', meta_path)
+    return meta
+
+
+def load_columns(input_file: str, cache_dir: Optional[str] = None) -> Tuple[Dict[str, np.ndarray], int]:
+    """Load any trace as ({TRACE_DTYPE field: 1-D array}, source).
+
+    A binary trace is returned as views of its memory map. A text trace is
+    parsed into the cache on first use; the entry is reused while the trace
+    keeps its size and mtime, or else while its SHA-256 still matches.
+    """
+    if is_binary_trace(input_file):
+        _, source = read_header(input_file)
+        records = read_trace(input_file)
+        return {name: records[name] for name in TRACE_DTYPE.names}, source
+
+    path = _cache_path(input_file, cache_dir)
+    meta_path = os.path.join(path, 'meta.json')
+    stat = os.stat(input_file)
+    meta = None
+    if os.path.exists(meta_path):
+        with open(meta_path, 'r') as f:
+            meta = json.load(f)
+        if meta.get('version') != CACHE_VERSION or meta.get('size') != stat.st_size:
+            meta = None
+        elif meta.get('mtime_ns') != stat.st_mtime_ns:
+            # Touched but maybe not changed: the content hash decides
+            if meta.get('sha256') == _file_digest(input_file):
+                meta['mtime_ns'] = stat.st_mtime_ns
+                with open(meta_path, 'w') as f:
+                    json.dump(meta, f, indent=2)
+            else:
+                meta = None
+    if meta is None:
+        meta = _write_columns(input_file, path, {
+            'version': CACHE_VERSION,
+            'trace': os.path.abspath(input_file),
+            'size': stat.st_size,
+            'mtime_ns': stat.st_mtime_ns,
+            'sha256': _file_digest(input_file),
+        })
+    return _open_columns(path, meta), meta['source']
+
+
+def iter_records(input_file: str, chunk_records: int = CHUNK_RECORDS) -> Iterator[Tuple[int, ...]]:
+    """Stream (cycle, pc, instr, kind, rd, value, addr) tuples from any trace.
+
+    The columns (see load_columns) are walked chunk_records at a time, so
+    memory stays bounded for any length. A text trace whose directory is not
+    writable is parsed line by line instead.
+    """
+    try:
+        columns, _ = load_columns(input_file)
+    except PermissionError:
+        with open(input_file, 'r') as f:
+            for row, _ in _iter_text(_text_lines(f)):
+                yield row
+        return
+    fields = [columns[name] for name in TRACE_DTYPE.names]
+    for start in range(0, len(fields[0]), chunk_records):
+        yield from zip(*(field[start:start + chunk_records].tolist() for field in fields))
+
+
+def pretty(input_file: str, output=None) -> int:
+    """Write any trace as text with mnemonics to the output stream (default stdout)"""
+    output = output or sys.stdout
+    records, source = load_any(input_file)
+    count = 0
+    for line in format_records(records, source):
+        output.write(line + '\n')
+        count += 1
+    return count
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Convert execution traces between the text and binary formats',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog='''
+Examples:
+  %(prog)s to-binary work/asm.basic_alu_r/iss.log iss.bin
+  %(prog)s to-text iss.bin iss.log
+  %(prog)s info iss.bin
+  %(prog)s pretty work/asm.basic_alu_r/iss.log | less
+        '''
+    )
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    for name, help_text in (('to-binary', 'Convert an iss.log/rtl.log text trace to binary'),
+                            ('to-text', 'Convert a binary trace to its text layout')):
+        sub = subparsers.add_parser(name, help=help_text)
+        sub.add_argument('input', metavar='INPUT_FILE')
+        sub.add_argument('output', metavar='OUTPUT_FILE')
+
+    pretty_parser = subparsers.add_parser(
+        'pretty', help='Print a raw, text or binary trace with mnemonics rendered')
+    pretty_parser.add_argument('input', metavar='INPUT_FILE')
+    pretty_parser.add_argument('-o', '--output', default=None, metavar='OUTPUT_FILE',
+                               help='Write to a file instead of stdout')
+
+    info = subparsers.add_parser('info', help='Print the header and record count of a binary trace')
+    info.add_argument('input', metavar='INPUT_FILE')
+
+    args = parser.parse_args()
+
+    try:
+        if args.command == 'to-binary':
+            count = to_binary(args.input, args.output)
+            print(f"Wrote {count} records to {args.output}")
+        elif args.command == 'to-text':
+            count = to_text(args.input, args.output)
+            print(f"Wrote {count} lines to {args.output}")
+        elif args.command == 'pretty':
+            if args.output:
+                with open(args.output, 'w') as f:
+                    pretty(args.input, f)
+            else:
+                pretty(args.input)
+        else:
+            version, source = read_header(args.input)
+            records = read_trace(args.input)
+            print(f"{args.input}: version {version}, source {SOURCE_NAMES.get(source, source)}, "
+                  f"{len(records)} records of {TRACE_DTYPE.itemsize} bytes")
+    except BrokenPipeError:
+        # Output piped into head/less that exited early
+        sys.stderr.close()
+    except (OSError, ValueError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()